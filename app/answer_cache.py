@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List, Optional
+
+from app.cache import LRUCache, history_key, normalize_question
+from app.vector_backends import NumpyBackend
+from app.vectordb import VectorStore
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_MAX_ITEMS = int(os.getenv("ANSWER_CACHE_MAX_ITEMS", "1000"))
+ANSWER_CACHE_TTL_SEC = float(os.getenv("ANSWER_CACHE_TTL_SEC", str(24 * 3600)))
+# ekkora koszinusz-hasonlóság felett a kérdést azonosnak tekintjük egy korábbival
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+
+@dataclass
+class CachedAnswer:
+    key: str
+    question: str
+    answer: str
+    contexts: List[Dict]
+    doc_ids: List[str]
+    created_at: float = field(default_factory=time.time)
+    match: str = "exact"          # exact | semantic
+    similarity: float = 1.0
+
+
+class AnswerCache:
+    """
+    Válasz cache az answer_question és a /chat_stream előtt.
+    Találat: azonos normalizált kérdés (ugyanazzal az előzménnyel), vagy
+    a korábbi kérdések embeddingjei közül egy, ami legalább `similarity`
+    mértékben hasonló. A variant a válasz előállításának módja (a reranker
+    neve): más rerankerrel más kontextus és válasz születhet, így a bejegyzés
+    csak azonos variantra talál. Az overlap/spekuláció nem része a kulcsnak,
+    mert a válaszon nem változtat (tévedésnél a rerankelt kontextusból generálunk). Ha egy bejegyzés kontextusa mögötti dokumentumot
+    újraindexelik, a bejegyzés törlődik.
+    """
+
+    def __init__(
+            self,
+            store: VectorStore,
+            max_items: int = ANSWER_CACHE_MAX_ITEMS,
+            ttl_sec: float = ANSWER_CACHE_TTL_SEC,
+            similarity: float = ANSWER_CACHE_SIMILARITY,
+    ):
+        self.store = store
+        self.similarity = similarity
+        self._lock = threading.RLock()
+        self._entries = LRUCache(max_items=max_items, ttl_sec=ttl_sec, on_evict=self._on_evict)
+        # a kérdések embeddingjei a szemantikus kereséshez; payloadban az előzmény kulcsa
+        self._index = NumpyBackend(store.dim)
+        self._by_doc: Dict[str, set] = {}
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        store.add_listener(self._on_documents_changed)
+
+    @staticmethod
+    def _key(question: str, history: Optional[List[Dict]], variant: str = "") -> str:
+        return f"{variant}:{history_key(history)}:{normalize_question(question)}"
+
+    def lookup(
+            self,
+            question: str,
+            history: Optional[List[Dict]] = None,
+            question_vec: Optional[List[float]] = None,
+            variant: str = "",
+    ) -> Optional[CachedAnswer]:
+        key = self._key(question, history, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.exact_hits += 1
+                return replace(entry, match="exact", similarity=1.0)
+            has_entries = self._index.count() > 0
+
+        if has_entries:
+            # az embedding hívás a zároláson kívül fut
+            if question_vec is None:
+                [question_vec] = self.store.embed([question])
+            hkey = history_key(history)
+
+            with self._lock:
+                for point in self._index.search(question_vec, top_k=5):
+                    if point.score < self.similarity:
+                        break
+                    if point.payload["history_key"] != hkey or point.payload.get("variant", "") != variant:
+                        continue
+                    entry = self._entries.get(point.id)
+                    if entry is None:
+                        # lejárt bejegyzés: a get már kivette a szemantikus indexből is (_on_evict)
+                        continue
+                    self.semantic_hits += 1
+                    return replace(entry, match="semantic", similarity=point.score)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(
+            self,
+            question: str,
+            history: Optional[List[Dict]],
+            answer: str,
+            contexts: List[Dict],
+            question_vec: Optional[List[float]] = None,
+            variant: str = "",
+    ) -> None:
+        # kontextus nélküli ("nem találtam") válasz nem kerül cache-be
+        if not contexts:
+            return
+
+        key = self._key(question, history, variant)
+        doc_ids = sorted({c["doc_id"] for c in contexts if c.get("doc_id")})
+        if question_vec is None:
+            [question_vec] = self.store.embed([question])
+
+        entry = CachedAnswer(key=key, question=question, answer=answer, contexts=contexts, doc_ids=doc_ids)
+        with self._lock:
+            self._entries.set(key, entry)
+            self._index.upsert([key], [question_vec], [{"history_key": history_key(history), "variant": variant}])
+            for doc_id in doc_ids:
+                self._by_doc.setdefault(doc_id, set()).add(key)
+
+    def invalidate_documents(self, doc_ids: List[str]) -> int:
+        removed = 0
+        with self._lock:
+            for doc_id in doc_ids:
+                for key in self._by_doc.pop(doc_id, set()):
+                    if self._entries.pop(key) is not None:
+                        removed += 1
+                    self._index.delete([key])
+        return removed
+
+    def _on_documents_changed(self, doc_id: str, point_ids: List[str]) -> None:
+        self.invalidate_documents([doc_id])
+
+    def _on_evict(self, key: str, entry: CachedAnswer) -> None:
+        with self._lock:
+            self._index.delete([key])
+            for doc_id in entry.doc_ids:
+                keys = self._by_doc.get(doc_id)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._by_doc[doc_id]
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.exact_hits + self.semantic_hits
+        total = hits + self.misses
+        return {
+            "size": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+
+def replay_stream(answer: str) -> List[str]:
+    """A cache-elt választ szavanként visszajátszható darabokra bontja (a szóközöket megtartva)."""
+    return re.findall(r"\S+\s*|\s+", answer)
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from app.prompting import HISTORY_TURNS
+
+_MISSING = object()
+
+
+def normalize_question(question: str) -> str:
+    q = " ".join(question.casefold().split())
+    return re.sub(r"[\s?!.,;:]+$", "", q)
+
+
+def history_key(history: Optional[List[Dict]]) -> str:
+    """Az előzmény kulcsa: csak a promptba kerülő utolsó HISTORY_TURNS üzenet számít."""
+    if not history:
+        return ""
+    recent = [(h["role"], h["content"]) for h in history[-HISTORY_TURNS:]]
+    return hashlib.sha1(json.dumps(recent, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """
+    Szálbiztos, méretkorlátos LRU cache opcionális lejárati idővel (TTL).
+    """
+
+    def __init__(
+            self,
+            max_items: int = 1024,
+            ttl_sec: Optional[float] = None,
+            on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.max_items = max_items
+        self.ttl_sec = ttl_sec
+        # kapacitás miatti kiszorításkor és lejáratkor hívódik (pl. másodlagos indexek takarításához)
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+
+            stored_at, value = item
+            if self.ttl_sec is not None and time.time() - stored_at > self.ttl_sec:
+                del self._data[key]
+                self.misses += 1
+                self.expired += 1
+                if self.on_evict is not None:
+                    self.on_evict(key, value)
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                old_key, (_, old_value) = self._data.popitem(last=False)
+                self.evictions += 1
+                if self.on_evict is not None:
+                    self.on_evict(old_key, old_value)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+            return default if item is _MISSING else item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_items": self.max_items,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.embeddings import aembed_texts
+
+EMBED_BATCHER_ENABLED = os.getenv("EMBED_BATCHER_ENABLED", "1") == "1"
+# ennyi ideig gyűjtjük az egyszerre érkező kérdéseket egy embedding hívásba...
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+# ...vagy amíg össze nem gyűlik ennyi
+EMBED_BATCH_WINDOW_ITEMS = int(os.getenv("EMBED_BATCH_WINDOW_ITEMS", "64"))
+# a késleltetési percentilisek ennyi legutóbbi kérésből számolódnak
+METRICS_WINDOW = 1000
+
+
+class QueryEmbeddingBatcher:
+    """
+    Az egyidejű, egy-egy kérdést embeddelő hívásokat egy rövid ablakon belül
+    összegyűjti, és egyetlen kötegelt embedding hívással szolgálja ki.
+    Minden hívó a saját vektorát kapja vissza. Az event loopon belül fut.
+    """
+
+    def __init__(
+            self,
+            dimensions: Optional[int] = None,
+            window_ms: float = EMBED_BATCH_WINDOW_MS,
+            max_items: int = EMBED_BATCH_WINDOW_ITEMS,
+    ):
+        self.dimensions = dimensions
+        self.window_sec = window_ms / 1000.0
+        self.max_items = max_items
+        self._pending: List[Tuple[str, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._inflight_batches = 0
+
+        self.batches = 0
+        self.items = 0
+        self.max_batch_size = 0
+        self.max_queue_depth = 0
+        self._latencies: Deque[float] = deque(maxlen=METRICS_WINDOW)
+        self._batch_sizes: Deque[int] = deque(maxlen=METRICS_WINDOW)
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        self.max_queue_depth = max(self.max_queue_depth, len(self._pending))
+
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_sec, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future, float]]) -> None:
+        self._inflight_batches += 1
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            vectors = await aembed_texts(texts, dimensions=self.dimensions)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._inflight_batches -= 1
+
+        by_text = dict(zip(texts, vectors))
+        now = time.perf_counter()
+        for text, future, enqueued_at in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+            self._latencies.append(now - enqueued_at)
+
+        self.batches += 1
+        self.items += len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        self._batch_sizes.append(len(batch))
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = np.asarray(self._latencies, dtype=np.float64)
+        sizes = np.asarray(self._batch_sizes, dtype=np.float64)
+        return {
+            "window_ms": self.window_sec * 1000.0,
+            "max_items": self.max_items,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": float(sizes.mean()) if len(sizes) else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "queue_depth": len(self._pending),
+            "max_queue_depth": self.max_queue_depth,
+            "inflight_batches": self._inflight_batches,
+            "latency_p50_ms": float(np.percentile(latencies, 50) * 1000) if len(latencies) else 0.0,
+            "latency_p95_ms": float(np.percentile(latencies, 95) * 1000) if len(latencies) else 0.0,
+            "latency_p99_ms": float(np.percentile(latencies, 99) * 1000) if len(latencies) else 0.0,
+        }
+
+
+# dimenziónként (modellbeállításonként) egy batcher
+_batchers: Dict[Optional[int], QueryEmbeddingBatcher] = {}
+
+
+def get_query_batcher(dimensions: Optional[int] = None) -> Optional[QueryEmbeddingBatcher]:
+    if not EMBED_BATCHER_ENABLED:
+        return None
+    batcher = _batchers.get(dimensions)
+    if batcher is None:
+        batcher = _batchers[dimensions] = QueryEmbeddingBatcher(dimensions)
+    return batcher
+
+
+def batcher_stats() -> Dict[str, Any]:
+    return {str(dim or "default"): b.stats() for dim, b in _batchers.items()}
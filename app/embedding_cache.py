@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.cache import LRUCache
+
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "1") == "1"
+EMBED_CACHE_PATH = Path(os.getenv("EMBED_CACHE_PATH", "data/cache/embeddings.sqlite"))
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+EMBED_CACHE_MEMORY_ITEMS = int(os.getenv("EMBED_CACHE_MEMORY_ITEMS", "5000"))
+
+# a tárolt vektorok formátuma (PRAGMA user_version); a korábbi float32 bejegyzések eldobódnak
+_SCHEMA_VERSION = 1
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    # float64: a cache-ből visszaadott vektor bitre azonos a frissen kapottal
+    return array("d", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    vec = array("d")
+    vec.frombytes(blob)
+    return vec.tolist()
+
+
+class EmbeddingCache:
+    """
+    Kétszintű embedding cache: memóriában tartott LRU réteg egy lemezen
+    tárolt SQLite tábla előtt. A kulcs a (modell, szöveg hash) pár.
+    """
+
+    def __init__(
+            self,
+            path: Path = EMBED_CACHE_PATH,
+            max_entries: int = EMBED_CACHE_MAX_ENTRIES,
+            memory_items: int = EMBED_CACHE_MEMORY_ITEMS,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory = LRUCache(max_items=memory_items)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        (version,) = self._conn.execute("PRAGMA user_version").fetchone()
+        if version < _SCHEMA_VERSION:
+            # a régi (float32) vektorok másképp térnének vissza, mint a friss API válasz
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        self._conn.commit()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        keys = [cache_key(model, t) for t in texts]
+        results: List[Optional[List[float]]] = [self.memory.get(k) for k in keys]
+
+        missing = list({k for k, r in zip(keys, results) if r is None})
+        if missing:
+            found: Dict[str, List[float]] = {}
+            with self._lock:
+                now = time.time()
+                # SQLite paraméterkorlát miatt darabokban kérdezünk le
+                for i in range(0, len(missing), 500):
+                    part = missing[i:i + 500]
+                    marks = ",".join("?" * len(part))
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part
+                    ).fetchall()
+                    for key, blob in rows:
+                        found[key] = _unpack(blob)
+                    if rows:
+                        self._conn.execute(
+                            f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})", [now, *part]
+                        )
+                self._conn.commit()
+
+            for key, vec in found.items():
+                self.memory.set(key, vec)
+            results = [r if r is not None else found.get(k) for k, r in zip(keys, results)]
+
+        hit_count = sum(1 for r in results if r is not None)
+        with self._lock:
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        now = time.time()
+        rows = []
+        for text, vec in zip(texts, vectors):
+            key = cache_key(model, text)
+            self.memory.set(key, list(vec))
+            rows.append((key, model, _pack(vec), now))
+
+        if not rows:
+            return
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count <= self.max_entries:
+            return
+        # a legrégebben használt bejegyzések törlése a limit 90%-áig,
+        # hogy ne kelljen minden beszúrásnál újra takarítani
+        to_delete = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            """
+            DELETE FROM embeddings WHERE key IN (
+                SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?
+            )
+            """,
+            (to_delete,),
+        )
+
+    def clear(self) -> None:
+        self.memory.clear()
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (disk_entries,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "disk_entries": disk_entries,
+            "max_entries": self.max_entries,
+            "memory": self.memory.stats(),
+        }
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    global _cache
+    if not EMBED_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
@@ -1,16 +1,182 @@
-import os
-from typing import List
-
-from app.openai_client import client
-
-def embed_texts(texts: List[str], model: str = "text-embedding-3-small") -> List[List[float]]:
-    if not texts:
-        return []
-    
-    response = client.embeddings.create(
-        model=model,
-        input=texts,
-    )
-
-    vectors: List[List[float]] = [item.embedding for item in response.data]
-    return vectors
\ No newline at end of file
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from app.openai_client import async_client, client
+from app.embedding_cache import get_embedding_cache
+from app.tracing import bind, traced
+
+# egy embeddings.create hívás korlátai (az API limitjei alatt maradva)
+EMBED_BATCH_MAX_ITEMS = int(os.getenv("EMBED_BATCH_MAX_ITEMS", "256"))
+EMBED_BATCH_MAX_TOKENS = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "100000"))
+# egyszerre futó embedding kérések száma
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "4"))
+# a text-embedding-3-small alapértelmezett vektorhossza
+DEFAULT_EMBED_DIM = 1536
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=EMBED_MAX_WORKERS, thread_name_prefix="embed")
+        return _executor
+
+def estimate_tokens(text: str) -> int:
+    # óvatos becslés: magyar szövegnél kb. 3 karakter / token
+    return len(text) // 3 + 1
+
+def make_batches(
+        texts: List[str],
+        max_items: int = EMBED_BATCH_MAX_ITEMS,
+        max_tokens: int = EMBED_BATCH_MAX_TOKENS,
+) -> List[List[int]]:
+    """
+    A bemenetet indexlistákra bontja úgy, hogy egy batch se lépje túl
+    sem az elemszám-, sem a tokenkeretet. A sorrend megmarad.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+@traced("embed_texts")
+def embed_texts(
+        texts: List[str],
+        model: str = "text-embedding-3-small",
+        use_cache: bool = True,
+        dimensions: Optional[int] = None,
+) -> List[List[float]]:
+    """
+    dimensions: a text-embedding-3 modellektől kért (csökkentett) vektorhossz,
+    None esetén a modell alapértelmezése.
+    """
+    if not texts:
+        return []
+
+    cache = get_embedding_cache() if use_cache else None
+    if cache is None:
+        return _embed_uncached(texts, model, dimensions)
+
+    cache_model = _cache_model(model, dimensions)
+    vectors: List[Optional[List[float]]] = cache.get_many(cache_model, texts)
+
+    # csak a cache-ben nem szereplő (egyedi) szövegek mennek az API-hoz
+    missing_texts = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+    if missing_texts:
+        new_vectors = _embed_uncached(missing_texts, model, dimensions)
+        cache.put_many(cache_model, missing_texts, new_vectors)
+        by_text = dict(zip(missing_texts, new_vectors))
+        vectors = [v if v is not None else by_text[t] for t, v in zip(texts, vectors)]
+
+    return vectors
+
+@traced("embed_texts")
+async def aembed_texts(
+        texts: List[str],
+        model: str = "text-embedding-3-small",
+        use_cache: bool = True,
+        dimensions: Optional[int] = None,
+) -> List[List[float]]:
+    """
+    Az embed_texts aszinkron változata: a batchek AsyncOpenAI hívásokként
+    futnak párhuzamosan, a SQLite cache elérése szálra kerül.
+    """
+    if not texts:
+        return []
+
+    cache = get_embedding_cache() if use_cache else None
+    if cache is None:
+        return await _aembed_uncached(texts, model, dimensions)
+
+    cache_model = _cache_model(model, dimensions)
+    vectors: List[Optional[List[float]]] = await asyncio.to_thread(cache.get_many, cache_model, texts)
+
+    missing_texts = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+    if missing_texts:
+        new_vectors = await _aembed_uncached(missing_texts, model, dimensions)
+        await asyncio.to_thread(cache.put_many, cache_model, missing_texts, new_vectors)
+        by_text = dict(zip(missing_texts, new_vectors))
+        vectors = [v if v is not None else by_text[t] for t, v in zip(texts, vectors)]
+
+    return vectors
+
+def _cache_model(model: str, dimensions: Optional[int]) -> str:
+    # a csökkentett dimenziójú vektorok külön cache kulcsot kapnak
+    return model if dimensions is None else f"{model}@{dimensions}"
+
+def _embed_uncached(texts: List[str], model: str, dimensions: Optional[int] = None) -> List[List[float]]:
+    batches = make_batches(texts)
+    if len(batches) == 1:
+        return _embed_batch(texts, model, dimensions)
+
+    # a batchek párhuzamosan futnak, az eredmény a bemenet sorrendjében áll össze
+    executor = _get_executor()
+    futures = [
+        executor.submit(bind(_embed_batch, [texts[i] for i in batch], model, dimensions))
+        for batch in batches
+    ]
+
+    vectors: List[List[float]] = [None] * len(texts)  # type: ignore[list-item]
+    for batch, future in zip(batches, futures):
+        for i, vec in zip(batch, future.result()):
+            vectors[i] = vec
+    return vectors
+
+async def _aembed_uncached(texts: List[str], model: str, dimensions: Optional[int] = None) -> List[List[float]]:
+    batches = make_batches(texts)
+    # egyszerre legfeljebb EMBED_MAX_WORKERS kérés fut, mint a szálas változatban
+    semaphore = asyncio.Semaphore(EMBED_MAX_WORKERS)
+
+    async def run(batch: List[int]) -> List[List[float]]:
+        async with semaphore:
+            return await _aembed_batch([texts[i] for i in batch], model, dimensions)
+
+    results = await asyncio.gather(*(run(batch) for batch in batches))
+
+    vectors: List[List[float]] = [None] * len(texts)  # type: ignore[list-item]
+    for batch, batch_vectors in zip(batches, results):
+        for i, vec in zip(batch, batch_vectors):
+            vectors[i] = vec
+    return vectors
+
+@traced("embed_api")
+async def _aembed_batch(texts: List[str], model: str, dimensions: Optional[int] = None) -> List[List[float]]:
+    extra = {"dimensions": dimensions} if dimensions is not None else {}
+    response = await async_client.embeddings.create(
+        model=model,
+        input=texts,
+        **extra,
+    )
+
+    data = sorted(response.data, key=lambda item: item.index)
+    return [item.embedding for item in data]
+
+@traced("embed_api")
+def _embed_batch(texts: List[str], model: str, dimensions: Optional[int] = None) -> List[List[float]]:
+    extra = {"dimensions": dimensions} if dimensions is not None else {}
+    response = client.embeddings.create(
+        model=model,
+        input=texts,
+        **extra,
+    )
+
+    data = sorted(response.data, key=lambda item: item.index)
+    vectors: List[List[float]] = [item.embedding for item in data]
+    return vectors
@@ -1,53 +1,200 @@
-from pathlib import Path
-from typing import List, Dict
-
-def load_text_from_file(path: Path) -> str:
-    suffix = path.suffix.lower()
-    if suffix == ".txt":
-        return path.read_text(encoding="utf-8", errors="ignore")
-    elif suffix == ".pdf":
-        import fitz
-        doc = fitz.open(path)
-        pages = [page.get_text() for page in doc]
-        return "\n".join(pages)
-    else:
-        raise ValueError(f"Nem támogatott fájltípus: {suffix}")
-    
-def simple_word_chunk(text: str, chunk_size: int = 500, overlap: int = 100) -> List[Dict]:
-    words = text.split()
-    chunks: List[Dict] = []
-
-    start = 0
-    idx = 0
-    while start < len(words):
-        end = min(len(words), start + chunk_size)
-        chunk_words = words[start:end]
-        chunk_text = " ".join(chunk_words)
-
-        chunks.append(
-            {
-                "id": idx,
-                "text": chunk_text,
-            }
-        )
-
-        idx += 1
-        if end == len(words):
-            break
-
-        start = max(0, end - overlap)
-
-    return chunks
-
-def process_document(
-        path: Path,
-        chunk_size: int =  500,
-        overlap: int = 100,
-) -> List[Dict]:
-    text = load_text_from_file(path)
-    chunks = simple_word_chunk(text, chunk_size=chunk_size, overlap=overlap)
-
-    for c in chunks:
-        c["source_file"] = path.name
-
-    return chunks
\ No newline at end of file
+from pathlib import Path
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+# .txt fájloknál ekkora szövegblokkokat olvasunk be egyszerre
+TEXT_BLOCK_CHARS = 64 * 1024
+
+def iter_pages(path: Path) -> Iterator[Tuple[int, str]]:
+    """
+    Oldalanként adja vissza a dokumentum szövegét (oldalszám 1-től).
+    PDF-nél egyszerre csak egy oldal van a memóriában, TXT-nél
+    sorhatáron vágott blokkok jönnek, mind az 1. oldalhoz rendelve.
+    """
+    suffix = path.suffix.lower()
+    if suffix == ".txt":
+        with path.open("r", encoding="utf-8", errors="ignore") as f:
+            block: List[str] = []
+            size = 0
+            for line in f:
+                block.append(line)
+                size += len(line)
+                if size >= TEXT_BLOCK_CHARS:
+                    yield 1, "".join(block)
+                    block = []
+                    size = 0
+            if block:
+                yield 1, "".join(block)
+    elif suffix == ".pdf":
+        import fitz
+        with fitz.open(path) as doc:
+            for page_no, page in enumerate(doc, start=1):
+                yield page_no, page.get_text()
+    else:
+        raise ValueError(f"Nem támogatott fájltípus: {suffix}")
+
+def load_text_from_file(path: Path) -> str:
+    suffix = path.suffix.lower()
+    if suffix == ".txt":
+        return path.read_text(encoding="utf-8", errors="ignore")
+    elif suffix == ".pdf":
+        return "\n".join(text for _, text in iter_pages(path))
+    else:
+        raise ValueError(f"Nem támogatott fájltípus: {suffix}")
+
+def simple_word_chunk(text: str, chunk_size: int = 500, overlap: int = 100) -> List[Dict]:
+    words = text.split()
+    chunks: List[Dict] = []
+
+    start = 0
+    idx = 0
+    while start < len(words):
+        end = min(len(words), start + chunk_size)
+        chunk_words = words[start:end]
+        chunk_text = " ".join(chunk_words)
+
+        chunks.append(
+            {
+                "id": idx,
+                "text": chunk_text,
+            }
+        )
+
+        idx += 1
+        if end == len(words):
+            break
+
+        start = max(0, end - overlap)
+
+    return chunks
+
+# a str.split() által szóközként kezelt karakterek táblája; U+3000 felett nincs
+# ilyen, ezért a tábla utolsó (hamis) eleme fedi le a nagyobb kódpontokat
+_IS_SPACE = np.array([chr(i).isspace() for i in range(0x3002)], dtype=bool)
+
+def word_boundaries(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Egyetlen vektorizált menetben megkeresi az összes szó kezdő és
+    (kizárólagos) záró karakterpozícióját. A szóhatárok azonosak
+    a str.split() által használtakkal.
+    """
+    codepoints = np.frombuffer(text.encode("utf-32-le", errors="surrogatepass"), dtype=np.uint32)
+    is_space = np.take(_IS_SPACE, codepoints, mode="clip")
+    is_word = ~is_space
+
+    # szó eleje: nem szóköz, és előtte szóköz (vagy a szöveg eleje)
+    start_mask = is_word.copy()
+    start_mask[1:] &= is_space[:-1]
+    # szó utolsó karaktere: nem szóköz, és utána szóköz (vagy a szöveg vége)
+    end_mask = is_word
+    end_mask[:-1] &= is_space[1:]
+
+    return np.flatnonzero(start_mask), np.flatnonzero(end_mask) + 1
+
+def span_word_chunk(
+        text: str,
+        chunk_size: int = 500,
+        overlap: int = 100,
+        boundaries: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> List[Tuple[int, int]]:
+    """
+    Ugyanazokat a chunkhatárokat adja, mint a simple_word_chunk, de szövegek
+    helyett (start_char, end_char) tartományokat ad vissza a forrásszövegbe.
+    A word_boundaries eredménye átadható, így több konfiguráció is
+    újrahasznosíthatja ugyanazt a szóhatár-tömböt.
+    """
+    if overlap >= chunk_size:
+        raise ValueError("Az átfedésnek kisebbnek kell lennie a chunk méreténél.")
+
+    starts, ends = boundaries if boundaries is not None else word_boundaries(text)
+    n_words = len(starts)
+    if n_words == 0:
+        return []
+
+    step = chunk_size - overlap
+    n_chunks = 1 if n_words <= chunk_size else 1 + -(-(n_words - chunk_size) // step)
+
+    first_words = np.arange(n_chunks, dtype=np.int64) * step
+    last_words = np.minimum(first_words + chunk_size, n_words) - 1
+    return list(zip(starts[first_words].tolist(), ends[last_words].tolist()))
+
+def chunks_from_spans(
+        text: str,
+        spans: Iterable[Tuple[int, int]],
+        normalize_whitespace: bool = False,
+) -> Iterator[Dict]:
+    """
+    A tartományokból csak akkor készít szöveget, amikor a chunkra szükség van.
+    normalize_whitespace=True esetén a szöveg betűre megegyezik
+    a simple_word_chunk kimenetével.
+    """
+    for idx, (start, end) in enumerate(spans):
+        chunk_text = text[start:end]
+        if normalize_whitespace:
+            chunk_text = " ".join(chunk_text.split())
+        yield {
+            "id": idx,
+            "text": chunk_text,
+            "start_char": start,
+            "end_char": end,
+        }
+
+def iter_word_chunks(
+        pages: Iterable[Tuple[int, str]],
+        chunk_size: int = 500,
+        overlap: int = 100,
+) -> Iterator[Dict]:
+    """
+    A simple_word_chunk lusta változata: oldalanként olvassa a szöveget, és
+    amint megtelt egy ablak, kiadja a chunkot. Az átfedés oldalhatáron is
+    átível. A chunkhatárok megegyeznek a simple_word_chunk eredményével.
+    """
+    if overlap >= chunk_size:
+        raise ValueError("Az átfedésnek kisebbnek kell lennie a chunk méreténél.")
+    step = chunk_size - overlap
+
+    words: List[str] = []
+    word_pages: List[int] = []
+    new_words = 0  # még egyik kiadott chunkban sem szereplő szavak száma
+    idx = 0
+
+    def make_chunk() -> Dict:
+        return {
+            "id": idx,
+            "text": " ".join(words[:chunk_size]),
+            "page_start": word_pages[0],
+            "page_end": word_pages[min(chunk_size, len(words)) - 1],
+        }
+
+    for page_no, text in pages:
+        for word in text.split():
+            words.append(word)
+            word_pages.append(page_no)
+            new_words += 1
+
+            if len(words) == chunk_size:
+                yield make_chunk()
+                idx += 1
+                del words[:step]
+                del word_pages[:step]
+                new_words = 0
+
+    if new_words > 0:
+        yield make_chunk()
+
+def iter_document_chunks(
+        path: Path,
+        chunk_size: int = 500,
+        overlap: int = 100,
+) -> Iterator[Dict]:
+    for c in iter_word_chunks(iter_pages(path), chunk_size=chunk_size, overlap=overlap):
+        c["source_file"] = path.name
+        yield c
+
+def process_document(
+        path: Path,
+        chunk_size: int =  500,
+        overlap: int = 100,
+) -> List[Dict]:
+    return list(iter_document_chunks(path, chunk_size=chunk_size, overlap=overlap))
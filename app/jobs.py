@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from uuid import uuid4
+
+from app.ingestion import iter_document_chunks
+from app.vectordb import VectorStore, file_hash
+
+# ennyi chunk kerül egyszerre embeddingre és a vektortárba
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "2"))
+# ennyi befejezett feladat állapotát őrizzük meg lekérdezésre
+JOB_HISTORY_LIMIT = int(os.getenv("JOB_HISTORY_LIMIT", "200"))
+
+
+@dataclass
+class IngestJob:
+    id: str
+    filename: str
+    status: str = "queued"      # queued | running | done | failed
+    stage: str = "queued"       # queued | extract | chunk | embed | upsert | cleanup | done
+    chunks_total: Optional[int] = None   # a teljes szám csak a feldolgozás végén ismert
+    chunks_processed: int = 0
+    batches_done: int = 0
+    chunks_added: int = 0
+    chunks_unchanged: int = 0
+    chunks_deleted: int = 0
+    skipped: bool = False       # a fájl nem változott a legutóbbi indexelés óta
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "chunks_total": self.chunks_total,
+            "chunks_processed": self.chunks_processed,
+            "batches_done": self.batches_done,
+            "chunks_added": self.chunks_added,
+            "chunks_unchanged": self.chunks_unchanged,
+            "chunks_deleted": self.chunks_deleted,
+            "skipped": self.skipped,
+            "elapsed_sec": elapsed,
+            "chunks_per_sec": self.chunks_processed / elapsed if elapsed > 0 else 0.0,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Háttérben futó indexelési feladatok: kinyerés -> chunkolás -> embedding ->
+    upsert, korlátos méretű batchekben. Minden batch után azonnal kereshető
+    a vektortárban a már feldolgozott rész.
+    """
+
+    def __init__(
+            self,
+            store: VectorStore,
+            batch_size: int = INGEST_BATCH_SIZE,
+            max_workers: int = INGEST_MAX_WORKERS,
+            on_batch_indexed: Optional[Callable[[IngestJob], None]] = None,
+            on_job_done: Optional[Callable[[IngestJob], None]] = None,
+    ):
+        self.store = store
+        self.batch_size = batch_size
+        self.on_batch_indexed = on_batch_indexed
+        self.on_job_done = on_job_done
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, path: Path, job_id: Optional[str] = None) -> IngestJob:
+        """job_id: ha egy másik worker már kiosztotta (közös indexnél), ezt az azonosítót kapja a feladat."""
+        job = IngestJob(id=job_id or str(uuid4()), filename=path.name)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune_locked()
+        self._executor.submit(self._run, job, path)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[IngestJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def _prune_locked(self) -> None:
+        finished = [jid for jid, j in self._jobs.items() if j.status in ("done", "failed")]
+        while len(self._jobs) > JOB_HISTORY_LIMIT and finished:
+            del self._jobs[finished.pop(0)]
+
+    def _run(self, job: IngestJob, path: Path) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        sync = None
+        try:
+            sync = self.store.begin_document(path.name, file_hash(path))
+            if sync.unchanged:
+                job.skipped = True
+                job.chunks_total = len(sync.previous_points)
+                job.stage = "done"
+                job.status = "done"
+                return
+
+            # a dokumentumot oldalanként olvassuk, a chunkok lustán, batchenként készülnek
+            job.stage = "extract"
+            chunk_iter = iter_document_chunks(path)
+
+            while True:
+                job.stage = "chunk"
+                batch = list(islice(chunk_iter, self.batch_size))
+                if not batch:
+                    break
+
+                # csak az új vagy megváltozott chunkok mennek embeddingre
+                new_chunks = sync.diff(batch)
+
+                job.stage = "embed"
+                vectors = self.store.embed([c["text"] for c in new_chunks])
+
+                job.stage = "upsert"
+                sync.upsert(new_chunks, vectors)
+
+                job.chunks_processed += len(batch)
+                job.chunks_added = sync.stats["added"]
+                job.chunks_unchanged = sync.stats["unchanged"]
+                job.batches_done += 1
+                if self.on_batch_indexed is not None:
+                    self.on_batch_indexed(job)
+
+            if job.chunks_processed == 0:
+                raise ValueError("Nem sikerült szöveget kinyerni a dokumentumból.")
+
+            job.stage = "cleanup"
+            job.chunks_deleted = sync.finish()["deleted"]
+            job.chunks_total = job.chunks_processed
+
+            job.stage = "done"
+            job.status = "done"
+        except Exception as e:
+            if sync is not None:
+                # a félbemaradt dokumentum már beírt pontjai ne maradjanak a keresésben
+                sync.abort()
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+        # sikertelen feladatnál is: az abort megváltoztathatta a tár tartalmát
+        if self.on_job_done is not None:
+            self.on_job_done(job)
@@ -0,0 +1,491 @@
+from __future__ import annotations
+
+import bisect
+import gzip
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.monitoring import LOG_PATH, rotated_log_files
+
+# a monitoring dashboard indexelt adatbázisa (a logból inkrementálisan töltve)
+LOG_STORE_PATH = Path(os.getenv("LOG_STORE_PATH", "data/cache/monitoring.sqlite"))
+# az összesítések időablaka másodpercben
+ROLLUP_BUCKET_SEC = 60
+# a percenkénti latency/TTFT hisztogramok vödörhatárai másodpercben: ~10%-os lépésekkel 1 ms-tól
+# ~4 percig, így a belőlük becsült percentilis relatív hibája pár százalék
+ROLLUP_LATENCY_BUCKETS = tuple(round(0.001 * 1.1 ** i, 6) for i in range(130))
+# a fájl azonosításához eltárolt első sor hossza (rotáció után ez alapján találjuk meg)
+_HEAD_BYTES = 256
+
+_ROLLUPS_TABLE = """
+CREATE TABLE IF NOT EXISTS rollups (
+    bucket INTEGER NOT NULL,
+    endpoint TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    cost REAL NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    latency_sum REAL NOT NULL,
+    latency_p50 REAL,
+    latency_p95 REAL,
+    latency_p99 REAL,
+    ttft_count INTEGER NOT NULL,
+    ttft_p50 REAL,
+    ttft_p95 REAL,
+    ttft_p99 REAL,
+    -- vödrönkénti darabszámok (JSON lista, az utolsó a +Inf): ezekből összeadva
+    -- bármely percsorozat percentilisei számolhatók a nyers sorok olvasása nélkül
+    latency_hist TEXT NOT NULL,
+    ttft_hist TEXT NOT NULL,
+    PRIMARY KEY (bucket, endpoint)
+)
+"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    bucket INTEGER NOT NULL,
+    endpoint TEXT NOT NULL,
+    session_id TEXT,
+    question TEXT,
+    answer_len INTEGER,
+    context_len INTEGER,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    cost REAL,
+    total_latency REAL,
+    first_token_latency REAL,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_requests_ts ON requests(ts);
+CREATE INDEX IF NOT EXISTS idx_requests_endpoint_ts ON requests(endpoint, ts);
+CREATE INDEX IF NOT EXISTS idx_requests_session_ts ON requests(session_id, ts);
+""" + _ROLLUPS_TABLE + """;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS ingest_state (
+    log_path TEXT PRIMARY KEY,
+    inode INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    head BLOB NOT NULL
+);
+"""
+
+_BASE_FIELDS = {
+    "ts", "endpoint", "session_id", "question", "answer_len", "context_len", "input_tokens_est",
+    "output_tokens_est", "cost_estimate", "total_latency_sec", "first_token_latency_sec",
+}
+
+
+def _open(path: Path):
+    return gzip.open(path, "rb") if path.suffix == ".gz" else path.open("rb")
+
+
+def _head(path: Path) -> bytes:
+    try:
+        with _open(path) as f:
+            return f.readline()[:_HEAD_BYTES]
+    except (OSError, EOFError):
+        return b""
+
+
+def _percentiles(values: Sequence[float]) -> Tuple[Optional[float], ...]:
+    if not values:
+        return None, None, None
+    p50, p95, p99 = np.percentile(np.asarray(values, dtype=np.float64), [50, 95, 99])
+    return float(p50), float(p95), float(p99)
+
+
+def _histogram(values: Sequence[float]) -> List[int]:
+    counts = [0] * (len(ROLLUP_LATENCY_BUCKETS) + 1)
+    for v in values:
+        counts[bisect.bisect_left(ROLLUP_LATENCY_BUCKETS, v)] += 1
+    return counts
+
+
+def _hist_percentiles(counts: Sequence[int]) -> Tuple[Optional[float], ...]:
+    """p50/p95/p99 a vödrökből, vödrön belüli lineáris interpolációval (mint a histogram_quantile)."""
+    total = sum(counts)
+    if not total:
+        return None, None, None
+    result = []
+    for q in (0.50, 0.95, 0.99):
+        rank = q * total
+        cumulative = 0
+        for i, c in enumerate(counts):
+            if c and cumulative + c >= rank:
+                if i == len(ROLLUP_LATENCY_BUCKETS):
+                    # a +Inf vödörnek nincs felső határa: a legnagyobb véges határ
+                    result.append(ROLLUP_LATENCY_BUCKETS[-1])
+                else:
+                    lower = ROLLUP_LATENCY_BUCKETS[i - 1] if i else 0.0
+                    upper = ROLLUP_LATENCY_BUCKETS[i]
+                    result.append(lower + (upper - lower) * (rank - cumulative) / c)
+                break
+            cumulative += c
+    return tuple(result)
+
+
+def _merge(target: List[int], hist_json: str) -> None:
+    for i, c in enumerate(json.loads(hist_json)):
+        target[i] += c
+
+
+def _filters(
+        since: Optional[float],
+        until: Optional[float],
+        endpoints: Optional[Sequence[str]],
+        session_id: Optional[str],
+        time_column: str = "ts",
+        scale: float = 1.0,
+) -> Tuple[str, List[Any]]:
+    clauses: List[str] = []
+    params: List[Any] = []
+    if since is not None:
+        clauses.append(f"{time_column} >= ?")
+        params.append(since / scale)
+    if until is not None:
+        clauses.append(f"{time_column} < ?")
+        params.append(until / scale)
+    if endpoints:
+        clauses.append(f"endpoint IN ({','.join('?' * len(endpoints))})")
+        params.extend(endpoints)
+    if session_id:
+        clauses.append("session_id = ?")
+        params.append(session_id)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+class LogStore:
+    """
+    A logs/requests.jsonl inkrementális betöltése SQLite-ba. A fájlt a legutóbb
+    elmentett bájt offsettől olvassa tovább (rotáció után a rotált fájl végét
+    is), csak egész sorokat dolgoz fel, és a beolvasással érintett percekre
+    újraszámolja az összesítéseket (darabszám, költség, latency és TTFT
+    p50/p95/p99 és hisztogram). A dashboard lekérdezései az összesítésekből,
+    session szűrésnél indexelt lekérdezéssel futnak, teljes táblaolvasás nélkül.
+    """
+
+    def __init__(self, path: Path = LOG_STORE_PATH, log_path: Path = LOG_PATH):
+        self.path = path
+        self.log_path = log_path
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # isolation_level=None: a tranzakciókat magunk kezeljük (BEGIN IMMEDIATE)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._ensure_rollups()
+
+    def _ensure_rollups(self) -> None:
+        """
+        Régebbi séma (hisztogram oszlopok nélkül) vagy más vödörhatárok esetén
+        az összesítések egyszeri újraépítése a requests táblából.
+        """
+        buckets = json.dumps(ROLLUP_LATENCY_BUCKETS)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                columns = {r[1] for r in self._conn.execute("PRAGMA table_info(rollups)")}
+                row = self._conn.execute("SELECT value FROM meta WHERE key = 'rollup_buckets'").fetchone()
+                if "latency_hist" not in columns or row is None or row[0] != buckets:
+                    self._conn.execute("DROP TABLE rollups")
+                    self._conn.execute(_ROLLUPS_TABLE)
+                    for bucket, endpoint in self._conn.execute(
+                            "SELECT DISTINCT bucket, endpoint FROM requests"
+                    ).fetchall():
+                        self._update_rollup(bucket, endpoint)
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES ('rollup_buckets', ?)", (buckets,)
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # --- betöltés ---
+
+    def ingest(self) -> int:
+        """Az új logsorok betöltése; visszaadja a beolvasott rekordok számát."""
+        with self._lock:
+            # több dashboard példány se töltse be kétszer ugyanazt: az állapot olvasása is a tranzakción belül
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                count = self._ingest_locked()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return count
+
+    def _ingest_locked(self) -> int:
+        key = str(self.log_path)
+        row = self._conn.execute(
+            "SELECT inode, offset, head FROM ingest_state WHERE log_path = ?", (key,)
+        ).fetchone()
+        try:
+            st = self.log_path.stat()
+        except FileNotFoundError:
+            st = None
+
+        # (fájl, kezdő offset) párok, a feldolgozás sorrendjében
+        sources: List[Tuple[Path, int]] = []
+        if row is not None and (st is None or st.st_ino != row[0] or st.st_size < row[1]):
+            if st is None or st.st_ino != row[0]:
+                # a legutóbb olvasott fájlt rotálták: a maradékát a rotált példányból olvassuk,
+                # az azóta rotált további fájlokat pedig teljes egészében
+                rotated = rotated_log_files(self.log_path)
+                matches = [i for i, p in enumerate(rotated) if _head(p) == bytes(row[2])]
+                if matches:
+                    first = matches[-1]
+                    sources.append((rotated[first], row[1]))
+                    sources.extend((p, 0) for p in rotated[first + 1:])
+            if st is not None:
+                sources.append((self.log_path, 0))
+        elif row is None:
+            # első betöltés: a már rotált fájlok is bekerülnek
+            sources.extend((p, 0) for p in rotated_log_files(self.log_path))
+            if st is not None:
+                sources.append((self.log_path, 0))
+        elif st is not None:
+            sources.append((self.log_path, row[1]))
+
+        total = 0
+        touched: Set[Tuple[int, str]] = set()
+        end_offset = 0
+        for path, offset in sources:
+            records, end_offset = self._read_records(path, offset)
+            total += len(records)
+            touched.update(self._insert(records))
+
+        if sources:
+            # az állapot mindig az utoljára olvasott fájlra mutat: ha rotáció után az új log még nem
+            # jött létre, ez a rotált fájl, amit a következő betöltés a head alapján megtalál és a
+            # mentett offsettől folytat (így nem tölti be újra a már beolvasott rekordokat)
+            last = sources[-1][0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ingest_state (log_path, inode, offset, head) VALUES (?, ?, ?, ?)",
+                (key, last.stat().st_ino, end_offset, _head(last)),
+            )
+        for bucket, endpoint in touched:
+            self._update_rollup(bucket, endpoint)
+        return total
+
+    @staticmethod
+    def _read_records(path: Path, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        try:
+            with _open(path) as f:
+                f.seek(offset)
+                data = f.read()
+        except (OSError, EOFError):
+            return [], offset
+        # a félig kiírt utolsó sort a következő betöltés olvassa be
+        end = data.rfind(b"\n") + 1
+        records = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records, offset + end
+
+    def _insert(self, records: List[Dict[str, Any]]) -> Set[Tuple[int, str]]:
+        rows = []
+        touched: Set[Tuple[int, str]] = set()
+        for r in records:
+            ts = float(r.get("ts", 0.0))
+            bucket = int(ts // ROLLUP_BUCKET_SEC)
+            endpoint = r.get("endpoint") or "?"
+            extra = {k: v for k, v in r.items() if k not in _BASE_FIELDS}
+            rows.append((
+                ts, bucket, endpoint, r.get("session_id"), r.get("question"),
+                r.get("answer_len"), r.get("context_len"),
+                r.get("input_tokens_est"), r.get("output_tokens_est"), r.get("cost_estimate"),
+                r.get("total_latency_sec"), r.get("first_token_latency_sec"),
+                json.dumps(extra, ensure_ascii=False) if extra else None,
+            ))
+            touched.add((bucket, endpoint))
+        self._conn.executemany(
+            """
+            INSERT INTO requests (
+                ts, bucket, endpoint, session_id, question, answer_len, context_len,
+                input_tokens, output_tokens, cost, total_latency, first_token_latency, extra
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+        return touched
+
+    def _update_rollup(self, bucket: int, endpoint: str) -> None:
+        """Egy perc összesítése a (endpoint, ts) indexen át, csak az adott perc soraiból."""
+        rows = self._conn.execute(
+            """
+            SELECT total_latency, first_token_latency, cost, input_tokens, output_tokens
+            FROM requests WHERE endpoint = ? AND ts >= ? AND ts < ?
+            """,
+            (endpoint, bucket * ROLLUP_BUCKET_SEC, (bucket + 1) * ROLLUP_BUCKET_SEC),
+        ).fetchall()
+        latencies = [r[0] for r in rows if r[0] is not None]
+        ttfts = [r[1] for r in rows if r[1] is not None]
+        self._conn.execute(
+            "INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                bucket, endpoint, len(rows),
+                sum(r[2] or 0.0 for r in rows),
+                sum(r[3] or 0 for r in rows),
+                sum(r[4] or 0 for r in rows),
+                sum(latencies),
+                *_percentiles(latencies),
+                len(ttfts),
+                *_percentiles(ttfts),
+                json.dumps(_histogram(latencies)),
+                json.dumps(_histogram(ttfts)),
+            ),
+        )
+
+    # --- lekérdezések ---
+
+    def endpoints(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT endpoint FROM rollups ORDER BY endpoint").fetchall()
+        return [r[0] for r in rows]
+
+    def summary(
+            self,
+            since: Optional[float] = None,
+            until: Optional[float] = None,
+            endpoints: Optional[Sequence[str]] = None,
+            session_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Összesítés a szűrt időszakra. Session szűrés nélkül minden érték a
+        percenkénti összesítésekből jön (a percentilisek az összeadott
+        hisztogramokból), így az időszak egész percekre kerekítve számít, és
+        a nyers sorokat nem kell olvasni. Session szűrésnél a session sorai
+        (indexelt lekérdezés) adják a pontos értékeket.
+        """
+        with self._lock:
+            if session_id:
+                where, params = _filters(since, until, endpoints, session_id)
+                rows = self._conn.execute(
+                    f"SELECT total_latency, first_token_latency, cost FROM requests{where}", params
+                ).fetchall()
+                count = len(rows)
+                cost = sum(r[2] or 0.0 for r in rows)
+                latencies = [r[0] for r in rows if r[0] is not None]
+                latency_sum = sum(latencies)
+                lat_p50, lat_p95, lat_p99 = _percentiles(latencies)
+                ttft_p50, ttft_p95, ttft_p99 = _percentiles([r[1] for r in rows if r[1] is not None])
+            else:
+                where, params = _filters(since, until, endpoints, None, time_column="bucket", scale=ROLLUP_BUCKET_SEC)
+                latency_hist = [0] * (len(ROLLUP_LATENCY_BUCKETS) + 1)
+                ttft_hist = [0] * (len(ROLLUP_LATENCY_BUCKETS) + 1)
+                count, cost, latency_sum = 0, 0.0, 0.0
+                for r in self._conn.execute(
+                        f"SELECT count, cost, latency_sum, latency_hist, ttft_hist FROM rollups{where}", params
+                ):
+                    count += r[0]
+                    cost += r[1]
+                    latency_sum += r[2]
+                    _merge(latency_hist, r[3])
+                    _merge(ttft_hist, r[4])
+                lat_p50, lat_p95, lat_p99 = _hist_percentiles(latency_hist)
+                ttft_p50, ttft_p95, ttft_p99 = _hist_percentiles(ttft_hist)
+
+        return {
+            "count": count,
+            "cost": cost,
+            "latency_avg": latency_sum / count if count else None,
+            "latency_p50": lat_p50,
+            "latency_p95": lat_p95,
+            "latency_p99": lat_p99,
+            "ttft_p50": ttft_p50,
+            "ttft_p95": ttft_p95,
+            "ttft_p99": ttft_p99,
+        }
+
+    def timeseries(
+            self,
+            since: Optional[float] = None,
+            until: Optional[float] = None,
+            endpoints: Optional[Sequence[str]] = None,
+            session_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Percenkénti sorok (perc, endpoint); session szűrésnél a session soraiból számolva."""
+        with self._lock:
+            if not session_id:
+                where, params = _filters(since, until, endpoints, None, time_column="bucket", scale=ROLLUP_BUCKET_SEC)
+                cur = self._conn.execute(
+                    f"SELECT bucket, endpoint, count, cost, input_tokens, output_tokens, latency_sum, "
+                    f"latency_p50, latency_p95, latency_p99, ttft_count, ttft_p50, ttft_p95, ttft_p99 "
+                    f"FROM rollups{where} ORDER BY bucket, endpoint",
+                    params,
+                )
+                columns = [c[0] for c in cur.description]
+                rows = [dict(zip(columns, r)) for r in cur.fetchall()]
+            else:
+                where, params = _filters(since, until, endpoints, session_id)
+                raw = self._conn.execute(
+                    f"SELECT bucket, endpoint, total_latency, first_token_latency, cost FROM requests{where} "
+                    f"ORDER BY bucket",
+                    params,
+                ).fetchall()
+                groups: Dict[Tuple[int, str], List[Tuple]] = {}
+                for r in raw:
+                    groups.setdefault((r[0], r[1]), []).append(r)
+                rows = []
+                for (bucket, endpoint), items in groups.items():
+                    latencies = [i[2] for i in items if i[2] is not None]
+                    ttfts = [i[3] for i in items if i[3] is not None]
+                    lat = _percentiles(latencies)
+                    ttft = _percentiles(ttfts)
+                    rows.append({
+                        "bucket": bucket, "endpoint": endpoint, "count": len(items),
+                        "cost": sum(i[4] or 0.0 for i in items),
+                        "latency_p50": lat[0], "latency_p95": lat[1], "latency_p99": lat[2],
+                        "ttft_p50": ttft[0], "ttft_p95": ttft[1], "ttft_p99": ttft[2],
+                    })
+        for row in rows:
+            row["ts"] = row["bucket"] * ROLLUP_BUCKET_SEC
+        return rows
+
+    def recent(
+            self,
+            limit: int = 50,
+            since: Optional[float] = None,
+            until: Optional[float] = None,
+            endpoints: Optional[Sequence[str]] = None,
+            session_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        where, params = _filters(since, until, endpoints, session_id)
+        with self._lock:
+            cur = self._conn.execute(
+                f"SELECT ts, endpoint, session_id, question, input_tokens, output_tokens, cost, "
+                f"total_latency, first_token_latency FROM requests{where} ORDER BY ts DESC LIMIT ?",
+                [*params, limit],
+            )
+            columns = [c[0] for c in cur.description]
+            return [dict(zip(columns, r)) for r in cur.fetchall()]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+if __name__ == "__main__":
+    # pl. cronból: python -m app.log_store
+    store = LogStore()
+    print(f"Betöltött rekordok: {store.ingest()}")
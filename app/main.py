@@ -1,209 +1,520 @@
-from __future__ import annotations
-
-import time
-from uuid import uuid4
-from pathlib import Path
-from typing import Optional, Iterator
-
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-
-from app.ingestion import process_document
-from app.vectordb import VectorStore
-from app.rag import answer_question
-from app.monitoring import log_request
-
-
-store = VectorStore()
-HAS_DOCS = False
-SESSION_HISTORY: dict[str, list[dict]] = {}
-
-app = FastAPI(
-    title="RAG Asszisztens - Python verzió",
-    description="Zárófeladat: RAG alapú asszisztens FastAPI backenddel",
-)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"], 
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-class ChatRequest(BaseModel):
-    question: str
-    session_id: Optional[str] = None
-
-class ChatResponse(BaseModel):
-    session_id: str
-    answer: str
-    context: list[dict]
-    monitoring: dict
-
-@app.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
-    global HAS_DOCS
-
-    suffix = Path(file.filename).suffix.lower()
-    if suffix not in [".txt", ".pdf"]:
-        raise HTTPException(status_code=400, detail="Csak .txt vagy .pdf támogatott.")
-    
-    raw_dir = Path("data/raw")
-    raw_dir.mkdir(parents=True, exist_ok=True)
-    raw_path = raw_dir / file.filename
-    raw_path.write_bytes(await file.read())
-
-    chunks = process_document(raw_path)
-    if not chunks:
-        raise HTTPException(status_code=400, detail="Nem sikerült szöveget kinyerni a dokumentumból.")
-    
-    store.add_documents(chunks)
-    HAS_DOCS = True
-
-    return {
-        "status": "ok",
-        "filename": file.filename,
-        "chunks_indexed": len(chunks),
-    }
-
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    global HAS_DOCS
-
-    question = request.question.strip()
-    if not question:
-        raise HTTPException(status_code=400, detail="Üres kérdés nem engedélyezett.")
-    
-    if not HAS_DOCS:
-        raise HTTPException(
-            status_code=400,
-            detail="Még nincsenek indexelt dokumentumok. Először tölts fel egy TXT/PDF fájlt."
-        )
-    
-    session_id = request.session_id or str(uuid4())
-    history = SESSION_HISTORY.get(session_id, [])
-
-    start_time = time.time()
-    answer, context = answer_question(store, question, history=history)
-    end_time = time.time()
-
-    history.append({"role": "user", "content": question})
-    history.append({"role": "assistant", "content": answer})
-    SESSION_HISTORY[session_id] = history
-
-    total_latency = end_time - start_time
-
-    input_tokens_est = len(question.split())
-    output_tokens_est = len(answer.split())
-
-    metrics = log_request(
-        endpoint = "/chat",
-        session_id = session_id,
-        question = question,
-        answer = answer,
-        context = context,
-        input_tokens_est = input_tokens_est,
-        output_tokens_est = output_tokens_est,
-        total_latency_sec = total_latency,
-        first_token_latency_sec = total_latency,
-    )
-
-    return ChatResponse(
-        session_id = session_id,
-        answer = answer,
-        context = context,
-        monitoring = metrics,
-    )
-
-
-@app.post("/chat_stream")
-async def chat_stream(request: ChatRequest):
-    """
-    Egyszerű streaming endpoint.
-    Csak a választ streameli plain textként.
-    """
-    global HAS_DOCS
-
-    question = request.question.strip()
-    if not question:
-        raise HTTPException(status_code=400, detail="Üres kérdés nem engedélyezett.")
-
-    if not HAS_DOCS:
-        raise HTTPException(
-            status_code=400,
-            detail="Még nincsenek indexelt dokumentumok. Először tölts fel egy TXT/PDF fájlt."
-        )
-
-    session_id = request.session_id or str(uuid4())
-    history = SESSION_HISTORY.get(session_id, [])
-
-    candidates = store.search(question, top_k=5)
-    if not candidates:
-        def gen_empty() -> Iterator[str]:
-            yield "Nem találtam releváns információt a dokumentumokban."
-        return StreamingResponse(gen_empty(), media_type="text/plain")
-
-    from app.rag import rerank_by_llm, build_prompt
-
-    contexts = rerank_by_llm(question, candidates, top_m=3)
-    prompt = build_prompt(question, contexts, history=history)
-
-    def token_generator() -> Iterator[str]:
-        import time
-        from app.openai_client import client
-        from app.monitoring import log_request
-
-        start_time = time.time()
-        first_token_time = None
-        answer_chunks = []
-
-        stream = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-            stream=True,
-        )
-
-        for chunk in stream:
-            delta = chunk.choices[0].delta
-            content = delta.content or ""
-            if content:
-                answer_chunks.append(content)
-                if first_token_time is None:
-                    first_token_time = time.time()
-                yield content
-
-        end_time = time.time()
-
-        full_answer = "".join(answer_chunks)
-
-        # session history frissítés
-        history.append({"role": "user", "content": question})
-        history.append({"role": "assistant", "content": full_answer})
-        SESSION_HISTORY[session_id] = history
-
-        # metrikák becslése
-        total_latency = end_time - start_time
-        first_token_latency = (
-            first_token_time - start_time if first_token_time is not None else None
-        )
-
-        input_tokens_est = len(question.split())
-        output_tokens_est = len(full_answer.split())
-
-        log_request(
-            endpoint="/chat_stream",
-            session_id=session_id,
-            question=question,
-            answer=full_answer,
-            context=contexts,
-            input_tokens_est=input_tokens_est,
-            output_tokens_est=output_tokens_est,
-            total_latency_sec=total_latency,
-            first_token_latency_sec=first_token_latency,
-        )
-
-    return StreamingResponse(token_generator(), media_type="text/plain")
+from __future__ import annotations
+
+import os
+import time
+from uuid import uuid4
+from pathlib import Path
+from typing import Optional, Iterator, AsyncIterator
+
+from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
+
+from app.answer_cache import AnswerCache, ANSWER_CACHE_ENABLED, replay_stream
+from app.embed_batcher import batcher_stats
+from app.jobs import JobManager, IngestJob
+from app.metrics import render_metrics
+from app.rerank_cache import get_rerank_cache
+from app.session_store import make_session_store
+from app.shared_index import SHARED_INDEX_DIR, SharedIndex
+from app.singleflight import SINGLE_FLIGHT_ENABLED, SingleFlight, StreamFlight, flight_key
+from app.vectordb import VectorStore
+from app.openai_client import async_client
+from app.rag import AnswerStream, Reranker, aanswer_question, get_reranker
+from app.monitoring import close_log_writer, get_log_writer, log_request
+from app.prompting import count_tokens
+from app.tracing import trace
+
+
+# üres VECTOR_DB_PATH esetén a vektortár csak memóriában él
+VECTOR_DB_PATH = os.getenv("VECTOR_DB_PATH", "data/index/qdrant")
+# ha meg van adva, induláskor innen töltjük be az indexet, és minden indexelés után frissítjük
+VECTOR_SNAPSHOT_PATH = os.getenv("VECTOR_SNAPSHOT_PATH", "")
+
+# több worker (uvicorn --workers N) esetén közös index: egy író folyamat építi és teszi közzé,
+# a többi worker a közzétett generációt memory-mapelve, csak olvasva használja
+shared_index = SharedIndex(Path(SHARED_INDEX_DIR)) if SHARED_INDEX_DIR else None
+IS_INDEX_WRITER = shared_index is None or shared_index.try_acquire_writer()
+
+if IS_INDEX_WRITER:
+    store = VectorStore(path=VECTOR_DB_PATH or None)
+    if VECTOR_SNAPSHOT_PATH and store.count() == 0 and Path(VECTOR_SNAPSHOT_PATH).exists():
+        store.import_snapshot(Path(VECTOR_SNAPSHOT_PATH))
+    if shared_index is not None:
+        if store.count() == 0:
+            shared_index.restore(store)
+        else:
+            shared_index.publish(store)
+else:
+    # saját index nincs, a refresh a legutóbbi közzétett generációra állítja a store-t
+    store = VectorStore(backend="numpy", quantization="none")
+    shared_index.refresh(store)
+HAS_DOCS = store.count() > 0
+# beszélgetés-előzmények: sessiononkénti üzenetlimit, tétlenségi lejárat, globális méretkorlát
+sessions = make_session_store()
+# ismétlődő / közel azonos kérdések válaszai; újraindexeléskor a store értesíti
+answer_cache = AnswerCache(store) if ANSWER_CACHE_ENABLED else None
+# a rerank cache bejegyzései törlődnek, ha valamelyik jelölt chunk megváltozik
+rerank_cache = get_rerank_cache()
+if rerank_cache is not None:
+    rerank_cache.attach(store)
+# az egyszerre érkező azonos kérdések egyetlen upstream számítást / streamet osztanak meg
+chat_flights = SingleFlight() if SINGLE_FLIGHT_ENABLED else None
+stream_flights = StreamFlight() if SINGLE_FLIGHT_ENABLED else None
+
+
+def _resolve_reranker(request: ChatRequest) -> Reranker:
+    try:
+        return get_reranker(request.reranker or True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _pipeline_metrics(overlapped: bool, speculation: str, timings: dict) -> dict:
+    return {
+        "pipeline": "overlapped" if overlapped else "sequential",
+        "speculation": speculation,
+        "stage_timings": timings,
+    }
+
+
+def _token_counts(usage: dict, answer: str) -> tuple:
+    """A ténylegesen elküldött prompt(ok) és a válasz tokenszáma; generálás nélkül (nincs találat) 0."""
+    if not usage:
+        return 0, 0
+    return usage["prompt_tokens"], count_tokens(answer)
+
+
+def _first_token_latency(total_latency: float, timings: dict) -> float:
+    """
+    A /chat nem streamel, de a generálás igen: az első token a teljes időből
+    levonva azt, ami a generálás első tokenje után telt el. Cache találatnál
+    (vagy ha nem volt generálás) a válasz egyben érkezik, ilyenkor a teljes idő.
+    """
+    if "first_token_sec" not in timings or "total_sec" not in timings:
+        return total_latency
+    return max(0.0, total_latency - (timings["total_sec"] - timings["first_token_sec"]))
+
+
+def _cache_metrics(cached) -> dict:
+    if answer_cache is None:
+        return {}
+    return {
+        "answer_cache": cached.match if cached is not None else "miss",
+        "answer_cache_hit_rate": answer_cache.stats()["hit_rate"],
+    }
+
+
+def _turn(question: str, answer: str) -> list:
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+
+async def _lookup_answer(question: str, history: list, reranker: Reranker):
+    if answer_cache is None:
+        return None
+    # a szemantikus kereséshez embedding kell, ez ne blokkolja az event loopot
+    return await run_in_threadpool(answer_cache.lookup, question, history, variant=reranker.name)
+
+
+def _mark_has_docs(job: IngestJob) -> None:
+    # az első feldolgozott batch után már lehet keresni
+    global HAS_DOCS
+    HAS_DOCS = True
+
+
+def _on_job_done(job: IngestJob) -> None:
+    # egy sikertelen feladat törli a már beírt pontjait, így a tár újra üres is lehet
+    global HAS_DOCS
+    HAS_DOCS = store.count() > 0
+    _save_snapshot(job)
+
+
+def _save_snapshot(job: Optional[IngestJob] = None) -> None:
+    if job is not None and (job.skipped or (job.status == "failed" and not job.batches_done)):
+        # a tár nem változott
+        return
+    if VECTOR_SNAPSHOT_PATH:
+        store.export_snapshot(Path(VECTOR_SNAPSHOT_PATH))
+    if shared_index is not None:
+        # ha ez volt az utolsó feladat, azonnal közzétesszük; különben a _sync_shared_index vonja össze
+        # a közzétételt a többi feladattal (egy generáció több feladatra)
+        shared_index.request_publish()
+        shared_index.publish_pending(store, idle=_jobs_idle())
+
+
+jobs = JobManager(store, on_batch_indexed=_mark_has_docs, on_job_done=_on_job_done)
+
+
+def _jobs_idle() -> bool:
+    return all(job.status in ("done", "failed") for job in jobs.list_jobs())
+
+
+# a közös jobs könyvtárba már véglegesen kiírt (befejezett) feladatok
+_finished_job_statuses: set = set()
+
+
+def _sync_shared_index() -> None:
+    """Az író átveszi a más workerekhez érkezett feltöltéseket, az olvasók az új generációt."""
+    global HAS_DOCS
+    if shared_index.is_writer:
+        for job_id, path in shared_index.take_uploads():
+            jobs.submit(path, job_id=job_id)
+        current = jobs.list_jobs()
+        for job in current:
+            if job.id not in _finished_job_statuses:
+                shared_index.write_job_status(job.to_dict())
+                if job.status in ("done", "failed"):
+                    _finished_job_statuses.add(job.id)
+        shared_index.prune_job_statuses({job.id for job in current})
+        # a többi worker a következő ellenőrzéskor átvált az új generációra
+        shared_index.publish_pending(store, idle=_jobs_idle())
+    elif shared_index.refresh(store):
+        HAS_DOCS = store.count() > 0
+
+app = FastAPI(
+    title="RAG Asszisztens - Python verzió",
+    description="Zárófeladat: RAG alapú asszisztens FastAPI backenddel",
+)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"], 
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+@app.on_event("startup")
+def start_shared_index():
+    if shared_index is not None:
+        shared_index.start(_sync_shared_index)
+
+@app.on_event("shutdown")
+def shutdown_jobs():
+    jobs.shutdown(wait=False)
+    # a késleltetett indexmentés kiírása
+    store.flush()
+    if shared_index is not None:
+        shared_index.stop()
+
+@app.on_event("shutdown")
+async def close_openai_client():
+    await async_client.close()
+
+@app.on_event("shutdown")
+def drain_request_log():
+    # a sorban maradt log rekordok kiírása
+    close_log_writer()
+
+@app.post("/snapshot")
+async def create_snapshot():
+    if not VECTOR_SNAPSHOT_PATH:
+        raise HTTPException(status_code=400, detail="Nincs beállítva VECTOR_SNAPSHOT_PATH.")
+    size = await run_in_threadpool(store.export_snapshot, Path(VECTOR_SNAPSHOT_PATH))
+    return {"status": "ok", "path": VECTOR_SNAPSHOT_PATH, "points": store.count(), "bytes": size}
+
+class ChatRequest(BaseModel):
+    question: str
+    session_id: Optional[str] = None
+    # "llm", "lexical", "mmr" vagy "none"; ha nincs megadva, a RERANKER beállítás érvényes
+    reranker: Optional[str] = None
+    # spekulatív generálás az LLM rerank alatt; ha nincs megadva, a PIPELINE_MODE beállítás érvényes
+    overlap: Optional[bool] = None
+
+class ChatResponse(BaseModel):
+    session_id: str
+    answer: str
+    context: list[dict]
+    monitoring: dict
+
+@app.post("/upload", status_code=202)
+async def upload_document(file: UploadFile = File(...)):
+    """
+    A fájlt elmenti, majd háttérben indexeli.
+    Azonnal visszaadja a feladat azonosítóját, az állapot a /jobs/{job_id} végponton kérdezhető le.
+    """
+    suffix = Path(file.filename).suffix.lower()
+    if suffix not in [".txt", ".pdf"]:
+        raise HTTPException(status_code=400, detail="Csak .txt vagy .pdf támogatott.")
+    
+    raw_dir = Path("data/raw")
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    raw_path = raw_dir / file.filename
+    data = await file.read()
+    await run_in_threadpool(raw_path.write_bytes, data)
+
+    if not IS_INDEX_WRITER:
+        # az indexet csak az író folyamat módosíthatja, a feltöltést neki adjuk át
+        job_id = str(uuid4())
+        await run_in_threadpool(shared_index.enqueue_upload, job_id, raw_path.resolve())
+    else:
+        job_id = jobs.submit(raw_path).id
+
+    return {
+        "status": "accepted",
+        "filename": file.filename,
+        "job_id": job_id,
+    }
+
+@app.get("/stats")
+async def get_stats():
+    """Cache-ek, kérés-összevonás, az embedding batcher és a session tároló mérőszámai (pl. a batch ablak hangolásához)."""
+    return {
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+        "rerank_cache": rerank_cache.stats() if rerank_cache is not None else None,
+        "single_flight": {
+            "chat": chat_flights.stats() if chat_flights is not None else None,
+            "chat_stream": stream_flights.stats() if stream_flights is not None else None,
+        },
+        "embed_batcher": batcher_stats(),
+        "sessions": await run_in_threadpool(sessions.stats),
+        "shared_index": await run_in_threadpool(shared_index.stats) if shared_index is not None else None,
+        "request_log": get_log_writer().stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus formátumú metrikák: kérésidő, első token, tokenek és költség
+    endpointonként, valamint a szakaszok (spanok) idejének hisztogramja.
+    Folyamatonként összesítve (több workernél workerenként).
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/jobs")
+async def list_jobs():
+    if not IS_INDEX_WRITER:
+        return await run_in_threadpool(shared_index.list_job_statuses)
+    return [job.to_dict() for job in jobs.list_jobs()]
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    # közös indexnél a feladatot az író folyamat futtatja
+    status = await run_in_threadpool(shared_index.read_job_status, job_id) if shared_index is not None else None
+    if status is None:
+        raise HTTPException(status_code=404, detail="Ismeretlen feladat azonosító.")
+    return status
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    global HAS_DOCS
+
+    question = request.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Üres kérdés nem engedélyezett.")
+    
+    if not HAS_DOCS:
+        raise HTTPException(
+            status_code=400,
+            detail="Még nincsenek indexelt dokumentumok. Először tölts fel egy TXT/PDF fájlt."
+        )
+    
+    reranker = _resolve_reranker(request)
+    session_id = request.session_id or str(uuid4())
+    history = await run_in_threadpool(sessions.get, session_id)
+
+    start_time = time.time()
+    timings: dict = {}
+    usage: dict = {}
+    spans: list = []
+    coalesced = False
+    cached = await _lookup_answer(question, history, reranker)
+    if cached is not None:
+        answer, context = cached.answer, cached.contexts
+    else:
+        async def compute():
+            upstream_timings: dict = {}
+            upstream_usage: dict = {}
+            # a szakaszok spanjai az összevont kérésekhez is eljutnak
+            with trace() as current:
+                result = await aanswer_question(
+                    store, question, history=history, use_rerank=reranker,
+                    overlap=request.overlap, timings=upstream_timings, usage=upstream_usage,
+                )
+            return result, upstream_timings, upstream_usage, current.to_list()
+
+        if chat_flights is not None:
+            key = flight_key(question, history, reranker.name, request.overlap)
+            ((answer, context), upstream_timings, usage, spans), coalesced = await chat_flights.do(key, compute)
+        else:
+            (answer, context), upstream_timings, usage, spans = await compute()
+        timings = dict(upstream_timings)
+        if answer_cache is not None and not coalesced:
+            await run_in_threadpool(
+                answer_cache.put, question, history, answer, context, variant=reranker.name,
+            )
+    end_time = time.time()
+
+    await run_in_threadpool(sessions.append, session_id, _turn(question, answer))
+
+    total_latency = end_time - start_time
+
+    speculation = timings.pop("speculation", "off")
+
+    # cache találatnál és összevont kérésnél ez a kérés nem indított LLM hívást
+    upstream_call = cached is None and not coalesced
+    input_tokens_est, output_tokens_est = _token_counts(usage, answer) if upstream_call else (0, 0)
+
+    metrics = log_request(
+        endpoint = "/chat",
+        session_id = session_id,
+        question = question,
+        answer = answer,
+        context = context,
+        input_tokens_est = input_tokens_est,
+        output_tokens_est = output_tokens_est,
+        total_latency_sec = total_latency,
+        first_token_latency_sec = _first_token_latency(total_latency, timings),
+        extra = {
+            "reranker": reranker.name,
+            **_pipeline_metrics(speculation != "off", speculation, timings),
+            "coalesced": coalesced,
+            "prompt_packing": usage,
+            "spans": spans,
+            **_cache_metrics(cached),
+        },
+    )
+
+    return ChatResponse(
+        session_id = session_id,
+        answer = answer,
+        context = context,
+        monitoring = metrics,
+    )
+
+
+@app.post("/chat_stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Egyszerű streaming endpoint.
+    Csak a választ streameli plain textként.
+    """
+    global HAS_DOCS
+
+    question = request.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Üres kérdés nem engedélyezett.")
+
+    if not HAS_DOCS:
+        raise HTTPException(
+            status_code=400,
+            detail="Még nincsenek indexelt dokumentumok. Először tölts fel egy TXT/PDF fájlt."
+        )
+
+    reranker = _resolve_reranker(request)
+    session_id = request.session_id or str(uuid4())
+    history = await run_in_threadpool(sessions.get, session_id)
+
+    cached = await _lookup_answer(question, history, reranker)
+    if cached is not None:
+        def cached_generator() -> Iterator[str]:
+            start_time = time.time()
+            # a cache-elt választ is streamként játsszuk vissza
+            for piece in replay_stream(cached.answer):
+                yield piece
+            total_latency = time.time() - start_time
+
+            sessions.append(session_id, _turn(question, cached.answer))
+
+            log_request(
+                endpoint="/chat_stream",
+                session_id=session_id,
+                question=question,
+                answer=cached.answer,
+                context=cached.contexts,
+                input_tokens_est=0,
+                output_tokens_est=0,
+                total_latency_sec=total_latency,
+                first_token_latency_sec=0.0,
+                extra=_cache_metrics(cached),
+            )
+        return StreamingResponse(cached_generator(), media_type="text/plain")
+
+    def make_stream() -> AnswerStream:
+        # a keresés, a rerank és a generálás csak a stream olvasásakor indul
+        return AnswerStream(
+            store, question, history=history, use_rerank=reranker, overlap=request.overlap,
+        )
+
+    subscription = None
+    if stream_flights is not None:
+        # azonos kérdésnél a már futó stream darabjait kapjuk (a korábbiakat visszajátszva)
+        subscription = stream_flights.subscribe(
+            flight_key(question, history, reranker.name, request.overlap), make_stream,
+        )
+        answer_stream, pieces, coalesced = subscription.source, subscription, subscription.joined
+    else:
+        answer_stream = make_stream()
+        pieces, coalesced = answer_stream, False
+
+    async def token_generator() -> AsyncIterator[str]:
+        start_time = time.time()
+        first_token_time = None
+        answer_chunks = []
+
+        async for content in pieces:
+            answer_chunks.append(content)
+            if first_token_time is None:
+                first_token_time = time.time()
+            yield content
+
+        end_time = time.time()
+        contexts = answer_stream.contexts
+
+        full_answer = "".join(answer_chunks)
+
+        if answer_cache is not None and not coalesced:
+            await run_in_threadpool(
+                answer_cache.put, question, history, full_answer, contexts, variant=reranker.name,
+            )
+
+        # session history frissítés
+        await run_in_threadpool(sessions.append, session_id, _turn(question, full_answer))
+
+        # metrikák
+        total_latency = end_time - start_time
+        first_token_latency = (
+            first_token_time - start_time if first_token_time is not None else None
+        )
+
+        input_tokens_est, output_tokens_est = (
+            _token_counts(answer_stream.usage, full_answer) if not coalesced else (0, 0)
+        )
+
+        log_request(
+            endpoint="/chat_stream",
+            session_id=session_id,
+            question=question,
+            answer=full_answer,
+            context=contexts,
+            input_tokens_est=input_tokens_est,
+            output_tokens_est=output_tokens_est,
+            total_latency_sec=total_latency,
+            first_token_latency_sec=first_token_latency,
+            extra={
+                "reranker": reranker.name,
+                **_pipeline_metrics(answer_stream.overlap, answer_stream.speculation, answer_stream.timings),
+                "coalesced": coalesced,
+                "prompt_packing": answer_stream.usage,
+                "spans": answer_stream.spans,
+                **_cache_metrics(None),
+            },
+        )
+
+    if subscription is None:
+        return StreamingResponse(token_generator(), media_type="text/plain")
+    try:
+        # ha a kliens a törzs olvasása előtt kapcsolódik le, a generátor el sem indul:
+        # a háttérfeladat ekkor is eltávolítja a még el nem indult upstreamet
+        return StreamingResponse(
+            token_generator(), media_type="text/plain", background=BackgroundTask(subscription.close),
+        )
+    except BaseException:
+        subscription.close()
+        raise
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import bisect
+import math
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# a latency hisztogramok vödörhatárai másodpercben (felső határok, növekvő sorrendben)
+METRICS_LATENCY_BUCKETS = tuple(
+    float(b) for b in os.getenv(
+        "METRICS_LATENCY_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60"
+    ).split(",")
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monoton növekvő számláló címkénként (folyamaton belül, szálbiztosan)."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in values]
+
+
+class Histogram:
+    """
+    Prometheus-stílusú hisztogram címkénként: kumulatív vödrök, összeg és
+    darabszám. A kvantiliseket (p50/p95/p99) a lekérdező oldal számolja a
+    vödrökből (histogram_quantile).
+    """
+
+    kind = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            help_text: str,
+            label_names: Iterable[str] = (),
+            buckets: Iterable[float] = METRICS_LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # címkék -> (vödrönkénti darabszám (nem kumulatív, +Inf-fel), összeg, darabszám)
+        self._series: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.label_names)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total, count = self._series.get(key) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            counts[idx] += 1
+            self._series[key] = (counts, total + value, count + 1)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((k, (list(c), s, n)) for k, (c, s, n) in self._series.items())
+        lines = []
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = ("le", _number(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"A metrika már regisztrálva van: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """A Prometheus text exposition formátum (text/plain; version=0.0.4)."""
+        lines: List[str] = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# a kérés szakaszai (app.tracing spanjai): query_embed, embed_texts, embed_api, vector_search, rerank, ...
+STAGE_DURATION = REGISTRY.register(Histogram(
+    "rag_stage_duration_seconds", "A kérésfeldolgozás szakaszainak ideje (spanok).", ["stage"],
+))
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    "rag_request_duration_seconds", "A kérések teljes ideje endpointonként.", ["endpoint"],
+))
+TIME_TO_FIRST_TOKEN = REGISTRY.register(Histogram(
+    "rag_time_to_first_token_seconds", "Az első válasz token megérkezéséig eltelt idő.", ["endpoint"],
+))
+REQUESTS = REGISTRY.register(Counter(
+    "rag_requests_total", "A kiszolgált kérések száma.", ["endpoint"],
+))
+TOKENS = REGISTRY.register(Counter(
+    "rag_tokens_total", "A generáló modellnek küldött (input) és kapott (output) tokenek.", ["endpoint", "direction"],
+))
+COST = REGISTRY.register(Counter(
+    "rag_cost_usd_total", "A becsült költség dollárban.", ["endpoint"],
+))
+
+
+def observe_request(
+        endpoint: str,
+        total_latency_sec: float,
+        first_token_latency_sec: Optional[float],
+        input_tokens: int,
+        output_tokens: int,
+        cost: float,
+) -> None:
+    REQUESTS.inc(endpoint=endpoint)
+    REQUEST_DURATION.observe(total_latency_sec, endpoint=endpoint)
+    if first_token_latency_sec is not None:
+        TIME_TO_FIRST_TOKEN.observe(first_token_latency_sec, endpoint=endpoint)
+    TOKENS.inc(input_tokens, endpoint=endpoint, direction="input")
+    TOKENS.inc(output_tokens, endpoint=endpoint, direction="output")
+    COST.inc(cost, endpoint=endpoint)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
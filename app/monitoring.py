@@ -1,49 +1,302 @@
-from __future__ import annotations
-
-from pathlib import Path
-from typing import Optional, Dict, Any, List
-import json
-import time
-
-LOG_PATH = Path("logs/requests.jsonl")
-LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
-
-COST_PER_1K_INPUT = 0.00015
-COST_PER_1K_OUTPUT = 0.00060
-
-def estimate_cost(input_tokens: int, output_tokens: int) -> float:
-    return (input_tokens / 1000.0) * COST_PER_1K_INPUT + (output_tokens / 1000.0) * COST_PER_1K_OUTPUT
-
-def log_request(
-        *,
-        endpoint: str,
-        session_id: str,
-        question: str,
-        answer: str,
-        context: List[Dict],
-        input_tokens_est: int,
-        output_tokens_est: int,
-        total_latency_sec: float,
-        first_token_latency_sec: Optional[float] = None,
-        extra: Optional[Dict[str, Any]] = None,
-) -> Dict[str, Any]:
-    record: Dict[str, Any] = {
-        "ts": time.time(),
-        "endpoint": endpoint,
-        "session_id": session_id,
-        "question": question,
-        "answer_len": len(answer),
-        "context_len": len(context),
-        "input_tokens_est": input_tokens_est,
-        "output_tokens_est": output_tokens_est,
-        "cost_estimate": estimate_cost(input_tokens_est, output_tokens_est),
-        "total_latency_sec": total_latency_sec,
-        "first_token_latency_sec": first_token_latency_sec,
-    }
-    if extra:
-        record.update(extra)
-
-    with LOG_PATH.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
-
-    return record
\ No newline at end of file
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+import atexit
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+
+from app.metrics import observe_request
+
+try:
+    import fcntl
+except ImportError:  # Windows: a workerek közti zárolás nélkül
+    fcntl = None
+
+LOG_PATH = Path("logs/requests.jsonl")
+LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+
+# a log sorok egy háttérszálon, kötegelten íródnak ki (LOG_ASYNC=0: azonnal, a hívó szálán)
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1") == "1"
+# kiírás, ha ennyi rekord összegyűlt, vagy az első óta eltelt ennyi idő
+LOG_FLUSH_MAX_RECORDS = int(os.getenv("LOG_FLUSH_MAX_RECORDS", "200"))
+LOG_FLUSH_INTERVAL_SEC = float(os.getenv("LOG_FLUSH_INTERVAL_SEC", "1.0"))
+# ha a sor megtelik, az újabb rekordok eldobódnak (a kérést nem lassítjuk)
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+# rotáció méret és/vagy kor alapján (0 = kikapcsolva)
+LOG_ROTATE_BYTES = int(os.getenv("LOG_ROTATE_BYTES", str(50 * 1024 * 1024)))
+LOG_ROTATE_INTERVAL_SEC = float(os.getenv("LOG_ROTATE_INTERVAL_SEC", "0"))
+LOG_ROTATE_COMPRESS = os.getenv("LOG_ROTATE_COMPRESS", "1") == "1"
+# ennyi rotált fájl marad meg
+LOG_ROTATE_KEEP = int(os.getenv("LOG_ROTATE_KEEP", "20"))
+
+COST_PER_1K_INPUT = 0.00015
+COST_PER_1K_OUTPUT = 0.00060
+
+def estimate_cost(input_tokens: int, output_tokens: int) -> float:
+    return (input_tokens / 1000.0) * COST_PER_1K_INPUT + (output_tokens / 1000.0) * COST_PER_1K_OUTPUT
+
+def log_request(
+        *,
+        endpoint: str,
+        session_id: str,
+        question: str,
+        answer: str,
+        context: List[Dict],
+        input_tokens_est: int,
+        output_tokens_est: int,
+        total_latency_sec: float,
+        first_token_latency_sec: Optional[float] = None,
+        extra: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    record: Dict[str, Any] = {
+        "ts": time.time(),
+        "endpoint": endpoint,
+        "session_id": session_id,
+        "question": question,
+        "answer_len": len(answer),
+        "context_len": len(context),
+        "input_tokens_est": input_tokens_est,
+        "output_tokens_est": output_tokens_est,
+        "cost_estimate": estimate_cost(input_tokens_est, output_tokens_est),
+        "total_latency_sec": total_latency_sec,
+        "first_token_latency_sec": first_token_latency_sec,
+    }
+    if extra:
+        record.update(extra)
+
+    # a /metrics hisztogramjai ugyanezekből az értékekből, folyamaton belül összesítve
+    observe_request(
+        endpoint, total_latency_sec, first_token_latency_sec,
+        input_tokens_est, output_tokens_est, record["cost_estimate"],
+    )
+    get_log_writer().write(record)
+    return record
+
+
+def rotated_log_files(path: Path = LOG_PATH) -> List[Path]:
+    """A rotált (esetleg .gz) logfájlok, a legrégebbitől a legújabbig (a név időbélyeget tartalmaz)."""
+    return sorted(path.parent.glob(f"{path.stem}-*{path.suffix}*"))
+
+
+class _FileLock:
+    """Workerek közötti kizárás egy .lock fájllal (fcntl nélkül no-op)."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._f = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._f = self.path.open("a+b")
+            fcntl.flock(self._f.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._f is not None:
+            fcntl.flock(self._f.fileno(), fcntl.LOCK_UN)
+            self._f.close()
+            self._f = None
+
+
+class RequestLogWriter:
+    """
+    JSONL log író: a rekordok egy memóriabeli sorba kerülnek, egy háttérszál
+    kötegelten (LOG_FLUSH_MAX_RECORDS rekord vagy LOG_FLUSH_INTERVAL_SEC idő
+    után) egyetlen írással fűzi őket a fájlhoz. Az írás és a rotáció egy
+    közös zárfájl alatt fut, így több worker sem keveri össze a sorokat, és
+    egy fájlt csak egyikük rotál. A rotált fájlok időbélyeges nevet kapnak,
+    és opcionálisan gzip-pel tömörülnek. A close() kiüríti a sort.
+    """
+
+    def __init__(
+            self,
+            path: Path = LOG_PATH,
+            use_thread: bool = LOG_ASYNC,
+            flush_max_records: int = LOG_FLUSH_MAX_RECORDS,
+            flush_interval_sec: float = LOG_FLUSH_INTERVAL_SEC,
+            queue_max: int = LOG_QUEUE_MAX,
+            rotate_bytes: int = LOG_ROTATE_BYTES,
+            rotate_interval_sec: float = LOG_ROTATE_INTERVAL_SEC,
+            compress: bool = LOG_ROTATE_COMPRESS,
+            keep: int = LOG_ROTATE_KEEP,
+    ):
+        self.path = path
+        self.flush_max_records = flush_max_records
+        self.flush_interval_sec = flush_interval_sec
+        self.rotate_bytes = rotate_bytes
+        self.rotate_interval_sec = rotate_interval_sec
+        self.compress = compress
+        self.keep = keep
+        self._lock = _FileLock(path.with_name(path.name + ".lock"))
+        # inode -> a fájl első rekordjának időbélyege (a kor alapú rotációhoz)
+        self._first_ts: Dict[int, float] = {}
+
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rotations = 0
+
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        # a write() sorba tétele és a close() lezáró jele között: a jel után nem kerülhet rekord a sorba
+        self._queue_lock = threading.Lock()
+        if use_thread:
+            self._queue = queue.Queue(maxsize=queue_max)
+            self._thread = threading.Thread(target=self._run, args=(self._queue,), name="request-log", daemon=True)
+            self._thread.start()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._queue_lock:
+            q = self._queue
+            if q is not None:
+                try:
+                    q.put_nowait(line)
+                except queue.Full:
+                    self.dropped += 1
+                return
+        self._write_lines([line])
+
+    def _run(self, q: queue.Queue) -> None:
+        stop = False
+        while not stop:
+            batch: List[str] = []
+            received = 0
+            deadline = None
+            while len(batch) < self.flush_max_records:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    break
+                try:
+                    item = q.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                received += 1
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval_sec
+            try:
+                if batch:
+                    self._write_lines(batch)
+            except OSError:
+                self.dropped += len(batch)
+            finally:
+                for _ in range(received):
+                    q.task_done()
+
+    def _write_lines(self, lines: List[str]) -> None:
+        data = "".join(lines).encode("utf-8")
+        with self._lock:
+            rotated = self._maybe_rotate()
+            with self.path.open("ab") as f:
+                f.write(data)
+            self.written += len(lines)
+            self.batches += 1
+        if rotated is not None and self.compress:
+            # a tömörítés a záron kívül fut, a többi worker közben írhat
+            self._compress(rotated)
+        if rotated is not None:
+            self._prune_rotated()
+
+    def _maybe_rotate(self) -> Optional[Path]:
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return None
+        if st.st_size == 0:
+            return None
+        too_big = self.rotate_bytes and st.st_size >= self.rotate_bytes
+        too_old = False
+        if self.rotate_interval_sec:
+            first_ts = self._first_ts.get(st.st_ino)
+            if first_ts is None:
+                first_ts = self._read_first_ts()
+                self._first_ts = {st.st_ino: first_ts}
+            too_old = time.time() - first_ts >= self.rotate_interval_sec
+        if not (too_big or too_old):
+            return None
+
+        now = time.time()
+        # ezredmásodperc + pid: egy másodpercen belüli több rotáció se írja felül egymást
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"{int(now * 1000) % 1000:03d}"
+        target = self.path.with_name(f"{self.path.stem}-{stamp}-{os.getpid()}{self.path.suffix}")
+        os.replace(self.path, target)
+        self.rotations += 1
+        return target
+
+    def _read_first_ts(self) -> float:
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                return float(json.loads(f.readline())["ts"])
+        except (OSError, ValueError, KeyError):
+            return time.time()
+
+    def _compress(self, path: Path) -> None:
+        gz_path = path.with_name(path.name + ".gz")
+        with path.open("rb") as src, gzip.open(gz_path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        path.unlink()
+
+    def rotated_files(self) -> List[Path]:
+        return rotated_log_files(self.path)
+
+    def _prune_rotated(self) -> None:
+        files = self.rotated_files()
+        for path in files[:max(0, len(files) - self.keep)]:
+            path.unlink(missing_ok=True)
+
+    def flush(self) -> None:
+        """Megvárja, amíg a sorban lévő rekordok kiíródnak."""
+        q = self._queue
+        if q is not None:
+            q.join()
+
+    def close(self) -> None:
+        """A sor kiürítése és a háttérszál leállítása."""
+        with self._queue_lock:
+            q, thread = self._queue, self._thread
+            if q is None or thread is None:
+                return
+            # a később érkező rekordok már közvetlenül íródnak ki
+            self._queue, self._thread = None, None
+            q.put(None)
+        thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "queue_max": self._queue.maxsize if self._queue is not None else 0,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "rotations": self.rotations,
+        }
+
+
+_writer: Optional[RequestLogWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_log_writer() -> RequestLogWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = RequestLogWriter()
+            # leálláskor (ha a FastAPI shutdown nem futott volna) se vesszenek el a sorban lévő rekordok
+            atexit.register(_writer.close)
+        return _writer
+
+
+def close_log_writer() -> None:
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
\ No newline at end of file
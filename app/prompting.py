@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from app.tracing import traced
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# a generáló modell promptjának felső korlátja tokenben (előzmény + kontextus + kérdés)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+# a fennmaradó keretből legfeljebb ekkora hányadot kaphat az előzmény
+PROMPT_HISTORY_SHARE = float(os.getenv("PROMPT_HISTORY_SHARE", "0.25"))
+# ennél kisebb maradék keretbe már nem vágunk be részletet
+PROMPT_MIN_CHUNK_TOKENS = int(os.getenv("PROMPT_MIN_CHUNK_TOKENS", "40"))
+TOKENIZER_MODEL = os.getenv("GENERATION_MODEL", "gpt-4.1-mini")
+# a prompt legfeljebb ennyi előzmény üzenetet használ (a cache kulcsok és a session tár is ehhez igazodik)
+HISTORY_TURNS = 6
+
+PROMPT_TEMPLATE = """
+Te egy RAG-alapú asszisztens vagy.
+Csak a megadott kontextusból válaszolj.
+Ha a válasz nincs benne a kontextusban, mond azt, hogy nem tudod.
+
+ELŐZMÉNYEK (beszélgetés):
+{history}
+
+KONTEXTUS:
+{context}
+
+KÉRDÉS:
+{question}
+
+VÁLASZ (magyarul, tömören, de érthetően):
+"""
+
+TRUNCATION_MARK = " […]"
+
+# mondathatár: írásjel + szóköz, de nem sorszám ("32. mondat") és nem kisbetűs folytatás
+_SENTENCE_END = re.compile(r"(?<=[.!?…])(?<!\d\.)\s+(?![a-záéíóöőúüű])")
+_APPROX_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(TOKENIZER_MODEL)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except (OSError, ValueError) as e:
+        # a kódolási fájlt a tiktoken első használatkor tölti le (hálózati hiba: OSError, sérült
+        # fájl: ValueError); ilyenkor becslünk. A cache miatt ez csak egyszer naplózódik.
+        logger.warning("A tiktoken kódolás nem tölthető be (%s), a tokenszám becsült lesz.", e)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Tokenszám a modell tokenizálójával (tiktoken). Ha a csomag nincs telepítve,
+    becslés: szavanként kb. 4 karakter / token, az írásjelek külön tokenek.
+    Az eredményt nem cache-eljük: a bemenet többnyire egyedi (teljes prompt,
+    előzmény sor), így a cache csak memóriát tartana, találat nélkül.
+    """
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(max(1, math.ceil(len(t) / 4)) for t in _APPROX_TOKEN.findall(text))
+
+
+def _truncate_tokens(text: str, max_tokens: int) -> str:
+    """A szöveg eleje legfeljebb max_tokens tokenben, tokenhatáron vágva."""
+    encoding = _encoding()
+    if encoding is not None:
+        # a vágás egy többbájtos karaktert is kettévághat, ennek a maradéka elhagyható
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]).rstrip("\ufffd")
+    end = used = 0
+    for match in _APPROX_TOKEN.finditer(text):
+        used += max(1, math.ceil(len(match.group()) / 4))
+        if used > max_tokens:
+            break
+        end = match.end()
+    return text[:end]
+
+
+def truncate_to_sentences(text: str, max_tokens: int) -> Optional[str]:
+    """
+    A szöveg eleje, egész mondatokban, legfeljebb max_tokens tokenben. Ha már
+    az első mondat sem fér be (pl. írásjel nélküli táblázat- vagy listaszöveg
+    PDF-ből), azt tokenhatáron vágjuk; None, ha így sem marad belőle semmi.
+    """
+    kept: List[str] = []
+    mark = count_tokens(TRUNCATION_MARK)
+    used = mark
+    for sentence in _SENTENCE_END.split(text.strip()):
+        tokens = count_tokens(sentence + " ")
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    if not kept:
+        head = _truncate_tokens(text.strip(), max_tokens - mark).rstrip()
+        if not head:
+            return None
+        kept.append(head)
+    return " ".join(kept) + TRUNCATION_MARK
+
+
+def _history_line(message: Dict) -> str:
+    role_label = "Felhasználó" if message["role"] == "user" else "Asszisztens"
+    return f"{role_label}: {message['content']}\n"
+
+
+def _context_block(idx: int, context: Dict, text: str) -> str:
+    src = context.get("source_file", "ismeretlen forrás")
+    return f"Részlet #{idx} (forrás: {src}):\n{text}\n\n---\n\n"
+
+
+@dataclass
+class PackedPrompt:
+    prompt: str
+    prompt_tokens: int
+    history_messages: int
+    contexts_packed: int
+    contexts_truncated: int
+    contexts_dropped: int
+
+    def usage(self) -> Dict[str, int]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "history_messages": self.history_messages,
+            "contexts_packed": self.contexts_packed,
+            "contexts_truncated": self.contexts_truncated,
+            "contexts_dropped": self.contexts_dropped,
+        }
+
+
+@traced("build_prompt")
+def pack_prompt(
+        question: str,
+        contexts: List[Dict],
+        history: Optional[List[Dict]] = None,
+        budget: int = PROMPT_TOKEN_BUDGET,
+        history_share: float = PROMPT_HISTORY_SHARE,
+) -> PackedPrompt:
+    """
+    A prompt összeállítása tokenkeretre. A sablon és a kérdés mindig bekerül;
+    a maradékból az előzmény (a legfrissebb üzenetektől visszafelé) legfeljebb
+    history_share hányadot kap, a többit a kontextus. A részletek relevancia
+    szerinti sorrendben (ahogy a rerank adta) mohón kerülnek be: ami egészben
+    nem fér be, azt mondathatáron levágjuk, ami úgy sem, kimarad.
+    """
+    fixed = count_tokens(PROMPT_TEMPLATE.format(history="", context="", question=question))
+    remaining = max(0, budget - fixed)
+
+    history_lines: List[str] = []
+    history_budget = int(remaining * history_share)
+    for message in reversed((history or [])[-HISTORY_TURNS:]):
+        line = _history_line(message)
+        tokens = count_tokens(line)
+        if tokens > history_budget:
+            break
+        history_lines.append(line)
+        history_budget -= tokens
+        remaining -= tokens
+    history_lines.reverse()
+
+    blocks: List[str] = []
+    truncated = dropped = 0
+    for context in contexts:
+        idx = len(blocks) + 1
+        block = _context_block(idx, context, context["text"])
+        tokens = count_tokens(block)
+        if tokens > remaining:
+            overhead = count_tokens(_context_block(idx, context, ""))
+            text = None
+            if remaining - overhead >= PROMPT_MIN_CHUNK_TOKENS:
+                text = truncate_to_sentences(context["text"], remaining - overhead)
+            if text is None:
+                dropped += 1
+                continue
+            block = _context_block(idx, context, text)
+            tokens = count_tokens(block)
+            truncated += 1
+        blocks.append(block)
+        remaining -= tokens
+
+    prompt = PROMPT_TEMPLATE.format(
+        history="".join(history_lines), context="".join(blocks), question=question,
+    ).strip()
+    return PackedPrompt(
+        prompt=prompt,
+        prompt_tokens=count_tokens(prompt),
+        history_messages=len(history_lines),
+        contexts_packed=len(blocks),
+        contexts_truncated=truncated,
+        contexts_dropped=dropped,
+    )
@@ -1,123 +1,830 @@
-import os
-import json
-from typing import List, Dict, Optional, Tuple
-
-from app.vectordb import VectorStore
-from app.openai_client import client
-
-
-def build_prompt(question: str, contexts: List[Dict], history: Optional[List[Dict]]) -> str:
-    
-    history_text = ""
-    if history:
-        for h in history[-6:]:
-            role_label = "Felhasználó" if h["role"] == "user" else "Asszisztens"
-            history_text += f"{role_label}: {h['content']}\n"
-    
-    context_text = ""
-    for idx, c in enumerate(contexts, start=1):
-        src = c.get("source_file", "ismeretlen forrás")
-        context_text += f"Részlet #{idx} (forrás: {src}):\n{c['text']}\n\n---\n\n"
-
-    prompt = f"""
-Te egy RAG-alapú asszisztens vagy. 
-Csak a megadott kontextusból válaszolj.
-Ha a válasz nincs benne a kontextusban, mond azt, hogy nem tudod. 
-
-ELŐZMÉNYEK (beszélgetés):
-{history_text}
-
-KONTEXTUS:
-{context_text}
-
-KÉRDÉS:
-{question}
-
-VÁLASZ (magyarul, tömören, de érthetően):
-"""
-    return prompt.strip()
-
-def rerank_by_llm(question:str, candidates: List[Dict], top_m: int = 3) -> List [Dict]:
-    if not candidates:
-        return []
-        
-    items = []
-    for i, c in enumerate(candidates, start=1):
-        text = c["text"]
-        if len(text) > 400:
-            text = text [:400] + "..."
-        items.append({"id": i, "text": text})
-        
-    chunks_str = ""
-    for it in items:
-        chunks_str += f"ID: {it['id']}\nSzöveg: {it['text']}\n\n"
-
-    prompt_rerank = f"""
-    Értékeld az alábbi szövegrészletek relevanciáját a kérdéshez.
-
-    KÉRDÉS:
-    {question}
-
-    SZÖVEGRÉSZLET:
-    {chunks_str}
-
-    Adj vissza egy JSON listát, ahol minden elem:
-    {{"id": <ID>, "score": <0-1 közötti szám>}}
-
-    Csak a JSON tömböt add vissza, semmi mást. 
-    """
-
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[{"role": "user", "content": prompt_rerank}],
-        temperature=0.0,
-    )
-
-    raw = response.choices[0].message.content.strip()
-    try:
-        scores = json.loads(raw)
-        score_map = {int(item["id"]): float(item["score"]) for item in scores}
-    except Exception:
-        return candidates
-        
-    scored = []
-    for i, c in enumerate(candidates, start =1):
-        s =score_map.get(i,0.0)
-        cc = dict(c)
-        cc["rerank_score"] = s
-        scored.append(cc)
-
-    scored_sorted = sorted(scored, key=lambda x: x["rerank_score"], reverse=True)
-    return scored_sorted[:top_m]
-    
-
-def answer_question(
-        store: VectorStore,
-        question: str,
-        top_k: int = 5,
-        use_chunks: int = 3,
-        history: Optional[List[Dict]] = None,
-        use_rerank: bool = True,
-) -> Tuple[str, List[Dict]]:
-    candidates = store.search(question, top_k=top_k)
-
-    if not candidates:
-        return "Nem találtam releváns információt a dokumentumokban.", []
-    
-    if use_rerank:
-        contexts = rerank_by_llm(question, candidates, top_m=use_chunks)
-    else:
-        contexts = candidates[:use_chunks]
-
-    prompt = build_prompt(question, contexts, history=history)
-
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.2,
-    )
-
-    answer = response.choices[0].message.content.strip()
-    return answer, contexts
+import asyncio
+import os
+import json
+import math
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterator, List, Dict, Optional, Tuple, Union
+
+from app.vectordb import SEARCH_MODE, VectorStore
+from app.openai_client import async_client, client
+from app.prompting import PackedPrompt, pack_prompt
+from app.rerank_cache import candidate_ids, get_rerank_cache, rerank_key
+from app.text_index import tokenize
+from app.tracing import bind, span, trace
+
+RERANK_MODEL = os.getenv("RERANK_MODEL", "gpt-4.1-mini")
+GENERATION_MODEL = os.getenv("GENERATION_MODEL", "gpt-4.1-mini")
+# "sequential" vagy "overlapped" (spekulatív generálás az LLM rerank alatt)
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "sequential")
+PIPELINE_MAX_WORKERS = int(os.getenv("PIPELINE_MAX_WORKERS", "16"))
+# "llm", "lexical", "mmr" vagy "none"; answer_question(use_rerank=True) ezt használja
+DEFAULT_RERANKER = os.getenv("RERANKER", "llm")
+# a lexikális rerankernél a vektoros pontszám súlya (a maradék a BM25-é)
+LEXICAL_VECTOR_WEIGHT = float(os.getenv("LEXICAL_VECTOR_WEIGHT", "0.5"))
+# MMR: relevancia és diverzitás közötti súly (1.0 = csak relevancia)
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+
+
+def build_prompt(question: str, contexts: List[Dict], history: Optional[List[Dict]]) -> str:
+    """A tokenkeretre csomagolt prompt szövege (lásd app.prompting.pack_prompt)."""
+    return pack_prompt(question, contexts, history).prompt
+
+def _parse_rerank_scores(raw: str, point_ids: List[str]) -> Optional[Dict[str, float]]:
+    """A modell által adott sorszám -> pontszám listát point_id -> pontszám térképpé alakítja."""
+    try:
+        scores = json.loads(raw)
+        by_index = {int(item["id"]): float(item["score"]) for item in scores}
+    except Exception:
+        return None
+    return {pid: by_index.get(i, 0.0) for i, pid in enumerate(point_ids, start=1)}
+
+def _apply_rerank_scores(
+        candidates: List[Dict],
+        point_ids: List[str],
+        score_map: Dict[str, float],
+        top_m: int,
+) -> List[Dict]:
+    scored = []
+    for pid, c in zip(point_ids, candidates):
+        cc = dict(c)
+        cc["rerank_score"] = score_map.get(pid, 0.0)
+        scored.append(cc)
+
+    scored_sorted = sorted(scored, key=lambda x: x["rerank_score"], reverse=True)
+    return scored_sorted[:top_m]
+
+def _store_rerank_result(cache, key: str, point_ids: List[str], raw: str) -> Optional[Dict[str, float]]:
+    score_map = _parse_rerank_scores(raw, point_ids)
+    if cache is not None:
+        # a nyers válasz külön kerül a cache-be; hibás JSON esetén a pontszám-cache
+        # üres marad, így a következő kérés újra próbálkozik
+        cache.put_raw(key, raw, parsed=score_map is not None)
+        if score_map is not None:
+            cache.put_scores(key, point_ids, score_map)
+    return score_map
+
+def rerank_by_llm(
+        question:str,
+        candidates: List[Dict],
+        top_m: int = 3,
+        model: str = RERANK_MODEL,
+        use_cache: bool = True,
+) -> List [Dict]:
+    if not candidates:
+        return []
+
+    point_ids = candidate_ids(candidates)
+    cache = get_rerank_cache() if use_cache else None
+    key = rerank_key(question, point_ids, model)
+    score_map = cache.get_scores(key) if cache is not None else None
+    if score_map is None:
+        with span("rerank_llm", model=model, candidates=len(candidates)):
+            raw = _request_rerank(question, candidates, model)
+        score_map = _store_rerank_result(cache, key, point_ids, raw)
+        if score_map is None:
+            return candidates
+
+    return _apply_rerank_scores(candidates, point_ids, score_map, top_m)
+
+async def arerank_by_llm(
+        question: str,
+        candidates: List[Dict],
+        top_m: int = 3,
+        model: str = RERANK_MODEL,
+        use_cache: bool = True,
+) -> List[Dict]:
+    """A rerank_by_llm aszinkron változata (AsyncOpenAI, az event loop blokkolása nélkül)."""
+    if not candidates:
+        return []
+
+    point_ids = candidate_ids(candidates)
+    cache = get_rerank_cache() if use_cache else None
+    key = rerank_key(question, point_ids, model)
+    score_map = cache.get_scores(key) if cache is not None else None
+    if score_map is None:
+        with span("rerank_llm", model=model, candidates=len(candidates)):
+            response = await async_client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": _rerank_prompt(question, candidates)}],
+                temperature=0.0,
+            )
+        raw = response.choices[0].message.content.strip()
+        score_map = _store_rerank_result(cache, key, point_ids, raw)
+        if score_map is None:
+            return candidates
+
+    return _apply_rerank_scores(candidates, point_ids, score_map, top_m)
+
+def _rerank_prompt(question: str, candidates: List[Dict]) -> str:
+    items = []
+    for i, c in enumerate(candidates, start=1):
+        text = c["text"]
+        if len(text) > 400:
+            text = text [:400] + "..."
+        items.append({"id": i, "text": text})
+        
+    chunks_str = ""
+    for it in items:
+        chunks_str += f"ID: {it['id']}\nSzöveg: {it['text']}\n\n"
+
+    prompt_rerank = f"""
+    Értékeld az alábbi szövegrészletek relevanciáját a kérdéshez.
+
+    KÉRDÉS:
+    {question}
+
+    SZÖVEGRÉSZLET:
+    {chunks_str}
+
+    Adj vissza egy JSON listát, ahol minden elem:
+    {{"id": <ID>, "score": <0-1 közötti szám>}}
+
+    Csak a JSON tömböt add vissza, semmi mást. 
+    """
+    return prompt_rerank
+
+def _request_rerank(question: str, candidates: List[Dict], model: str) -> str:
+    response = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": _rerank_prompt(question, candidates)}],
+        temperature=0.0,
+    )
+
+    return response.choices[0].message.content.strip()
+    
+
+def _min_max(values: List[float]) -> List[float]:
+    lo, hi = min(values), max(values)
+    if hi - lo < 1e-12:
+        return [1.0 if hi > 0 else 0.0 for _ in values]
+    return [(v - lo) / (hi - lo) for v in values]
+
+def bm25_scores(question: str, texts: List[str], k1: float = 1.2, b: float = 0.75) -> List[float]:
+    """BM25 pontszám a jelöltek halmazán belül számolt IDF-fel."""
+    docs = [Counter(tokenize(t)) for t in texts]
+    if not docs:
+        return []
+    n_docs = len(docs)
+    lengths = [sum(d.values()) for d in docs]
+    avg_len = (sum(lengths) / n_docs) or 1.0
+
+    scores = [0.0] * n_docs
+    for term in set(tokenize(question)):
+        df = sum(1 for d in docs if term in d)
+        if df == 0:
+            continue
+        idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+        for i, d in enumerate(docs):
+            tf = d.get(term, 0)
+            if tf:
+                scores[i] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[i] / avg_len))
+    return scores
+
+
+class Reranker(ABC):
+    """A vektoros keresés jelöltjeit rendezi újra, és visszaadja a legjobb top_m-et."""
+
+    name: str = ""
+    # lassú (hálózati) reranker: érdemes alatta spekulatívan generálni
+    expensive: bool = False
+
+    @abstractmethod
+    def rerank(self, question: str, candidates: List[Dict], top_m: int = 3) -> List[Dict]:
+        ...
+
+    async def arerank(self, question: str, candidates: List[Dict], top_m: int = 3) -> List[Dict]:
+        """Alapértelmezés: a (CPU-n futó) rerank egy szálon, hogy ne blokkolja az event loopot."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_pipeline_executor, bind(self.rerank, question, candidates, top_m))
+
+
+class NoReranker(Reranker):
+    name = "none"
+
+    def rerank(self, question: str, candidates: List[Dict], top_m: int = 3) -> List[Dict]:
+        return candidates[:top_m]
+
+    async def arerank(self, question: str, candidates: List[Dict], top_m: int = 3) -> List[Dict]:
+        return candidates[:top_m]
+
+
+class LLMReranker(Reranker):
+    name = "llm"
+    expensive = True
+
+    def __init__(self, model: str = RERANK_MODEL, use_cache: bool = True):
+        self.model = model
+        self.use_cache = use_cache
+
+    def rerank(self, question: str, candidates: List[Dict], top_m: int = 3) -> List[Dict]:
+        return rerank_by_llm(question, candidates, top_m=top_m, model=self.model, use_cache=self.use_cache)
+
+    async def arerank(self, question: str, candidates: List[Dict], top_m: int = 3) -> List[Dict]:
+        return await arerank_by_llm(question, candidates, top_m=top_m, model=self.model, use_cache=self.use_cache)
+
+
+class LexicalReranker(Reranker):
+    """
+    Helyi, CPU-n futó reranker: a kérdés és a jelöltek BM25 egyezését
+    kombinálja a vektoros pontszámmal (mindkettőt 0-1 közé normálva).
+    """
+
+    name = "lexical"
+
+    def __init__(self, vector_weight: float = LEXICAL_VECTOR_WEIGHT):
+        self.vector_weight = vector_weight
+
+    def score(self, question: str, candidates: List[Dict]) -> List[float]:
+        if not candidates:
+            return []
+        lexical = _min_max(bm25_scores(question, [c["text"] for c in candidates]))
+        vector = _min_max([float(c.get("score") or 0.0) for c in candidates])
+        w = self.vector_weight
+        return [w * v + (1 - w) * l for v, l in zip(vector, lexical)]
+
+    def rerank(self, question: str, candidates: List[Dict], top_m: int = 3) -> List[Dict]:
+        scored = []
+        for c, s in zip(candidates, self.score(question, candidates)):
+            cc = dict(c)
+            cc["rerank_score"] = s
+            scored.append(cc)
+        scored.sort(key=lambda x: x["rerank_score"], reverse=True)
+        return scored[:top_m]
+
+
+class MMRReranker(LexicalReranker):
+    """
+    Maximal Marginal Relevance: a lexikális + vektoros relevanciát bünteti
+    a már kiválasztott részletekhez való hasonlósággal (szóhalmazok Jaccard
+    hasonlósága), így az átfedő chunkok közül csak egy kerül a promptba.
+    """
+
+    name = "mmr"
+
+    def __init__(self, vector_weight: float = LEXICAL_VECTOR_WEIGHT, mmr_lambda: float = MMR_LAMBDA):
+        super().__init__(vector_weight)
+        self.mmr_lambda = mmr_lambda
+
+    def rerank(self, question: str, candidates: List[Dict], top_m: int = 3) -> List[Dict]:
+        relevance = self.score(question, candidates)
+        token_sets = [set(tokenize(c["text"])) for c in candidates]
+
+        selected: List[int] = []
+        remaining = list(range(len(candidates)))
+        mmr_scores: Dict[int, float] = {}
+        while remaining and len(selected) < top_m:
+            best, best_score = remaining[0], -math.inf
+            for i in remaining:
+                redundancy = max(
+                    (len(token_sets[i] & token_sets[j]) / (len(token_sets[i] | token_sets[j]) or 1)
+                     for j in selected),
+                    default=0.0,
+                )
+                s = self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * redundancy
+                if s > best_score:
+                    best, best_score = i, s
+            selected.append(best)
+            remaining.remove(best)
+            mmr_scores[best] = best_score
+
+        result = []
+        for i in selected:
+            cc = dict(candidates[i])
+            cc["rerank_score"] = mmr_scores[i]
+            result.append(cc)
+        return result
+
+
+# a spekulatív generálás és a párhuzamos szakaszok szálai
+_pipeline_executor = ThreadPoolExecutor(max_workers=PIPELINE_MAX_WORKERS, thread_name_prefix="rag-pipeline")
+
+
+RERANKERS = {
+    "none": NoReranker,
+    "llm": LLMReranker,
+    "lexical": LexicalReranker,
+    "mmr": MMRReranker,
+}
+
+def get_reranker(use_rerank: Union[bool, str, Reranker] = True) -> Reranker:
+    """True -> alapértelmezett (RERANKER), False -> nincs rerank, szöveg -> név szerint."""
+    if isinstance(use_rerank, Reranker):
+        return use_rerank
+    if use_rerank is True:
+        name = DEFAULT_RERANKER
+    elif use_rerank is False or use_rerank is None:
+        name = "none"
+    else:
+        name = str(use_rerank)
+    if name not in RERANKERS:
+        raise ValueError(f"Ismeretlen reranker: {name} (választható: {', '.join(RERANKERS)})")
+    return RERANKERS[name]()
+
+
+NO_CONTEXT_ANSWER = "Nem találtam releváns információt a dokumentumokban."
+
+class _FirstToken:
+    """Callback a generáló hívásnak: megjegyzi az első szövegdarab érkezését (perf_counter)."""
+
+    def __init__(self):
+        self.at: Optional[float] = None
+
+    def __call__(self) -> None:
+        if self.at is None:
+            self.at = time.perf_counter()
+
+
+def generate_answer(
+        prompt: str,
+        model: str = GENERATION_MODEL,
+        on_first_token: Optional[Callable[[], None]] = None,
+) -> str:
+    """A teljes válasz; a háttérben streamként kérjük le, így a /chat is méri az első token idejét."""
+    return "".join(stream_completion(prompt, model, on_first_token)).strip()
+
+def stream_completion(
+        prompt: str,
+        model: str = GENERATION_MODEL,
+        on_first_token: Optional[Callable[[], None]] = None,
+) -> Iterator[str]:
+    """A válasz szövegdarabjai; ha a generátort idő előtt lezárják, a HTTP stream is lezárul."""
+    with span("completion", model=model) as s:
+        stream = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.2,
+            stream=True,
+        )
+        try:
+            for chunk in stream:
+                content = chunk.choices[0].delta.content or ""
+                if content:
+                    if "first_token_sec" not in s.attrs:
+                        s.attrs["first_token_sec"] = round(s.elapsed(), 6)
+                        if on_first_token is not None:
+                            on_first_token()
+                    yield content
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+
+async def agenerate_answer(
+        prompt: str,
+        model: str = GENERATION_MODEL,
+        on_first_token: Optional[Callable[[], None]] = None,
+) -> str:
+    pieces = [piece async for piece in astream_completion(prompt, model, on_first_token)]
+    return "".join(pieces).strip()
+
+async def astream_completion(
+        prompt: str,
+        model: str = GENERATION_MODEL,
+        on_first_token: Optional[Callable[[], None]] = None,
+) -> AsyncIterator[str]:
+    with span("completion", model=model) as s:
+        stream = await async_client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.2,
+            stream=True,
+        )
+        try:
+            async for chunk in stream:
+                content = chunk.choices[0].delta.content or ""
+                if content:
+                    if "first_token_sec" not in s.attrs:
+                        s.attrs["first_token_sec"] = round(s.elapsed(), 6)
+                        if on_first_token is not None:
+                            on_first_token()
+                    yield content
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                await close()
+
+def _usage(packed: PackedPrompt, discarded: Optional[PackedPrompt] = None) -> Dict[str, int]:
+    """A generáló hívás(ok) input tokenjei; spekulációs tévedésnél az eldobott prompt is fizetős volt."""
+    usage = packed.usage()
+    if discarded is not None:
+        usage["prompt_tokens"] += discarded.prompt_tokens
+        usage["discarded_prompt_tokens"] = discarded.prompt_tokens
+    return usage
+
+
+def _set_first_token(
+        timings: Dict[str, Any],
+        start: float,
+        first_token: _FirstToken,
+        not_before: Optional[float] = None,
+) -> None:
+    # spekulációnál a korábban megérkezett token is csak a rerank döntése után használható
+    if first_token.at is None:
+        return
+    at = first_token.at if not_before is None else max(first_token.at, not_before)
+    timings["first_token_sec"] = at - start
+
+
+def _same_contexts(a: List[Dict], b: List[Dict]) -> bool:
+    return {c.get("point_id") or c["text"] for c in a} == {c.get("point_id") or c["text"] for c in b}
+
+def _use_overlap(overlap: Optional[bool], reranker: Reranker) -> bool:
+    # spekulálni csak akkor éri meg, ha a rerank maga is lassú (LLM hívás)
+    if overlap is None:
+        overlap = PIPELINE_MODE == "overlapped"
+    return overlap and reranker.expensive
+
+def _retrieve(store: VectorStore, question: str, top_k: int, timings: Dict[str, float]) -> List[Dict]:
+    # a query_embed a cache-t és a batcher várakozását is tartalmazza, a search a szálra várást is
+    query_vec = None
+    timings["embed_sec"] = 0.0
+    # a BM25 keresés nem használ vektort, fölösleges embedding hívás lenne
+    if SEARCH_MODE != "bm25":
+        with span("query_embed") as embed_span:
+            [query_vec] = store.embed([question])
+        timings["embed_sec"] = embed_span.duration_sec
+    with span("search") as search_span:
+        candidates = store.search(question, top_k=top_k, query_vec=query_vec)
+    timings["search_sec"] = search_span.duration_sec
+    return candidates
+
+
+async def _aretrieve(store: VectorStore, question: str, top_k: int, timings: Dict[str, float]) -> List[Dict]:
+    query_vec = None
+    timings["embed_sec"] = 0.0
+    if SEARCH_MODE != "bm25":
+        with span("query_embed") as embed_span:
+            [query_vec] = await store.aembed([question])
+        timings["embed_sec"] = embed_span.duration_sec
+    with span("search") as search_span:
+        candidates = await store.asearch(question, top_k=top_k, query_vec=query_vec)
+    timings["search_sec"] = search_span.duration_sec
+    return candidates
+
+
+def _rerank(reranker: Reranker, question: str, candidates: List[Dict], top_m: int, timings: Dict[str, float]) -> List[Dict]:
+    with span("rerank", reranker=reranker.name) as s:
+        contexts = reranker.rerank(question, candidates, top_m=top_m)
+    timings["rerank_sec"] = s.duration_sec
+    return contexts
+
+
+async def _arerank(reranker: Reranker, question: str, candidates: List[Dict], top_m: int, timings: Dict[str, float]) -> List[Dict]:
+    with span("rerank", reranker=reranker.name) as s:
+        contexts = await reranker.arerank(question, candidates, top_m=top_m)
+    timings["rerank_sec"] = s.duration_sec
+    return contexts
+
+
+class _SpeculativeStream:
+    """
+    Háttérszálon elindított streaming generálás, amelynek darabjai egy sorba
+    kerülnek. Ha a spekuláció bejön, a sor tartalma (és a folytatás) továbbadható,
+    különben a cancel() lezárja a streamet.
+    """
+
+    _END = object()
+
+    def __init__(self, prompt: str, on_first_token: Optional[Callable[[], None]] = None):
+        self._queue: "queue.Queue" = queue.Queue()
+        self._stop = threading.Event()
+        self.future = _pipeline_executor.submit(bind(self._run, prompt, on_first_token))
+
+    def _run(self, prompt: str, on_first_token: Optional[Callable[[], None]]) -> None:
+        pieces = stream_completion(prompt, on_first_token=on_first_token)
+        try:
+            for piece in pieces:
+                if self._stop.is_set():
+                    break
+                self._queue.put(piece)
+        except Exception as e:
+            self._queue.put(e)
+        finally:
+            pieces.close()
+            self._queue.put(self._END)
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            item = self._queue.get()
+            if item is self._END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def cancel(self) -> None:
+        self._stop.set()
+
+
+class _AsyncSpeculativeStream:
+    """A _SpeculativeStream event loopon futó változata: a generálás egy asyncio task."""
+
+    _END = object()
+
+    def __init__(self, prompt: str):
+        self._queue: "asyncio.Queue" = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(prompt))
+
+    async def _run(self, prompt: str) -> None:
+        try:
+            async for piece in astream_completion(prompt):
+                self._queue.put_nowait(piece)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._queue.put_nowait(e)
+        finally:
+            self._queue.put_nowait(self._END)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        while True:
+            item = await self._queue.get()
+            if item is self._END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def cancel(self) -> None:
+        # a task megszakítása a HTTP streamet is lezárja
+        self._task.cancel()
+
+
+class AnswerStream:
+    """
+    A /chat_stream válasza: iterálva adja a válasz darabjait. A keresés, a
+    rerank és a generálás csak az iterálás közben fut, a végére kitöltődik a
+    contexts, a timings (szakaszonkénti idők másodpercben), a usage (a
+    generáló hívás(ok) prompt tokenjei, a csomagolás adatai) és a speculation
+    ("hit", "miss" vagy "off"), a spans pedig a szakaszok spanjait tartalmazza
+    (app.tracing). Szinkron (for) és aszinkron (async for) módon is
+    olvasható; az utóbbi nem blokkolja az event loopot.
+    """
+
+    def __init__(
+            self,
+            store: VectorStore,
+            question: str,
+            top_k: int = 5,
+            use_chunks: int = 3,
+            history: Optional[List[Dict]] = None,
+            use_rerank: Union[bool, str, Reranker] = True,
+            overlap: Optional[bool] = None,
+    ):
+        self.store = store
+        self.question = question
+        self.top_k = top_k
+        self.use_chunks = use_chunks
+        self.history = history
+        self.reranker = get_reranker(use_rerank)
+        self.overlap = _use_overlap(overlap, self.reranker)
+        self.contexts: List[Dict] = []
+        self.timings: Dict[str, float] = {}
+        self.usage: Dict[str, int] = {}
+        self.spans: List[Dict[str, Any]] = []
+        self.speculation = "off"
+
+    def __iter__(self) -> Iterator[str]:
+        start = time.perf_counter()
+        first_token = None
+        with trace() as current:
+            try:
+                for piece in self._pieces():
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                        self.timings["first_token_sec"] = first_token - start
+                    yield piece
+            finally:
+                self.spans = current.to_list()
+        self.timings["total_sec"] = time.perf_counter() - start
+
+    def _pieces(self) -> Iterator[str]:
+        candidates = _retrieve(self.store, self.question, self.top_k, self.timings)
+        if not candidates:
+            yield NO_CONTEXT_ANSWER
+            return
+
+        speculative = None
+        if self.overlap:
+            spec_contexts = candidates[:self.use_chunks]
+            spec_packed = pack_prompt(self.question, spec_contexts, self.history)
+            speculative = _SpeculativeStream(spec_packed.prompt)
+
+        self.contexts = _rerank(self.reranker, self.question, candidates, self.use_chunks, self.timings)
+
+        if speculative is not None:
+            if _same_contexts(self.contexts, spec_contexts):
+                self.speculation = "hit"
+                self.contexts = spec_contexts
+                self.usage = _usage(spec_packed)
+                try:
+                    yield from speculative
+                finally:
+                    # ha a kliens közben bontja a kapcsolatot, a háttérstream is álljon le
+                    speculative.cancel()
+                return
+            self.speculation = "miss"
+            speculative.cancel()
+
+        t0 = time.perf_counter()
+        packed = pack_prompt(self.question, self.contexts, self.history)
+        prompt = packed.prompt
+        self.timings["prompt_sec"] = time.perf_counter() - t0
+        self.usage = _usage(packed, spec_packed if speculative is not None else None)
+        yield from stream_completion(prompt)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        start = time.perf_counter()
+        first_token = None
+        with trace() as current:
+            try:
+                async for piece in self._apieces():
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                        self.timings["first_token_sec"] = first_token - start
+                    yield piece
+            finally:
+                self.spans = current.to_list()
+        self.timings["total_sec"] = time.perf_counter() - start
+
+    async def _apieces(self) -> AsyncIterator[str]:
+        candidates = await _aretrieve(self.store, self.question, self.top_k, self.timings)
+        if not candidates:
+            yield NO_CONTEXT_ANSWER
+            return
+
+        speculative = None
+        if self.overlap:
+            spec_contexts = candidates[:self.use_chunks]
+            spec_packed = pack_prompt(self.question, spec_contexts, self.history)
+            speculative = _AsyncSpeculativeStream(spec_packed.prompt)
+
+        self.contexts = await _arerank(self.reranker, self.question, candidates, self.use_chunks, self.timings)
+
+        if speculative is not None:
+            if _same_contexts(self.contexts, spec_contexts):
+                self.speculation = "hit"
+                self.contexts = spec_contexts
+                self.usage = _usage(spec_packed)
+                try:
+                    async for piece in speculative:
+                        yield piece
+                finally:
+                    speculative.cancel()
+                return
+            self.speculation = "miss"
+            speculative.cancel()
+
+        t0 = time.perf_counter()
+        packed = pack_prompt(self.question, self.contexts, self.history)
+        prompt = packed.prompt
+        self.timings["prompt_sec"] = time.perf_counter() - t0
+        self.usage = _usage(packed, spec_packed if speculative is not None else None)
+        async for piece in astream_completion(prompt):
+            yield piece
+
+
+def answer_question(
+        store: VectorStore,
+        question: str,
+        top_k: int = 5,
+        use_chunks: int = 3,
+        history: Optional[List[Dict]] = None,
+        use_rerank: Union[bool, str, Reranker] = True,
+        overlap: Optional[bool] = None,
+        timings: Optional[Dict[str, Any]] = None,
+        usage: Optional[Dict[str, int]] = None,
+) -> Tuple[str, List[Dict]]:
+    """
+    use_rerank: True/False, vagy a reranker neve ("llm", "lexical", "mmr", "none").
+    overlap: True esetén a generálás spekulatívan elindul a vektoros top találatokon,
+    amíg az LLM rerank fut; ha a rerank ugyanazt a halmazt választja, ez a válasz
+    marad, különben eldobjuk. None esetén a PIPELINE_MODE beállítás dönt.
+    timings: ha meg van adva, ebbe kerülnek a szakaszonkénti idők, az első válasz token
+    ideje (first_token_sec) és a "speculation".
+    usage: ha meg van adva, ebbe kerül a prompt tokenszáma és a kontextus csomagolásának adatai.
+    """
+    timings = timings if timings is not None else {}
+    usage = usage if usage is not None else {}
+    start = time.perf_counter()
+    reranker = get_reranker(use_rerank)
+    candidates = _retrieve(store, question, top_k, timings)
+
+    if not candidates:
+        return NO_CONTEXT_ANSWER, []
+
+    speculative = None
+    spec_first_token = _FirstToken()
+    if _use_overlap(overlap, reranker):
+        spec_contexts = candidates[:use_chunks]
+        spec_packed = pack_prompt(question, spec_contexts, history)
+        speculative = _SpeculativeStream(spec_packed.prompt, on_first_token=spec_first_token)
+
+    try:
+        contexts = _rerank(reranker, question, candidates, use_chunks, timings)
+    except BaseException:
+        if speculative is not None:
+            speculative.cancel()
+        raise
+
+    answer = None
+    timings["speculation"] = "off"
+    if speculative is not None:
+        if _same_contexts(contexts, spec_contexts):
+            timings["speculation"] = "hit"
+            contexts = spec_contexts
+            usage.update(_usage(spec_packed))
+            decided = time.perf_counter()
+            answer = "".join(speculative).strip()
+            _set_first_token(timings, start, spec_first_token, not_before=decided)
+        else:
+            # a spekulatív stream lezárul, a további output tokenek már nem készülnek el
+            timings["speculation"] = "miss"
+            speculative.cancel()
+
+    if answer is None:
+        t0 = time.perf_counter()
+        packed = pack_prompt(question, contexts, history)
+        prompt = packed.prompt
+        timings["prompt_sec"] = time.perf_counter() - t0
+        usage.update(_usage(packed, spec_packed if speculative is not None else None))
+
+        first_token = _FirstToken()
+        t0 = time.perf_counter()
+        answer = generate_answer(prompt, on_first_token=first_token)
+        timings["generate_sec"] = time.perf_counter() - t0
+        _set_first_token(timings, start, first_token)
+
+    timings["total_sec"] = time.perf_counter() - start
+    return answer, contexts
+
+
+async def aanswer_question(
+        store: VectorStore,
+        question: str,
+        top_k: int = 5,
+        use_chunks: int = 3,
+        history: Optional[List[Dict]] = None,
+        use_rerank: Union[bool, str, Reranker] = True,
+        overlap: Optional[bool] = None,
+        timings: Optional[Dict[str, Any]] = None,
+        usage: Optional[Dict[str, int]] = None,
+) -> Tuple[str, List[Dict]]:
+    """Az answer_question aszinkron változata; a spekulatív generálás itt egy asyncio task."""
+    timings = timings if timings is not None else {}
+    usage = usage if usage is not None else {}
+    start = time.perf_counter()
+    reranker = get_reranker(use_rerank)
+    candidates = await _aretrieve(store, question, top_k, timings)
+
+    if not candidates:
+        return NO_CONTEXT_ANSWER, []
+
+    speculative = None
+    spec_first_token = _FirstToken()
+    if _use_overlap(overlap, reranker):
+        spec_contexts = candidates[:use_chunks]
+        spec_packed = pack_prompt(question, spec_contexts, history)
+        speculative = asyncio.create_task(agenerate_answer(spec_packed.prompt, on_first_token=spec_first_token))
+
+    try:
+        contexts = await _arerank(reranker, question, candidates, use_chunks, timings)
+    except BaseException:
+        if speculative is not None:
+            speculative.cancel()
+        raise
+
+    answer = None
+    timings["speculation"] = "off"
+    if speculative is not None:
+        if _same_contexts(contexts, spec_contexts):
+            timings["speculation"] = "hit"
+            contexts = spec_contexts
+            usage.update(_usage(spec_packed))
+            decided = time.perf_counter()
+            answer = await speculative
+            _set_first_token(timings, start, spec_first_token, not_before=decided)
+        else:
+            timings["speculation"] = "miss"
+            speculative.cancel()
+
+    if answer is None:
+        t0 = time.perf_counter()
+        packed = pack_prompt(question, contexts, history)
+        prompt = packed.prompt
+        timings["prompt_sec"] = time.perf_counter() - t0
+        usage.update(_usage(packed, spec_packed if speculative is not None else None))
+
+        first_token = _FirstToken()
+        t0 = time.perf_counter()
+        answer = await agenerate_answer(prompt, on_first_token=first_token)
+        timings["generate_sec"] = time.perf_counter() - t0
+        _set_first_token(timings, start, first_token)
+
+    timings["total_sec"] = time.perf_counter() - start
+    return answer, contexts
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from app.cache import LRUCache, normalize_question
+from app.vectordb import VectorStore, content_hash
+
+RERANK_CACHE_ENABLED = os.getenv("RERANK_CACHE_ENABLED", "1") == "1"
+RERANK_CACHE_MAX_ITEMS = int(os.getenv("RERANK_CACHE_MAX_ITEMS", "5000"))
+RERANK_CACHE_TTL_SEC = float(os.getenv("RERANK_CACHE_TTL_SEC", str(6 * 3600)))
+
+
+def candidate_ids(candidates: List[Dict]) -> List[str]:
+    # a pontazonosító a chunk tartalmából képződik; ha nincs, a szöveg hash-e helyettesíti
+    return [str(c.get("point_id") or content_hash(c["text"])) for c in candidates]
+
+
+def rerank_key(question: str, point_ids: List[str], model: str) -> str:
+    # a sorrend is számít, mert a prompt sorszámokkal hivatkozik a jelöltekre
+    raw = "\0".join([model, normalize_question(question), *point_ids])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class RerankCache:
+    """
+    Az LLM-es rerank eredményeinek cache-e (kérdés + jelöltek + modell).
+    A feldolgozott pontszámok (point_id -> score) és a nyers modellválaszok
+    külön tárolódnak: hibás JSON válasz esetén csak a nyers szöveg kerül
+    be (diagnosztikához), így a következő kérés újra megpróbálja a rerankot.
+    Ha bármelyik jelölt chunk megváltozik, az érintett bejegyzések törlődnek.
+    """
+
+    def __init__(self, max_items: int = RERANK_CACHE_MAX_ITEMS, ttl_sec: float = RERANK_CACHE_TTL_SEC):
+        self._lock = threading.RLock()
+        self._scores = LRUCache(max_items=max_items, ttl_sec=ttl_sec, on_evict=self._on_evict)
+        self._raw = LRUCache(max_items=max_items, ttl_sec=ttl_sec)
+        # point_id -> a rá hivatkozó cache kulcsok
+        self._by_point: Dict[str, set] = {}
+        self._stores: List[int] = []
+        self.parse_failures = 0
+
+    def attach(self, store: VectorStore) -> None:
+        """Feliratkozás a vektortár változásaira (többször hívva is csak egyszer)."""
+        with self._lock:
+            if id(store) in self._stores:
+                return
+            self._stores.append(id(store))
+        store.add_listener(self._on_documents_changed)
+
+    def get_scores(self, key: str) -> Optional[Dict[str, float]]:
+        # a lejárt bejegyzést a get az _on_evict-tel takarítja: a zárolási sorrend itt is ugyanaz, mint a put-nál
+        with self._lock:
+            return self._scores.get(key)
+
+    def put_scores(self, key: str, point_ids: List[str], scores: Dict[str, float]) -> None:
+        with self._lock:
+            self._scores.set(key, scores)
+            for pid in point_ids:
+                self._by_point.setdefault(pid, set()).add(key)
+
+    def put_raw(self, key: str, raw: str, parsed: bool) -> None:
+        if not parsed:
+            with self._lock:
+                self.parse_failures += 1
+        self._raw.set(key, {"raw": raw, "parsed": parsed})
+
+    def get_raw(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._raw.get(key)
+
+    def invalidate_points(self, point_ids: List[str]) -> int:
+        removed = 0
+        with self._lock:
+            for pid in point_ids:
+                for key in self._by_point.pop(pid, set()):
+                    if self._scores.pop(key) is not None:
+                        removed += 1
+                    self._raw.pop(key)
+        return removed
+
+    def _on_documents_changed(self, doc_id: str, point_ids: List[str]) -> None:
+        self.invalidate_points(point_ids)
+
+    def _on_evict(self, key: str, scores: Dict[str, float]) -> None:
+        with self._lock:
+            for pid in scores:
+                keys = self._by_point.get(pid)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._by_point[pid]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scores.clear()
+            self._raw.clear()
+            self._by_point.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._scores.stats()
+        stats["raw_size"] = len(self._raw)
+        stats["parse_failures"] = self.parse_failures
+        return stats
+
+
+_cache: Optional[RerankCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_rerank_cache() -> Optional[RerankCache]:
+    global _cache
+    if not RERANK_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = RerankCache()
+        return _cache
@@ -0,0 +1,295 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.prompting import HISTORY_TURNS
+
+# memory | sqlite (a sqlite túléli az újraindítást, és több uvicorn worker is osztozhat rajta)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_DB_PATH = Path(os.getenv("SESSION_DB_PATH", "data/cache/sessions.sqlite"))
+# sessiononként legfeljebb ennyi üzenet marad meg (a build_prompt is csak ennyit használ)
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", str(HISTORY_TURNS)))
+# ennyi tétlenség után a session törlődik
+SESSION_IDLE_TTL_SEC = float(os.getenv("SESSION_IDLE_TTL_SEC", str(2 * 3600)))
+# az összes session szövegének felső korlátja; felette a legrégebben használtak törlődnek
+SESSION_MEMORY_BUDGET_BYTES = int(os.getenv("SESSION_MEMORY_BUDGET_BYTES", str(64 * 1024 * 1024)))
+# a lejárt sessionök takarítása legfeljebb ilyen gyakran fut
+SESSION_PURGE_INTERVAL_SEC = 60.0
+
+
+def _messages_size(messages: List[Dict]) -> int:
+    return sum(len(m["content"].encode("utf-8")) + len(m["role"]) for m in messages)
+
+
+class SessionStore(ABC):
+    """
+    A beszélgetések előzményeinek tárolója. Sessiononként csak az utolsó
+    `max_messages` üzenet marad meg, a tétlen sessionök `idle_ttl_sec` után
+    lejárnak, az összméret pedig nem nőhet a `budget_bytes` fölé.
+    """
+
+    name: str = "base"
+
+    def __init__(
+            self,
+            max_messages: int = SESSION_MAX_MESSAGES,
+            idle_ttl_sec: float = SESSION_IDLE_TTL_SEC,
+            budget_bytes: int = SESSION_MEMORY_BUDGET_BYTES,
+    ):
+        self.max_messages = max_messages
+        self.idle_ttl_sec = idle_ttl_sec
+        self.budget_bytes = budget_bytes
+        self.expired = 0
+        self.evicted = 0
+
+    @abstractmethod
+    def get(self, session_id: str) -> List[Dict]:
+        """A session előzményei (másolat); ismeretlen vagy lejárt session esetén üres lista."""
+
+    @abstractmethod
+    def append(self, session_id: str, messages: List[Dict]) -> None:
+        """Üzenetek hozzáfűzése, a session végének levágása és a globális limit érvényesítése."""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        """A tétlen sessionök törlése; a törölt sessionök számát adja vissza."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        ...
+
+
+class MemorySessionStore(SessionStore):
+    """Folyamaton belüli tároló: OrderedDict a használat sorrendjében (LRU)."""
+
+    name = "memory"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        # session_id -> (utolsó használat, üzenetek, méret bájtban)
+        self._sessions: "OrderedDict[str, Tuple[float, List[Dict], int]]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, session_id: str) -> List[Dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            last_used, messages, size = entry
+            if now - last_used > self.idle_ttl_sec:
+                self._remove_locked(session_id)
+                self.expired += 1
+                return []
+            self._sessions.move_to_end(session_id)
+            return list(messages)
+
+    def append(self, session_id: str, messages: List[Dict]) -> None:
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is not None and now - entry[0] > self.idle_ttl_sec:
+                self.expired += 1
+                entry = None
+            history = entry[1] if entry is not None else []
+            if entry is not None:
+                self._bytes -= entry[2]
+
+            history = (history + [dict(m) for m in messages])[-self.max_messages:]
+            size = _messages_size(history)
+            self._sessions[session_id] = (now, history, size)
+            self._bytes += size
+
+            self._purge_locked(now)
+            # a legrégebben használt sessionök kiesnek, amíg a limit alá nem érünk
+            # (az éppen frissített session a sor végén van, az marad)
+            while self._bytes > self.budget_bytes and len(self._sessions) > 1:
+                oldest = next(iter(self._sessions))
+                self._remove_locked(oldest)
+                self.evicted += 1
+
+    def _remove_locked(self, session_id: str) -> None:
+        entry = self._sessions.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _purge_locked(self, now: float) -> int:
+        # a sor elején vannak a legrégebben használtak, az első friss elemnél megállunk
+        removed = 0
+        while self._sessions:
+            session_id, (last_used, _, _) = next(iter(self._sessions.items()))
+            if now - last_used <= self.idle_ttl_sec:
+                break
+            self._remove_locked(session_id)
+            removed += 1
+        self.expired += removed
+        return removed
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._remove_locked(session_id)
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._purge_locked(time.time())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "budget_bytes": self.budget_bytes,
+                "max_messages": self.max_messages,
+                "idle_ttl_sec": self.idle_ttl_sec,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    SQLite alapú tároló (WAL módban): a sessionök túlélik az újraindítást,
+    és ugyanazt a fájlt használó uvicorn workerek között is közösek.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: Path = SESSION_DB_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                messages TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_used ON sessions(last_used)")
+        self._conn.commit()
+
+    def get(self, session_id: str) -> List[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT messages, last_used FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return []
+            if time.time() - row[1] > self.idle_ttl_sec:
+                self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._conn.commit()
+                self.expired += 1
+                return []
+            return json.loads(row[0])
+
+    def append(self, session_id: str, messages: List[Dict]) -> None:
+        now = time.time()
+        with self._lock:
+            # az olvasás és az írás egy tranzakcióban, hogy a párhuzamos workerek ne írják felül egymást
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT messages, last_used FROM sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                history = []
+                if row is not None and now - row[1] <= self.idle_ttl_sec:
+                    history = json.loads(row[0])
+
+                history = (history + [dict(m) for m in messages])[-self.max_messages:]
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, messages, size_bytes, last_used) "
+                    "VALUES (?, ?, ?, ?)",
+                    (session_id, json.dumps(history, ensure_ascii=False), _messages_size(history), now),
+                )
+                if now - self._last_purge >= SESSION_PURGE_INTERVAL_SEC:
+                    self._purge_locked(now)
+                    self._last_purge = now
+                self._evict_locked(session_id)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def _purge_locked(self, now: float) -> int:
+        cur = self._conn.execute("DELETE FROM sessions WHERE last_used < ?", (now - self.idle_ttl_sec,))
+        self.expired += cur.rowcount
+        return cur.rowcount
+
+    def _evict_locked(self, keep: str) -> None:
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM sessions").fetchone()
+        if total <= self.budget_bytes:
+            return
+        # a legrégebben használt sessionöket töröljük, amíg a limit alá nem érünk
+        to_delete = []
+        rows = self._conn.execute(
+            "SELECT session_id, size_bytes FROM sessions WHERE session_id != ? ORDER BY last_used ASC", (keep,)
+        )
+        for session_id, size in rows:
+            if total <= self.budget_bytes:
+                break
+            to_delete.append((session_id,))
+            total -= size
+        self._conn.executemany("DELETE FROM sessions WHERE session_id = ?", to_delete)
+        self.evicted += len(to_delete)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            removed = self._purge_locked(time.time())
+            self._conn.commit()
+            return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM sessions"
+            ).fetchone()
+        return {
+            "backend": self.name,
+            "sessions": count,
+            "bytes": total,
+            "budget_bytes": self.budget_bytes,
+            "max_messages": self.max_messages,
+            "idle_ttl_sec": self.idle_ttl_sec,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+SESSION_BACKENDS = {
+    "memory": MemorySessionStore,
+    "sqlite": SqliteSessionStore,
+}
+
+
+def make_session_store(backend: Optional[str] = None, **kwargs) -> SessionStore:
+    backend = backend or SESSION_BACKEND
+    if backend not in SESSION_BACKENDS:
+        raise ValueError(f"Ismeretlen session backend: {backend} (lehetséges: {', '.join(SESSION_BACKENDS)})")
+    return SESSION_BACKENDS[backend](**kwargs)
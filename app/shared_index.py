@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from app.text_index import InvertedIndex
+from app.vector_backends import MmapBackend, write_mmap_index
+from app.vectordb import VectorStore
+
+# ha meg van adva, a workerek egy közös, csak olvasható indexet használnak ebből a könyvtárból
+# (uvicorn --workers N esetén); üresen minden folyamatnak saját vektortára van
+SHARED_INDEX_DIR = os.getenv("SHARED_INDEX_DIR", "")
+# ilyen gyakran nézik meg a workerek, van-e új generáció (és az író a beérkezett feltöltéseket)
+SHARED_INDEX_POLL_SEC = float(os.getenv("SHARED_INDEX_POLL_SEC", "1.0"))
+# a befejezett indexelések közzététele összevonva történik: amíg van futó vagy várakozó feladat,
+# legfeljebb ennyi másodpercet vár az író, utána akkor is új generációt tesz közzé
+SHARED_INDEX_PUBLISH_MAX_DELAY_SEC = float(os.getenv("SHARED_INDEX_PUBLISH_MAX_DELAY_SEC", "30"))
+# ennyi legutóbbi generáció marad meg (a régebbieket még olvashatja egy lassú worker)
+SHARED_INDEX_KEEP_GENERATIONS = int(os.getenv("SHARED_INDEX_KEEP_GENERATIONS", "3"))
+
+CURRENT_FILE = "CURRENT"
+WRITER_LOCK_FILE = "writer.lock"
+
+
+def _generation_name(generation: int) -> str:
+    return f"gen-{generation:08d}"
+
+
+def _try_lock(f) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _write_text_atomic(path: Path, text: str) -> None:
+    tmp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _write_json_atomic(path: Path, obj: Any) -> None:
+    _write_text_atomic(path, json.dumps(obj, ensure_ascii=False))
+
+
+class SharedIndex:
+    """
+    Több uvicorn worker közös indexe. Egyetlen író folyamat (amelyik megszerzi
+    a writer.lock zárat) építi az indexet, és az indexelések után új
+    generációt tesz közzé: a gen-XXXXXXXX könyvtár teljes kiírása után a
+    CURRENT fájl atomikus cseréjével. Mivel egy generáció kiírása a teljes
+    index méretével arányos, az egymás után befejezett feladatok egyetlen
+    generációba kerülnek (request_publish / publish_pending). A többi worker a generációt
+    memory-mapelve, csak olvasva használja, és újraindítás nélkül átvált az
+    újabbra. A nem író workerekhez érkező feltöltések az inbox könyvtáron
+    keresztül jutnak el az íróhoz, a feladatok állapota a jobs könyvtárban látszik.
+    """
+
+    def __init__(self, root: Path, poll_sec: float = SHARED_INDEX_POLL_SEC):
+        self.root = root
+        self.poll_sec = poll_sec
+        self.inbox_dir = root / "inbox"
+        self.jobs_dir = root / "jobs"
+        for directory in (root, self.inbox_dir, self.jobs_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+        self.is_writer = False
+        self.generation: Optional[int] = None
+        self.refreshes = 0
+        self.last_error: Optional[str] = None
+        self._lock_file = None
+        self._publish_lock = threading.Lock()
+        # az első még közzé nem tett változás ideje (time.monotonic), None: nincs függő változás
+        self._publish_requested_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- író szerep ---
+
+    def try_acquire_writer(self) -> bool:
+        """Nem blokkoló kísérlet az író szerep megszerzésére; a zár a folyamat végéig él."""
+        if self.is_writer:
+            return True
+        f = (self.root / WRITER_LOCK_FILE).open("a+b")
+        if not _try_lock(f):
+            f.close()
+            return False
+        self._lock_file = f
+        self.is_writer = True
+        return True
+
+    def current_generation(self) -> Optional[int]:
+        try:
+            name = (self.root / CURRENT_FILE).read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return None
+        return int(name.rsplit("-", 1)[1])
+
+    def request_publish(self) -> None:
+        """A vektortár megváltozott; a közzétételt a publish_pending végzi, összevonva."""
+        with self._publish_lock:
+            if self._publish_requested_at is None:
+                self._publish_requested_at = time.monotonic()
+
+    def publish_pending(
+            self,
+            store: VectorStore,
+            idle: bool,
+            max_delay_sec: float = SHARED_INDEX_PUBLISH_MAX_DELAY_SEC,
+    ) -> Optional[int]:
+        """
+        Függő változás esetén új generáció, ha az író tétlen (nincs futó vagy
+        várakozó feladat), vagy a legrégebbi függő változás óta eltelt
+        max_delay_sec (hosszú tömeges betöltésnél se maradjanak le az olvasók).
+        """
+        requested_at = self._publish_requested_at
+        if requested_at is None:
+            return None
+        if not idle and time.monotonic() - requested_at < max_delay_sec:
+            return None
+        return self.publish(store)
+
+    def publish(self, store: VectorStore) -> int:
+        """A vektortár teljes tartalmát új generációként közzéteszi. Visszaadja a generáció számát."""
+        if not self.is_writer:
+            raise RuntimeError("Csak az író folyamat tehet közzé új index generációt.")
+
+        with self._publish_lock:
+            # az ezután érkező változások már új közzétételt kérnek
+            self._publish_requested_at = None
+            generation = (self.current_generation() or 0) + 1
+            final_dir = self.root / _generation_name(generation)
+            tmp_dir = self.root / (_generation_name(generation) + ".tmp")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+            # a tár zárolása csak rövid szakaszokra: a pillanatnyi állapot rögzítésére és batchenként
+            # a pontok másolására; a BM25 és a manifest kiírása már zárolás nélkül fut
+            with store._lock:
+                version = store.version
+                total = store.backend.count()
+                text_index = store.text_index
+                # a DocumentSync a dokumentum bejegyzését egészében cseréli, így a sekély másolat elég
+                documents = dict(store.documents)
+
+            ids: List[Any] = []
+            payloads: List[Dict] = []
+            # egyetlen előre lefoglalt mátrix: a batchek listája és az összefűzés nem kétszerezi a memóriát
+            matrix = np.empty((total, store.dim), dtype=np.float32)
+            points = store.backend.iter_points()
+            while len(ids) < total:
+                with store._lock:
+                    batch = next(points, None)
+                    if batch is None:
+                        break
+                    batch_ids, batch_payloads, batch_vectors = batch
+                    n = min(len(batch_ids), total - len(ids))
+                    matrix[len(ids):len(ids) + n] = batch_vectors[:n]
+                ids.extend(batch_ids[:n])
+                payloads.extend(batch_payloads[:n])
+            matrix = matrix[:len(ids)]
+            bm25 = text_index.export()
+
+            if store.version != version:
+                # a másolás közben változott a tár (egy pont kimaradhatott vagy kétszer szerepelhet):
+                # a duplikátumok nélkül közzétesszük, a következő generáció pedig a teljes állapotot adja
+                self._publish_requested_at = time.monotonic()
+                first = {}
+                for i, pid in enumerate(ids):
+                    first.setdefault(pid, i)
+                if len(first) < len(ids):
+                    keep = sorted(first.values())
+                    ids = [ids[i] for i in keep]
+                    payloads = [payloads[i] for i in keep]
+                    matrix = matrix[keep]
+
+            InvertedIndex.write(tmp_dir / "bm25.npz", bm25)
+            write_mmap_index(tmp_dir, store.dim, ids, payloads, matrix)
+            (tmp_dir / "manifest.json").write_text(
+                json.dumps({"generation": generation, "created_at": time.time(), "documents": documents},
+                           ensure_ascii=False),
+                encoding="utf-8",
+            )
+
+            # a könyvtár csak teljesen kiírva kapja meg a végleges nevét, utána vált a CURRENT
+            os.replace(tmp_dir, final_dir)
+            _write_text_atomic(self.root / CURRENT_FILE, _generation_name(generation))
+            self.generation = generation
+            self._remove_old_generations(generation)
+            return generation
+
+    def _remove_old_generations(self, current: int) -> None:
+        for path in self.root.glob("gen-*"):
+            if path.suffix == ".tmp":
+                continue
+            generation = int(path.name.rsplit("-", 1)[1])
+            if generation <= current - SHARED_INDEX_KEEP_GENERATIONS:
+                # a még mapelt fájlok törlése Linuxon biztonságos, a régi olvasók tovább látják őket
+                shutil.rmtree(path, ignore_errors=True)
+
+    # --- olvasó oldal ---
+
+    def open_generation(self, generation: int) -> Tuple[MmapBackend, InvertedIndex, Dict[str, Dict]]:
+        directory = self.root / _generation_name(generation)
+        manifest = json.loads((directory / "manifest.json").read_text(encoding="utf-8"))
+        return MmapBackend(directory), InvertedIndex.load(directory / "bm25.npz"), manifest["documents"]
+
+    def refresh(self, store: VectorStore) -> bool:
+        """Ha van újabb generáció, a store átvált rá. Igazat ad vissza, ha történt váltás."""
+        generation = self.current_generation()
+        if generation is None or generation == self.generation:
+            return False
+        backend, text_index, documents = self.open_generation(generation)
+        store.replace_index(backend, text_index, documents)
+        self.generation = generation
+        self.refreshes += 1
+        return True
+
+    def restore(self, store: VectorStore) -> int:
+        """Üres író vektortár feltöltése a legutóbbi generációból (embedding hívások nélkül)."""
+        generation = self.current_generation()
+        if generation is None:
+            return 0
+        backend, _, documents = self.open_generation(generation)
+        ids: List[Any] = []
+        payloads: List[Dict] = []
+        vectors: List[np.ndarray] = []
+        for batch_ids, batch_payloads, batch_vectors in backend.iter_points():
+            ids.extend(batch_ids)
+            payloads.extend(batch_payloads)
+            vectors.append(batch_vectors)
+        if not ids:
+            return 0
+        self.generation = generation
+        return store.import_points(ids, payloads, np.concatenate(vectors), documents)
+
+    # --- feltöltések és feladatállapotok a workerek között ---
+
+    def enqueue_upload(self, job_id: str, path: Path) -> None:
+        _write_json_atomic(self.inbox_dir / f"{job_id}.json", {"job_id": job_id, "path": str(path)})
+
+    def take_uploads(self) -> List[Tuple[str, Path]]:
+        uploads = []
+        for entry in sorted(self.inbox_dir.glob("*.json"), key=lambda p: p.stat().st_mtime):
+            try:
+                data = json.loads(entry.read_text(encoding="utf-8"))
+                entry.unlink()
+            except (FileNotFoundError, ValueError):
+                continue
+            uploads.append((data["job_id"], Path(data["path"])))
+        return uploads
+
+    def write_job_status(self, status: Dict[str, Any]) -> None:
+        _write_json_atomic(self.jobs_dir / f"{status['job_id']}.json", status)
+
+    def read_job_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        path = self.jobs_dir / f"{Path(job_id).name}.json"
+        if path.exists():
+            return json.loads(path.read_text(encoding="utf-8"))
+        if (self.inbox_dir / f"{Path(job_id).name}.json").exists():
+            return {"job_id": job_id, "status": "queued", "stage": "queued"}
+        return None
+
+    def prune_job_statuses(self, keep_ids: set) -> None:
+        for path in self.jobs_dir.glob("*.json"):
+            if path.stem not in keep_ids:
+                path.unlink(missing_ok=True)
+
+    def list_job_statuses(self) -> List[Dict[str, Any]]:
+        statuses = []
+        for path in sorted(self.jobs_dir.glob("*.json"), key=lambda p: p.stat().st_mtime):
+            try:
+                statuses.append(json.loads(path.read_text(encoding="utf-8")))
+            except (FileNotFoundError, ValueError):
+                continue
+        return statuses
+
+    # --- háttérszál ---
+
+    def start(self, callback: Callable[[], None]) -> None:
+        """A callback poll_sec másodpercenként lefut egy háttérszálon (generációváltás, inbox)."""
+        if self._thread is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(self.poll_sec):
+                try:
+                    callback()
+                    self.last_error = None
+                except Exception as e:
+                    # egy félbemaradt generáció vagy fájlhiba miatt ne álljon le a figyelés
+                    self.last_error = str(e)
+
+        self._thread = threading.Thread(target=loop, name="shared-index", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "root": str(self.root),
+            "role": "writer" if self.is_writer else "reader",
+            "pid": os.getpid(),
+            "generation": self.generation,
+            "published_generation": self.current_generation(),
+            "refreshes": self.refreshes,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app.cache import history_key, normalize_question
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1") == "1"
+
+
+def flight_key(question: str, history: Optional[List[Dict]], *options: Any) -> str:
+    """Azonos normalizált kérdés + azonos előzmény (+ azonos beállítások) -> azonos kulcs."""
+    return "\0".join([history_key(history), normalize_question(question), *map(str, options)])
+
+
+class SingleFlight:
+    """
+    Az azonos kulcsú, egyszerre futó hívások egyetlen upstream számítást
+    osztanak meg: az első hívó indítja, a többiek ugyanarra az eredményre
+    (vagy kivételre) várnak. A befejezés után a kulcs felszabadul.
+    Az event loopon belül használható (nincs szálak közötti zárolás).
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> "tuple[Any, bool]":
+        """Visszaadja az eredményt és azt, hogy egy már futó számításhoz csatlakoztunk-e."""
+        task = self._inflight.get(key)
+        joined = task is not None
+        if joined:
+            self.followers += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+        # ha egy várakozó kliens megszakad, a közös számítás fusson tovább a többieknek
+        return await asyncio.shield(task), joined
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"inflight": len(self._inflight), "leaders": self.leaders, "followers": self.followers}
+
+
+class _Broadcast:
+    """
+    Egy upstream stream darabjai, minden feliratkozónak az elejétől visszajátszva.
+    Az upstream csak az első ténylegesen olvasó feliratkozóval indul.
+    """
+
+    def __init__(self, source: Any, on_done: Callable[["_Broadcast"], None]):
+        self.source = source
+        self.pieces: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._pump())
+            self.task.add_done_callback(lambda t: self._on_done(self))
+
+    async def _pump(self) -> None:
+        try:
+            async for piece in self.source:
+                self.pieces.append(piece)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def iterate(self) -> AsyncIterator[str]:
+        pos = 0
+        while True:
+            # a később csatlakozók a már megkapott darabokat is megkapják
+            while pos < len(self.pieces):
+                yield self.pieces[pos]
+                pos += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class StreamFlight:
+    """
+    Streamelt válaszok összevonása: azonos kulcsnál egyetlen upstream stream
+    fut, amelynek darabjai minden feliratkozóhoz eljutnak. Ha minden
+    feliratkozó lekapcsolódik, az upstream is leáll.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, _Broadcast] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def subscribe(self, key: str, factory: Callable[[], Any]) -> "Subscription":
+        broadcast = self._inflight.get(key)
+        joined = broadcast is not None and not broadcast.done
+        if joined:
+            self.followers += 1
+        else:
+            self.leaders += 1
+            broadcast = _Broadcast(factory(), on_done=lambda b, k=key: self._forget(k, b))
+            self._inflight[key] = broadcast
+        return Subscription(self, key, broadcast, joined)
+
+    def _forget(self, key: str, broadcast: _Broadcast) -> None:
+        if self._inflight.get(key) is broadcast:
+            del self._inflight[key]
+
+    def _discard(self, key: str, broadcast: _Broadcast) -> None:
+        # a még el nem indult, olvasó nélküli upstream ne maradjon a futók között
+        if broadcast.task is None and broadcast.subscribers == 0:
+            self._forget(key, broadcast)
+
+    def stats(self) -> Dict[str, int]:
+        return {"inflight": len(self._inflight), "leaders": self.leaders, "followers": self.followers}
+
+
+class Subscription:
+    """
+    Egy kliens feliratkozása: async for-ral olvasható, a source pedig az
+    upstream objektum (pl. AnswerStream), amelyből a befejezés után a
+    kontextus és a mérések kiolvashatók.
+    """
+
+    def __init__(self, flight: StreamFlight, key: str, broadcast: _Broadcast, joined: bool):
+        self._flight = flight
+        self._key = key
+        self._broadcast = broadcast
+        self.joined = joined
+
+    @property
+    def source(self) -> Any:
+        return self._broadcast.source
+
+    def close(self) -> None:
+        """Olvasás nélkül eldobott feliratkozás (pl. hiba vagy lekapcsolódás a válasz indulása előtt)."""
+        self._flight._discard(self._key, self._broadcast)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        # a számláló csak az olvasással nő (az első await előtt), a finally pedig csak ekkor fut le;
+        # a soha el nem kezdett olvasás így nem tarthat életben egy upstreamet
+        self._broadcast.subscribers += 1
+        self._broadcast.start()
+        try:
+            async for piece in self._broadcast.iterate():
+                yield piece
+        finally:
+            self._broadcast.subscribers -= 1
+            if self._broadcast.subscribers == 0 and not self._broadcast.done:
+                self._broadcast.task.cancel()
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import json
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+# Fájlformátum (little-endian):
+#   MAGIC (8 bájt)
+#   fejléc: verzió, dimenzió, pontszám, ids_len, payloads_len, manifest_len
+#   ids       - zlib-tömörített JSON lista
+#   payloads  - zlib-tömörített JSON lista
+#   manifest  - zlib-tömörített JSON objektum
+#   vektorok  - count * dim darab float32, sorfolytonosan
+MAGIC = b"RAGSNAP\x00"
+VERSION = 1
+_HEADER = struct.Struct("<IIQQQQ")
+
+
+def _pack_json(obj: Any) -> bytes:
+    return zlib.compress(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def _unpack_json(blob: bytes) -> Any:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+def write_snapshot(
+        path: Path,
+        dim: int,
+        ids: List[Any],
+        payloads: List[Dict],
+        vectors: np.ndarray,
+        manifest: Dict[str, Any],
+) -> int:
+    """
+    Atomikusan kiírja a pillanatképet (ideiglenes fájl + átnevezés).
+    Visszaadja a fájl méretét bájtban.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(ids), dim)
+    ids_blob = _pack_json(ids)
+    payloads_blob = _pack_json(payloads)
+    manifest_blob = _pack_json(manifest)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("wb") as f:
+        f.write(MAGIC)
+        f.write(_HEADER.pack(VERSION, dim, len(ids), len(ids_blob), len(payloads_blob), len(manifest_blob)))
+        f.write(ids_blob)
+        f.write(payloads_blob)
+        f.write(manifest_blob)
+        f.write(vectors.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path.stat().st_size
+
+
+def read_snapshot(path: Path) -> Tuple[int, List[Any], List[Dict], np.ndarray, Dict[str, Any]]:
+    with path.open("rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Nem érvényes snapshot fájl: {path}")
+        version, dim, count, ids_len, payloads_len, manifest_len = _HEADER.unpack(f.read(_HEADER.size))
+        if version != VERSION:
+            raise ValueError(f"Nem támogatott snapshot verzió: {version}")
+
+        ids = _unpack_json(f.read(ids_len))
+        payloads = _unpack_json(f.read(payloads_len))
+        manifest = _unpack_json(f.read(manifest_len))
+        vectors = np.frombuffer(f.read(count * dim * 4), dtype=np.float32).reshape(count, dim)
+
+    return dim, ids, payloads, vectors, manifest
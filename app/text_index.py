@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from functools import lru_cache
+from itertools import chain
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# gyakori magyar névelők, kötőszavak, névmások - nem kerülnek az indexbe
+STOPWORDS = frozenset("""
+a az egy és is hogy nem de ha mint meg már csak még vagy volt van lesz lett
+ez azt ezt ezek azok annak ennek akkor amely amelyek ami amit aki akik mert
+pedig mind minden sem se fel le ki be el itt ott így úgy igen által után alatt
+között szerint során miatt nélkül felé mellett előtt ellen óta való
+""".split())
+
+# leggyakoribb esetragok, többes szám és birtokos jelek; a leghosszabb illeszkedőt vágjuk le
+SUFFIXES = tuple(sorted("""
+ban ben ból ből ba be ról ről ra re hoz hez höz tól től nak nek nál nél val vel
+ért ig ként kor on en ön ot et öt at ok ek ök ak ai ei uk ük juk jük ja je jai jei
+t k
+""".split(), key=len, reverse=True))
+MIN_STEM_LEN = 4
+
+# kötőjellel, perjellel vagy ponttal összekapcsolt kódok (pl. 2011/CXC, 12.§, A-3) egyben is indexelődnek
+_TOKEN_RE = re.compile(r"\w+(?:[-/.]\w+)*", re.UNICODE)
+_HAS_DIGIT_RE = re.compile(r"\d")
+_SEPARATOR_RE = re.compile(r"[-/.]")
+
+
+def stem(word: str) -> str:
+    """
+    Könnyű magyar toldalékleválasztás: legfeljebb két toldalékot vág le
+    (pl. kitelepítéseket -> kitelepítése -> kitelepítés), és a szóvégi
+    hosszú magánhangzót rövidre cseréli (almának -> almá -> alma).
+    """
+    for _ in range(2):
+        for suffix in SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LEN:
+                word = word[:-len(suffix)]
+                break
+        else:
+            break
+    if word.endswith("á"):
+        word = word[:-1] + "a"
+    elif word.endswith("é"):
+        word = word[:-1] + "e"
+    return word
+
+
+# a szókincs jóval kisebb a szövegnél, így a legtöbb token a cache-ből jön
+@lru_cache(maxsize=200_000)
+def _token_terms(token: str) -> Tuple[str, ...]:
+    """Egy nyers (kisbetűs) tokenből képzett indexkifejezések."""
+    if token.isalpha():
+        if len(token) < 2 or token in STOPWORDS:
+            return ()
+        return (stem(token),)
+
+    parts = [p for p in _SEPARATOR_RE.split(token) if p]
+    if _HAS_DIGIT_RE.search(token):
+        return (token, *parts) if len(parts) > 1 else (token,)
+    return tuple(stem(w) for w in parts if len(w) >= 2 and w not in STOPWORDS)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Kisbetűsítés, stopszavak elhagyása, toldalékleválasztás. A számot
+    tartalmazó tokenek (cikkszámok, kódok, évszámok) változatlanok maradnak,
+    az összetett kódok a részeikkel együtt is bekerülnek.
+    """
+    return list(chain.from_iterable(map(_token_terms, _TOKEN_RE.findall(text.casefold()))))
+
+
+class InvertedIndex:
+    """
+    Inkrementális BM25 index a chunkok szövegére. Minden dokumentum (pont)
+    egy belső sorszámot (slot) kap; termenként két tömör tömb tárolja a
+    postingokat: slot sorszámok (uint32) és előfordulásszámok (uint16).
+    Törléskor csak a slot jelölődik halottnak, a tömbök akkor tömörödnek,
+    ha a halott slotok aránya túl nagy lesz.
+    """
+
+    COMPACT_RATIO = 0.25
+    COMPACT_MIN_DEAD = 1024
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._term_ids: Dict[str, int] = {}
+        self._post_slots: List[array] = []
+        self._post_tfs: List[array] = []
+
+        self._slot_of: Dict[Any, int] = {}
+        self._point_ids: List[Any] = []
+        self._lengths = array("I")
+        self._alive = bytearray()
+        self._n_alive = 0
+        self._n_dead = 0
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return self._n_alive
+
+    def add(self, point_ids: Sequence[Any], texts: Sequence[str]) -> None:
+        """Új vagy módosult pontok indexelése; a már meglévő azonosítók szövegét lecseréli."""
+        with self._lock:
+            self.remove([pid for pid in point_ids if pid in self._slot_of])
+            # a batch postingjait előbb laposan gyűjtjük, majd termenként egyszerre fűzzük a tömbökhöz
+            term_ids: List[int] = []
+            slots: List[int] = []
+            tfs: List[int] = []
+            for pid, text in zip(point_ids, texts):
+                tokens = tokenize(text)
+                slot = len(self._point_ids)
+                self._point_ids.append(pid)
+                self._slot_of[pid] = slot
+                self._lengths.append(len(tokens))
+                self._alive.append(1)
+                self._n_alive += 1
+                self._total_len += len(tokens)
+
+                for term, tf in Counter(tokens).items():
+                    tid = self._term_ids.get(term)
+                    if tid is None:
+                        tid = len(self._post_slots)
+                        self._term_ids[term] = tid
+                        self._post_slots.append(array("I"))
+                        self._post_tfs.append(array("H"))
+                    term_ids.append(tid)
+                    slots.append(slot)
+                    tfs.append(tf)
+
+            if not term_ids:
+                return
+            tid_arr = np.asarray(term_ids, dtype=np.int64)
+            order = np.argsort(tid_arr, kind="stable")
+            tid_sorted = tid_arr[order]
+            slot_sorted = np.asarray(slots, dtype=np.uint32)[order]
+            tf_sorted = np.minimum(np.asarray(tfs, dtype=np.int64)[order], 0xFFFF).astype(np.uint16)
+            bounds = np.flatnonzero(np.diff(tid_sorted)) + 1
+            starts = np.concatenate(([0], bounds))
+            ends = np.concatenate((bounds, [len(tid_sorted)]))
+            for lo, hi in zip(starts.tolist(), ends.tolist()):
+                tid = int(tid_sorted[lo])
+                self._post_slots[tid].frombytes(slot_sorted[lo:hi].tobytes())
+                self._post_tfs[tid].frombytes(tf_sorted[lo:hi].tobytes())
+
+    def remove(self, point_ids: Sequence[Any]) -> None:
+        with self._lock:
+            for pid in point_ids:
+                slot = self._slot_of.pop(pid, None)
+                if slot is None:
+                    continue
+                self._alive[slot] = 0
+                self._n_alive -= 1
+                self._n_dead += 1
+                self._total_len -= self._lengths[slot]
+            if self._n_dead >= self.COMPACT_MIN_DEAD and self._n_dead > self.COMPACT_RATIO * len(self._point_ids):
+                self.compact()
+
+    def compact(self) -> None:
+        """A halott slotok kiszűrése a postingokból és a slotok újraszámozása."""
+        with self._lock:
+            alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+            new_slot = np.cumsum(alive, dtype=np.int64) - 1
+
+            term_ids: Dict[str, int] = {}
+            post_slots: List[array] = []
+            post_tfs: List[array] = []
+            for term, tid in self._term_ids.items():
+                slots = np.frombuffer(self._post_slots[tid], dtype=np.uint32)
+                keep = alive[slots]
+                if not keep.any():
+                    continue
+                term_ids[term] = len(post_slots)
+                post_slots.append(array("I", new_slot[slots[keep]].astype(np.uint32).tobytes()))
+                post_tfs.append(array("H", np.frombuffer(self._post_tfs[tid], dtype=np.uint16)[keep].tobytes()))
+
+            self._point_ids = [pid for pid, a in zip(self._point_ids, alive) if a]
+            self._slot_of = {pid: i for i, pid in enumerate(self._point_ids)}
+            self._lengths = array("I", np.frombuffer(self._lengths, dtype=np.uint32)[alive].tobytes())
+            self._alive = bytearray(b"\x01" * len(self._point_ids))
+            self._term_ids, self._post_slots, self._post_tfs = term_ids, post_slots, post_tfs
+            self._n_dead = 0
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[Any, float]]:
+        """BM25 szerinti top_k (point_id, pontszám) pár, csökkenő sorrendben."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n_slots = len(self._point_ids)
+            if not terms or self._n_alive == 0:
+                return []
+
+            alive = np.frombuffer(self._alive, dtype=np.uint8)
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+            avg_len = self._total_len / self._n_alive or 1.0
+            scores = np.zeros(n_slots, dtype=np.float32)
+
+            for term in terms:
+                tid = self._term_ids.get(term)
+                if tid is None:
+                    continue
+                slots = np.frombuffer(self._post_slots[tid], dtype=np.uint32)
+                live = alive[slots]
+                df = int(live.sum())
+                if df == 0:
+                    continue
+                idf = math.log(1.0 + (self._n_alive - df + 0.5) / (df + 0.5))
+                tf = np.frombuffer(self._post_tfs[tid], dtype=np.uint16).astype(np.float32)
+                norm = self.k1 * (1 - self.b + self.b * lengths[slots] / avg_len)
+                scores[slots] += live * (idf * tf * (self.k1 + 1) / (tf + norm))
+
+            matched = np.flatnonzero(scores > 0)
+            if len(matched) > top_k:
+                part = np.argpartition(-scores[matched], top_k - 1)[:top_k]
+                matched = matched[part]
+            order = matched[np.argsort(-scores[matched], kind="stable")]
+            return [(self._point_ids[i], float(scores[i])) for i in order]
+
+    def memory_usage(self) -> Dict[str, int]:
+        with self._lock:
+            postings = sum(a.buffer_info()[1] * a.itemsize for a in self._post_slots)
+            postings += sum(a.buffer_info()[1] * a.itemsize for a in self._post_tfs)
+            return {
+                "terms": len(self._term_ids),
+                "postings_bytes": postings,
+                "doc_bytes": len(self._lengths) * self._lengths.itemsize + len(self._alive),
+            }
+
+    def save(self, path: Path) -> None:
+        """Tömörítés után CSR formában (offsetek + összefűzött postingok) menti az indexet."""
+        self.write(path, self.export())
+
+    def export(self) -> Dict[str, Any]:
+        """
+        Az index tömörített másolata a save formátumában. Zárolás alatt csak a
+        nyers tömbök másolása fut, a halott slotok kiszűrése már azon kívül,
+        így a mentés nem tartja fel a párhuzamos keresést és indexelést.
+        """
+        with self._lock:
+            terms = list(self._term_ids)
+            tids = [self._term_ids[t] for t in terms]
+            sizes = np.fromiter((len(self._post_slots[tid]) for tid in tids), dtype=np.int64, count=len(tids))
+            slots = np.frombuffer(b"".join(self._post_slots[tid] for tid in tids), dtype=np.uint32)
+            tfs = np.frombuffer(b"".join(self._post_tfs[tid] for tid in tids), dtype=np.uint16)
+            point_ids = list(self._point_ids)
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32).copy()
+            alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+            n_dead = self._n_dead
+
+        if n_dead:
+            # ugyanaz, mint a compact(), de a másolaton
+            keep = alive[slots]
+            kept_sizes = np.bincount(np.repeat(np.arange(len(terms)), sizes)[keep], minlength=len(terms))
+            new_slot = np.cumsum(alive, dtype=np.int64) - 1
+            slots = new_slot[slots[keep]].astype(np.uint32)
+            tfs = tfs[keep]
+            terms = [t for t, n in zip(terms, kept_sizes.tolist()) if n]
+            sizes = kept_sizes[kept_sizes > 0]
+            point_ids = [pid for pid, a in zip(point_ids, alive.tolist()) if a]
+            lengths = lengths[alive]
+
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        return {"terms": terms, "point_ids": point_ids, "offsets": offsets, "slots": slots, "tfs": tfs, "lengths": lengths}
+
+    @staticmethod
+    def write(path: Path, data: Dict[str, Any]) -> None:
+        """Az export() eredményének kiírása (atomikusan, ideiglenes fájlon át)."""
+        meta = json.dumps({"terms": data["terms"], "point_ids": data["point_ids"]}, ensure_ascii=False)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with tmp_path.open("wb") as f:
+            np.savez(
+                f,
+                meta=np.frombuffer(meta.encode("utf-8"), dtype=np.uint8),
+                offsets=data["offsets"],
+                slots=data["slots"],
+                tfs=data["tfs"],
+                lengths=data["lengths"],
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path, **kwargs) -> "InvertedIndex":
+        index = cls(**kwargs)
+        with np.load(path) as data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            offsets, slots, tfs = data["offsets"], data["slots"], data["tfs"]
+            lengths = data["lengths"]
+
+        index._point_ids = meta["point_ids"]
+        index._slot_of = {pid: i for i, pid in enumerate(index._point_ids)}
+        index._lengths = array("I", lengths.astype(np.uint32).tobytes())
+        index._alive = bytearray(b"\x01" * len(index._point_ids))
+        index._n_alive = len(index._point_ids)
+        index._total_len = int(lengths.sum())
+        for tid, term in enumerate(meta["terms"]):
+            lo, hi = offsets[tid], offsets[tid + 1]
+            index._term_ids[term] = tid
+            index._post_slots.append(array("I", slots[lo:hi].tobytes()))
+            index._post_tfs.append(array("H", tfs[lo:hi].tobytes()))
+        return index
+
+
+def rrf_fuse(rankings: Sequence[Sequence[Any]], k: int = 60, top_k: Optional[int] = None) -> List[Tuple[Any, float]]:
+    """Reciprocal Rank Fusion: sum(1 / (k + rang)) az összes rangsorban."""
+    fused: Dict[Any, float] = {}
+    for ranking in rankings:
+        for rank, pid in enumerate(ranking, start=1):
+            fused[pid] = fused.get(pid, 0.0) + 1.0 / (k + rank)
+    ordered = sorted(fused.items(), key=lambda x: x[1], reverse=True)
+    return ordered[:top_k] if top_k is not None else ordered
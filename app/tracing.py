@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import contextvars
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.metrics import STAGE_DURATION
+
+
+@dataclass
+class Span:
+    name: str
+    # a trace kezdetéhez képest (trace nélkül 0)
+    start_sec: float
+    duration_sec: float = 0.0
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    # perf_counter a span indulásakor
+    started_at: float = field(default=0.0, repr=False)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "start_sec": round(self.start_sec, 6),
+            "duration_sec": round(self.duration_sec, 6),
+            **self.attrs,
+        }
+
+
+class Trace:
+    """Egy kérés spanjai, a befejezés sorrendjében (a szálakon futó szakaszoké is)."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: List[Span] = []
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return [s.to_dict() for s in self.spans]
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("rag_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def trace() -> Iterator[Trace]:
+    """Új trace a blokk idejére: a benne (és a bind-dal átadott szálakon) futó spanok ide kerülnek."""
+    current = Trace()
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # generátorban a lezárás más kontextusban is futhat; ott nincs mit visszaállítani
+            pass
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span]:
+    """
+    Egy szakasz időmérése. Az idő mindig bekerül a rag_stage_duration_seconds
+    hisztogramba, és ha van aktív trace, a kérés spanjai közé is. A blokkban
+    a span.attrs kiegészíthető (pl. cache találat, első token ideje).
+    """
+    current = _current_trace.get()
+    start = time.perf_counter()
+    s = Span(name, start - current.start if current is not None else 0.0, attrs=dict(attrs), started_at=start)
+    try:
+        yield s
+    finally:
+        s.duration_sec = time.perf_counter() - start
+        STAGE_DURATION.observe(s.duration_sec, stage=name)
+        if current is not None:
+            current.spans.append(s)
+
+
+def traced(name: str) -> Callable:
+    """Dekorátor: a függvény (vagy coroutine) minden hívása egy span."""
+
+    def decorator(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def bind(fn: Callable, *args: Any, **kwargs: Any) -> Callable[[], Any]:
+    """
+    A hívó kontextusához (az aktív trace-hez) kötött hívás, szálkészletbe
+    adáshoz: a ThreadPoolExecutor és a run_in_executor nem viszi át a contextvarokat.
+    """
+    return functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
@@ -0,0 +1,576 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class ScoredPoint(NamedTuple):
+    id: Any
+    score: float
+    payload: Dict
+
+
+class VectorBackend(ABC):
+    """
+    A vektortár tárolási rétege. A VectorStore intézi az embeddinget, az
+    azonosítókat és a dokumentum-manifestet, a backend csak a pontokat
+    (azonosító, vektor, payload) tárolja és keres köztük koszinusz-hasonlósággal.
+    """
+
+    dim: int
+
+    @abstractmethod
+    def upsert(self, ids: Sequence[Any], vectors: Sequence[Sequence[float]], payloads: Sequence[Dict]) -> None:
+        ...
+
+    @abstractmethod
+    def set_payload(self, point_id: Any, payload: Dict) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, ids: Sequence[Any]) -> None:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def search(self, query_vec: Sequence[float], top_k: int) -> List[ScoredPoint]:
+        ...
+
+    def search_batch(self, query_vecs: Sequence[Sequence[float]], top_k: int) -> List[List[ScoredPoint]]:
+        return [self.search(q, top_k) for q in query_vecs]
+
+    @abstractmethod
+    def retrieve(self, ids: Sequence[Any]) -> List[ScoredPoint]:
+        """A megadott pontok payloadja (score=0.0), a kérés sorrendjében; a hiányzók kimaradnak."""
+        ...
+
+    @abstractmethod
+    def iter_points(self, batch_size: int = 1024) -> Iterator[Tuple[List[Any], List[Dict], np.ndarray]]:
+        """(ids, payloads, vektorok) batchek a teljes tartalomról, pl. snapshot készítéséhez."""
+        ...
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Becslés: a kereséshez memóriában tartott vektorok mérete bájtban."""
+        return {"in_memory_bytes": self.count() * self.dim * 4, "mmap_bytes": 0}
+
+    def flush(self) -> None:
+        """A memóriában lévő változások lemezre írása (ha a backend perzisztens)."""
+
+    def close(self) -> None:
+        ...
+
+
+class QdrantBackend(VectorBackend):
+    def __init__(self, collection_name: str, dim: int, path: Optional[Path] = None):
+        from qdrant_client import QdrantClient
+        from qdrant_client.http.models import Distance, VectorParams
+
+        self.collection_name = collection_name
+        self.dim = dim
+
+        if path is None:
+            self.qdrant = QdrantClient(":memory:")
+            # gyűjtemény létrehozása, vagy ha már létezik, újbóli létrehozása
+            self.qdrant.recreate_collection(
+                collection_name=self.collection_name,
+                vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
+            )
+        else:
+            self.qdrant = QdrantClient(path=str(path))
+            if not self.qdrant.collection_exists(self.collection_name):
+                self.qdrant.create_collection(
+                    collection_name=self.collection_name,
+                    vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
+                )
+
+    def upsert(self, ids, vectors, payloads) -> None:
+        from qdrant_client.http.models import PointStruct
+
+        points = [
+            PointStruct(
+                id=pid,
+                vector=list(map(float, vec)),
+                payload=payload,
+            )
+            for pid, vec, payload in zip(ids, vectors, payloads)
+        ]
+        self.qdrant.upsert(collection_name=self.collection_name, points=points)
+
+    def set_payload(self, point_id, payload) -> None:
+        self.qdrant.set_payload(
+            collection_name=self.collection_name,
+            payload=payload,
+            points=[point_id],
+        )
+
+    def delete(self, ids) -> None:
+        from qdrant_client.http.models import PointIdsList
+
+        self.qdrant.delete(
+            collection_name=self.collection_name,
+            points_selector=PointIdsList(points=list(ids)),
+        )
+
+    def count(self) -> int:
+        return self.qdrant.count(collection_name=self.collection_name, exact=True).count
+
+    def search(self, query_vec, top_k) -> List[ScoredPoint]:
+        results = self.qdrant.search(
+            collection_name=self.collection_name,
+            query_vector=list(query_vec),
+            limit=top_k,
+        )
+        return [ScoredPoint(r.id, r.score, r.payload) for r in results]
+
+    def search_batch(self, query_vecs, top_k) -> List[List[ScoredPoint]]:
+        from qdrant_client.http.models import SearchRequest
+
+        requests = [SearchRequest(vector=list(q), limit=top_k, with_payload=True) for q in query_vecs]
+        results = self.qdrant.search_batch(collection_name=self.collection_name, requests=requests)
+        return [[ScoredPoint(r.id, r.score, r.payload) for r in res] for res in results]
+
+    def retrieve(self, ids) -> List[ScoredPoint]:
+        records = self.qdrant.retrieve(
+            collection_name=self.collection_name,
+            ids=list(ids),
+            with_payload=True,
+            with_vectors=False,
+        )
+        by_id = {str(r.id): r for r in records}
+        return [ScoredPoint(by_id[str(i)].id, 0.0, by_id[str(i)].payload) for i in ids if str(i) in by_id]
+
+    def iter_points(self, batch_size: int = 1024):
+        offset = None
+        while True:
+            points, offset = self.qdrant.scroll(
+                collection_name=self.collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            if points:
+                yield (
+                    [p.id for p in points],
+                    [p.payload for p in points],
+                    np.asarray([p.vector for p in points], dtype=np.float32),
+                )
+            if offset is None:
+                break
+
+    def close(self) -> None:
+        self.qdrant.close()
+
+
+class _GrowableMatrix:
+    """
+    Soronként bővíthető mátrix, amortizált növeléssel. file_backed=True esetén
+    egy névtelen ideiglenes fájlra van memory-mapelve, így a tartalma nem a
+    folyamat saját memóriáját terheli, csak a ténylegesen olvasott lapok.
+    """
+
+    GROW_ROWS = 1024
+
+    def __init__(self, cols: int, dtype, file_backed: bool = False):
+        self.cols = cols
+        self.dtype = np.dtype(dtype)
+        self._file = tempfile.TemporaryFile() if file_backed else None
+        self.data = np.zeros((0, cols), dtype=self.dtype)
+
+    @property
+    def capacity(self) -> int:
+        return self.data.shape[0]
+
+    def reserve(self, rows: int, used: int) -> None:
+        if rows <= self.capacity:
+            return
+        new_capacity = max(rows, self.capacity + max(self.GROW_ROWS, self.capacity // 2))
+        if self._file is None:
+            grown = np.zeros((new_capacity, self.cols), dtype=self.dtype)
+            grown[:used] = self.data[:used]
+            self.data = grown
+        else:
+            # a fájl meghosszabbítása után újra-mapeljük, a meglévő sorok a helyükön maradnak
+            self._file.truncate(new_capacity * self.cols * self.dtype.itemsize)
+            self.data = np.memmap(self._file, dtype=self.dtype, mode="r+", shape=(new_capacity, self.cols))
+
+    def nbytes(self, used: int) -> int:
+        return used * self.cols * self.dtype.itemsize
+
+
+class NumpyBackend(VectorBackend):
+    """
+    Pontos (brute-force) keresés egyetlen összefüggő, L2-normalizált float32
+    mátrixon: egy mátrix-vektor szorzat + argpartition a top-k-hoz. A mátrix
+    darabokban, amortizáltan nő; törléskor az utolsó sor kerül a helyére.
+
+    Kvantálással (quantization="int8" vagy "binary") a memóriában csak a
+    tömör kódok maradnak, a teljes pontosságú vektorok memory-mapelt
+    fájlba kerülnek. A keresés a kódokon választ ki top_k * oversample
+    jelöltet, majd ezeket teljes pontossággal újrapontozza.
+    """
+
+    QUANTIZATIONS = ("none", "int8", "binary")
+    # kvantált keresésnél ennyi soronként pontozunk, hogy az ideiglenes float32 blokk kicsi maradjon
+    SCAN_BLOCK_ROWS = 32768
+
+    def __init__(
+            self,
+            dim: int,
+            path: Optional[Path] = None,
+            quantization: str = "none",
+            oversample: float = 4.0,
+    ):
+        if quantization not in self.QUANTIZATIONS:
+            raise ValueError(f"Ismeretlen kvantálás: {quantization}")
+
+        self.dim = dim
+        self.path = path
+        self.quantization = quantization
+        self.oversample = oversample
+        self._size = 0
+        self._ids: List[Any] = []
+        self._payloads: List[Dict] = []
+        self._row_of: Dict[Any, int] = {}
+
+        self._full = _GrowableMatrix(dim, np.float32, file_backed=quantization != "none")
+        if quantization == "int8":
+            self._codes = _GrowableMatrix(dim, np.int8)
+            self._scales = _GrowableMatrix(1, np.float32)
+        elif quantization == "binary":
+            self._codes = _GrowableMatrix((dim + 7) // 8, np.uint8)
+
+        if self.path is not None and self.path.exists():
+            from app.snapshot import read_snapshot
+
+            snap_dim, ids, payloads, vectors, _ = read_snapshot(self.path)
+            if snap_dim != dim:
+                raise ValueError(f"A tárolt index dimenziója ({snap_dim}) eltér a vektortárétól ({dim}).")
+            self.upsert(ids, vectors, payloads)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._full.data[:self._size]
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _reserve(self, rows: int) -> None:
+        self._full.reserve(rows, self._size)
+        if self.quantization != "none":
+            self._codes.reserve(rows, self._size)
+        if self.quantization == "int8":
+            self._scales.reserve(rows, self._size)
+
+    def _write_row(self, row: int, vec: np.ndarray) -> None:
+        self._full.data[row] = vec
+        if self.quantization == "int8":
+            # soronkénti skála: a legnagyobb abszolút érték 127-re képződik
+            scale = float(np.abs(vec).max()) / 127.0 or 1.0
+            self._codes.data[row] = np.round(vec / scale).astype(np.int8)
+            self._scales.data[row, 0] = scale
+        elif self.quantization == "binary":
+            self._codes.data[row] = np.packbits(vec > 0)
+
+    def _copy_row(self, src: int, dst: int) -> None:
+        self._full.data[dst] = self._full.data[src]
+        if self.quantization != "none":
+            self._codes.data[dst] = self._codes.data[src]
+        if self.quantization == "int8":
+            self._scales.data[dst] = self._scales.data[src]
+
+    def upsert(self, ids, vectors, payloads) -> None:
+        if len(ids) == 0:
+            return
+        matrix = self._normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim))
+        self._reserve(self._size + len(ids))
+
+        for pid, vec, payload in zip(ids, matrix, payloads):
+            row = self._row_of.get(pid)
+            if row is None:
+                row = self._size
+                self._size += 1
+                self._ids.append(pid)
+                self._payloads.append(payload)
+                self._row_of[pid] = row
+            else:
+                self._payloads[row] = payload
+            self._write_row(row, vec)
+
+    def set_payload(self, point_id, payload) -> None:
+        row = self._row_of.get(point_id)
+        if row is not None:
+            self._payloads[row] = {**self._payloads[row], **payload}
+
+    def delete(self, ids) -> None:
+        for pid in ids:
+            row = self._row_of.pop(pid, None)
+            if row is None:
+                continue
+            last = self._size - 1
+            if row != last:
+                # az utolsó sort mozgatjuk a törölt helyére, így a mátrix összefüggő marad
+                self._copy_row(last, row)
+                self._ids[row] = self._ids[last]
+                self._payloads[row] = self._payloads[last]
+                self._row_of[self._ids[row]] = row
+            self._ids.pop()
+            self._payloads.pop()
+            self._size -= 1
+
+    def count(self) -> int:
+        return self._size
+
+    def memory_usage(self) -> Dict[str, int]:
+        """A kereséshez memóriában tartott adatok, illetve a memory-mapelt teljes vektorok mérete bájtban."""
+        full = self._full.nbytes(self._size)
+        if self.quantization == "none":
+            return {"in_memory_bytes": full, "mmap_bytes": 0}
+        in_memory = self._codes.nbytes(self._size)
+        if self.quantization == "int8":
+            in_memory += self._scales.nbytes(self._size)
+        return {"in_memory_bytes": in_memory, "mmap_bytes": full}
+
+    def _approx_scores(self, query: np.ndarray) -> np.ndarray:
+        scores = np.empty(self._size, dtype=np.float32)
+        if self.quantization == "int8":
+            for start in range(0, self._size, self.SCAN_BLOCK_ROWS):
+                end = min(start + self.SCAN_BLOCK_ROWS, self._size)
+                block = self._codes.data[start:end].astype(np.float32)
+                scores[start:end] = (block @ query) * self._scales.data[start:end, 0]
+        else:
+            query_bits = np.packbits(query > 0)
+            for start in range(0, self._size, self.SCAN_BLOCK_ROWS):
+                end = min(start + self.SCAN_BLOCK_ROWS, self._size)
+                hamming = _popcount(np.bitwise_xor(self._codes.data[start:end], query_bits)).sum(axis=1)
+                scores[start:end] = -hamming.astype(np.float32)
+        return scores
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+        k = min(top_k, scores.shape[0])
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if k < scores.shape[0]:
+            idx = np.argpartition(-scores, k - 1)[:k]
+        else:
+            idx = np.arange(scores.shape[0])
+        return idx[np.argsort(-scores[idx], kind="stable")]
+
+    def _search_one(self, query: np.ndarray, top_k: int, exact_scores: Optional[np.ndarray] = None) -> List[ScoredPoint]:
+        if self.quantization == "none":
+            scores = exact_scores if exact_scores is not None else self.vectors @ query
+            idx = self._top_k(scores, top_k)
+            return [ScoredPoint(self._ids[i], float(scores[i]), self._payloads[i]) for i in idx]
+
+        # jelöltek a tömör kódokon, majd teljes pontosságú újrapontozás
+        candidates = self._top_k(self._approx_scores(query), int(np.ceil(top_k * self.oversample)))
+        candidates = np.sort(candidates)
+        rescored = self._full.data[candidates] @ query
+        order = self._top_k(rescored, top_k)
+        return [
+            ScoredPoint(self._ids[i], float(score), self._payloads[i])
+            for i, score in zip(candidates[order], rescored[order])
+        ]
+
+    def search(self, query_vec, top_k) -> List[ScoredPoint]:
+        query = self._normalize(np.asarray(query_vec, dtype=np.float32))
+        return self._search_one(query, top_k)
+
+    def retrieve(self, ids) -> List[ScoredPoint]:
+        rows = [(pid, self._row_of.get(pid)) for pid in ids]
+        return [ScoredPoint(pid, 0.0, self._payloads[row]) for pid, row in rows if row is not None]
+
+    def search_batch(self, query_vecs, top_k) -> List[List[ScoredPoint]]:
+        if len(query_vecs) == 0:
+            return []
+        queries = self._normalize(np.asarray(query_vecs, dtype=np.float32).reshape(len(query_vecs), self.dim))
+        if self.quantization != "none":
+            return [self._search_one(q, top_k) for q in queries]
+        scores = queries @ self.vectors.T
+        return [self._search_one(q, top_k, exact_scores=row) for q, row in zip(queries, scores)]
+
+    def iter_points(self, batch_size: int = 1024):
+        for i in range(0, self._size, batch_size):
+            yield list(self._ids[i:i + batch_size]), list(self._payloads[i:i + batch_size]), self.vectors[i:i + batch_size]
+
+    def flush(self) -> None:
+        if self.path is None:
+            return
+        from app.snapshot import write_snapshot
+
+        write_snapshot(self.path, self.dim, list(self._ids), list(self._payloads), self.vectors, manifest={})
+
+
+# a közzétett (csak olvasható) index fájljai egy könyvtáron belül
+MMAP_INDEX_META = "index.json"
+
+
+def write_mmap_index(
+        directory: Path,
+        dim: int,
+        ids: Sequence[Any],
+        payloads: Sequence[Dict],
+        vectors: np.ndarray,
+) -> int:
+    """
+    A pontokat a MmapBackend formátumában írja ki: normalizált float32 mátrix,
+    fix szélességű azonosítók (rendezett másolattal a kereséshez) és az
+    összefűzött JSON payloadok offsetekkel. Visszaadja a kiírt bájtok számát.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), dim)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+
+    int_ids = bool(ids) and all(isinstance(i, (int, np.integer)) for i in ids)
+    # üres listánál is legyen (nulla hosszú) bájt-tömb
+    id_keys = np.array([str(i).encode("utf-8") for i in ids] or [b""], dtype=np.bytes_)[:len(ids)]
+    order = np.argsort(id_keys, kind="stable")
+
+    blobs = [json.dumps(p, ensure_ascii=False, separators=(",", ":")).encode("utf-8") for p in payloads]
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in blobs], out=offsets[1:])
+
+    arrays = {
+        "vectors": vectors / norms,
+        "ids": id_keys,
+        "ids_sorted": id_keys[order],
+        "id_rows": order.astype(np.int64),
+        "payloads": np.frombuffer(b"".join(blobs), dtype=np.uint8),
+        "payload_offsets": offsets,
+    }
+    written = 0
+    for name, array in arrays.items():
+        with (directory / f"{name}.npy").open("wb") as f:
+            np.save(f, array)
+            f.flush()
+            os.fsync(f.fileno())
+            written += f.tell()
+    meta = {"dim": dim, "count": len(ids), "id_type": "int" if int_ids else "str"}
+    (directory / MMAP_INDEX_META).write_text(json.dumps(meta), encoding="utf-8")
+    return written
+
+
+class MmapBackend(VectorBackend):
+    """
+    Csak olvasható backend egy write_mmap_index által kiírt könyvtáron.
+    A vektorok és a payloadok (a chunkok szövegével) memory-mapelt fájlokból
+    olvasódnak, így az ugyanazt az indexet megnyitó folyamatok egyetlen
+    fizikai másolaton (az operációs rendszer lap-cache-én) osztoznak.
+    A payloadok csak a találatoknál dekódolódnak.
+    """
+
+    def __init__(self, directory: Path):
+        meta = json.loads((directory / MMAP_INDEX_META).read_text(encoding="utf-8"))
+        self.directory = directory
+        self.dim = meta["dim"]
+        self._size = meta["count"]
+        self._int_ids = meta["id_type"] == "int"
+        # üres fájlt nem lehet memory-mapelni
+        mode = "r" if self._size else None
+        self._vectors = np.load(directory / "vectors.npy", mmap_mode=mode)
+        self._ids = np.load(directory / "ids.npy", mmap_mode=mode)
+        self._ids_sorted = np.load(directory / "ids_sorted.npy", mmap_mode=mode)
+        self._id_rows = np.load(directory / "id_rows.npy", mmap_mode=mode)
+        self._payloads = np.load(directory / "payloads.npy", mmap_mode=mode)
+        self._payload_offsets = np.load(directory / "payload_offsets.npy", mmap_mode=mode)
+
+    def _read_only(self, *args, **kwargs) -> None:
+        raise RuntimeError("A közzétett index csak olvasható, a módosítás az író folyamat feladata.")
+
+    upsert = _read_only
+    set_payload = _read_only
+    delete = _read_only
+
+    def count(self) -> int:
+        return self._size
+
+    def memory_usage(self) -> Dict[str, int]:
+        return {"in_memory_bytes": 0, "mmap_bytes": int(self._vectors.nbytes + self._payloads.nbytes)}
+
+    def _id(self, row: int) -> Any:
+        key = self._ids[row].decode("utf-8")
+        return int(key) if self._int_ids else key
+
+    def _payload(self, row: int) -> Dict:
+        lo, hi = self._payload_offsets[row], self._payload_offsets[row + 1]
+        return json.loads(self._payloads[lo:hi].tobytes().decode("utf-8"))
+
+    def _point(self, row: int, score: float) -> ScoredPoint:
+        return ScoredPoint(self._id(row), score, self._payload(row))
+
+    def search(self, query_vec, top_k) -> List[ScoredPoint]:
+        return self.search_batch([query_vec], top_k)[0]
+
+    def search_batch(self, query_vecs, top_k) -> List[List[ScoredPoint]]:
+        if len(query_vecs) == 0:
+            return []
+        queries = NumpyBackend._normalize(np.asarray(query_vecs, dtype=np.float32).reshape(len(query_vecs), self.dim))
+        if self._size == 0:
+            return [[] for _ in queries]
+        scores = queries @ self._vectors.T
+        results = []
+        for row_scores in scores:
+            idx = NumpyBackend._top_k(row_scores, top_k)
+            results.append([self._point(int(i), float(row_scores[i])) for i in idx])
+        return results
+
+    def retrieve(self, ids) -> List[ScoredPoint]:
+        if self._size == 0 or len(ids) == 0:
+            return []
+        keys = np.array([str(i).encode("utf-8") for i in ids], dtype=np.bytes_)
+        pos = np.minimum(np.searchsorted(self._ids_sorted, keys), self._size - 1)
+        found = self._ids_sorted[pos] == keys
+        return [
+            ScoredPoint(pid, 0.0, self._payload(int(self._id_rows[p])))
+            for pid, p, ok in zip(ids, pos, found) if ok
+        ]
+
+    def iter_points(self, batch_size: int = 1024):
+        for i in range(0, self._size, batch_size):
+            rows = range(i, min(i + batch_size, self._size))
+            yield [self._id(r) for r in rows], [self._payload(r) for r in rows], np.asarray(self._vectors[i:i + batch_size])
+
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(bits: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits)
+    return _POPCOUNT_TABLE[bits]
+
+
+def make_backend(
+        kind: str,
+        collection_name: str,
+        dim: int,
+        path: Optional[Path] = None,
+        quantization: str = "none",
+        oversample: float = 4.0,
+) -> VectorBackend:
+    if kind == "qdrant":
+        if quantization != "none":
+            raise ValueError("A kvantálás csak a numpy backenddel támogatott.")
+        return QdrantBackend(collection_name, dim, path=path)
+    if kind == "numpy":
+        return NumpyBackend(
+            dim,
+            path=path / f"{collection_name}.npidx" if path is not None else None,
+            quantization=quantization,
+            oversample=oversample,
+        )
+    raise ValueError(f"Ismeretlen vektortár backend: {kind}")
@@ -1,59 +1,531 @@
-from typing import List, Dict
-
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct
-
-from app.embeddings import embed_texts
-
-class VectorStore:
-    def __init__(self, collection_name: str = "documents", dim: int = 1536):
-        self.qdrant = QdrantClient(":memory:")
-        self.collection_name = collection_name
-
-        # gyűjtemény létrehozása, vagy ha már létezik, újbóli létrehozása
-        self.qdrant.recreate_collection(
-            collection_name=self.collection_name,
-            vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
-        )
-        
-    def add_documents(self, chunks: List[Dict]):
-        texts = [c["text"] for c in chunks]
-        vectors = embed_texts(texts)
-
-        points: List[PointStruct] = []
-        for c, v in zip(chunks, vectors):
-            chunk_id = c["id"]
-            payload = {
-                "text": c ["text"],
-                "source_file": c.get("source_file", None),
-            }
-            points.append(
-                PointStruct(
-                    id=chunk_id,
-                    vector=v,
-                    payload=payload,
-                )
-            )
-
-        self.qdrant.upsert(collection_name=self.collection_name, points=points)
-
-    def search(self, query: str, top_k: int = 5) -> List[Dict]:
-        [query_vec] = embed_texts([query])
-
-        results = self.qdrant.search(
-            collection_name=self.collection_name,
-            query_vector=query_vec,
-            limit=top_k,
-        )
-
-        hits: List[Dict] = []
-        for r in results:
-            hits.append(
-                {
-                    "id": r.id,
-                    "text": r.payload["text"],
-                    "score": r.score,
-                    "source_file": r.payload.get("source_file")
-                }
-            )
-        return hits
\ No newline at end of file
+import asyncio
+import atexit
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Dict, Optional
+
+import numpy as np
+
+from app.embed_batcher import get_query_batcher
+from app.embeddings import aembed_texts, embed_texts, DEFAULT_EMBED_DIM
+from app.snapshot import read_snapshot, write_snapshot
+from app.text_index import InvertedIndex, rrf_fuse
+from app.tracing import bind, span
+from app.vector_backends import ScoredPoint, VectorBackend, make_backend
+
+# "qdrant" vagy "numpy"
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+# "none", "int8" vagy "binary" (csak a numpy backendnél)
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+# kvantált keresésnél top_k * VECTOR_OVERSAMPLE jelöltet pontozunk újra teljes pontossággal
+VECTOR_OVERSAMPLE = float(os.getenv("VECTOR_OVERSAMPLE", "4.0"))
+# a text-embedding-3 modellektől kért vektorhossz
+EMBED_DIMENSIONS = int(os.getenv("EMBED_DIMENSIONS", str(DEFAULT_EMBED_DIM)))
+# "vector", "bm25" vagy "hybrid" (BM25 és koszinusz rangsor RRF-fel összefésülve)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "vector")
+# hibrid keresésnél mindkét rangsorból top_k * HYBRID_CANDIDATES_FACTOR elem kerül a fúzióba
+HYBRID_CANDIDATES_FACTOR = int(os.getenv("HYBRID_CANDIDATES_FACTOR", "4"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+SEARCH_MODES = ("vector", "bm25", "hybrid")
+# a lemezes index (backend, BM25 index, manifest) a változás után legfeljebb ennyi másodperccel íródik ki,
+# így több egymás után befejezett dokumentum egyetlen teljes mentéssel jár (0: minden változás után azonnal)
+VECTOR_FLUSH_INTERVAL_SEC = float(os.getenv("VECTOR_FLUSH_INTERVAL_SEC", "30"))
+# az aszinkron keresés ezeken a szálakon futtatja a (CPU-igényes, blokkoló) backend keresést
+SEARCH_MAX_WORKERS = int(os.getenv("SEARCH_MAX_WORKERS", "4"))
+
+_search_executor = ThreadPoolExecutor(max_workers=SEARCH_MAX_WORKERS, thread_name_prefix="search")
+
+# fix névtér, hogy ugyanaz a (dokumentum, tartalom) pár mindig ugyanazt az azonosítót kapja
+POINT_ID_NAMESPACE = uuid.UUID("6f1d8c8e-3b0a-4c55-9a51-2f0c4b7e9d21")
+
+
+def document_id(source_file: Optional[str]) -> str:
+    return hashlib.sha1((source_file or "").encode("utf-8")).hexdigest()
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def point_id(doc_id: str, chunk_hash: str, occurrence: int = 0) -> str:
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{doc_id}:{chunk_hash}:{occurrence}"))
+
+
+class VectorStore:
+    def __init__(
+            self,
+            collection_name: str = "documents",
+            dim: int = EMBED_DIMENSIONS,
+            path: Optional[str] = None,
+            backend: str = VECTOR_BACKEND,
+            quantization: str = VECTOR_QUANTIZATION,
+            oversample: float = VECTOR_OVERSAMPLE,
+            flush_interval_sec: float = VECTOR_FLUSH_INTERVAL_SEC,
+    ):
+        """
+        path=None: memóriában tartott gyűjtemény (minden indításkor üres).
+        path megadásával a backend a megadott könyvtárban, lemezen tárolja a
+        gyűjteményt, a dokumentum-manifest pedig mellette, JSON-ban.
+        backend: "qdrant" (alapértelmezett) vagy "numpy" (pontos keresés egy float32 mátrixon).
+        quantization: "int8" vagy "binary" esetén a numpy backend tömör kódokon keres,
+        és az oversample-szeres jelöltlistát pontozza újra teljes pontossággal.
+        dim: ha eltér a modell alapértelmezésétől, ekkora vektorokat kérünk az API-tól.
+        flush_interval_sec: a lemezes mentés késleltetése (lásd save_manifest).
+        """
+        self.collection_name = collection_name
+        self.dim = dim
+        self.path = Path(path) if path else None
+        # háttérben futó indexelés és keresés egyidejűleg is használhatja
+        self._lock = threading.RLock()
+        # doc_id -> {"source_file", "file_hash", "points": {point_id: chunk_index}}
+        self.documents: Dict[str, Dict] = {}
+        # (doc_id, megváltozott pontazonosítók) - újraindexeléskor hívódnak, pl. cache-ek érvénytelenítéséhez
+        self._listeners: List[Callable[[str, List[str]], None]] = []
+        self.flush_interval_sec = flush_interval_sec
+        self._dirty = False
+        # minden módosítás növeli (a zárolás alatt); ebből látszik, ha egy darabokban készült másolat közben változott a tár
+        self.version = 0
+        self._flush_timer: Optional[threading.Timer] = None
+
+        if self.path is not None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            if self._manifest_path.exists():
+                self.documents = json.loads(self._manifest_path.read_text(encoding="utf-8"))
+        self.backend: VectorBackend = make_backend(
+            backend, collection_name, dim, path=self.path, quantization=quantization, oversample=oversample,
+        )
+        self.embed_dimensions = None if dim == DEFAULT_EMBED_DIM else dim
+        # BM25 index a chunkok szövegére, a gyűjtemény mellett tárolva
+        self.text_index = self._load_text_index()
+        if self.path is not None:
+            # leálláskor a még ki nem írt változások se vesszenek el
+            atexit.register(self.flush)
+
+    @property
+    def _manifest_path(self) -> Path:
+        return self.path / f"{self.collection_name}.manifest.json"
+
+    @property
+    def _text_index_path(self) -> Path:
+        return self.path / f"{self.collection_name}.bm25.npz"
+
+    def _load_text_index(self) -> InvertedIndex:
+        if self.path is not None and self._text_index_path.exists():
+            index = InvertedIndex.load(self._text_index_path)
+            if len(index) == self.backend.count():
+                return index
+        # nincs (vagy elavult) mentett index: újraépítés a tárolt payloadokból
+        index = InvertedIndex()
+        for ids, payloads, _ in self.backend.iter_points():
+            index.add(ids, [p["text"] for p in payloads])
+        return index
+
+    def save_manifest(self):
+        """
+        A változások mentésének ütemezése. A teljes mentés (a numpy backend
+        pillanatképe, a BM25 index és a manifest) a gyűjtemény méretével arányos,
+        ezért nem minden dokumentum után fut, hanem legfeljebb flush_interval_sec
+        késéssel, az addigi változásokat egyszerre kiírva (és leálláskor).
+        """
+        if self.path is None:
+            return
+        with self._lock:
+            self._dirty = True
+            if self.flush_interval_sec <= 0:
+                self.flush()
+            elif self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_interval_sec, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self):
+        """A függő változások azonnali kiírása lemezre."""
+        if self.path is None:
+            return
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._dirty:
+                return
+            self._dirty = False
+            self.backend.flush()
+            self.text_index.save(self._text_index_path)
+            data = json.dumps(self.documents, ensure_ascii=False)
+            tmp_path = self._manifest_path.with_suffix(".tmp")
+            tmp_path.write_text(data, encoding="utf-8")
+            os.replace(tmp_path, self._manifest_path)
+
+    def add_listener(self, callback: Callable[[str, List[str]], None]):
+        self._listeners.append(callback)
+
+    def notify_changed(self, doc_id: str, point_ids: List[str]):
+        for callback in self._listeners:
+            callback(doc_id, point_ids)
+
+    def count(self) -> int:
+        with self._lock:
+            return self.backend.count()
+
+    def memory_usage(self) -> Dict[str, int]:
+        with self._lock:
+            usage = dict(self.backend.memory_usage())
+            text_usage = self.text_index.memory_usage()
+            usage["text_index_bytes"] = text_usage["postings_bytes"] + text_usage["doc_bytes"]
+            return usage
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return embed_texts(texts, dimensions=self.embed_dimensions)
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        # az egyedi kérdéseket a batcher gyűjti össze más, egyidejű kérésekkel egy hívásba
+        batcher = get_query_batcher(self.embed_dimensions) if len(texts) == 1 else None
+        if batcher is not None:
+            return [await batcher.embed(texts[0])]
+        return await aembed_texts(texts, dimensions=self.embed_dimensions)
+
+    def export_snapshot(self, snapshot_path: Path, batch_size: int = 1024) -> int:
+        """A teljes gyűjteményt (vektorok, payloadok, manifest) egyetlen bináris fájlba menti."""
+        ids: List = []
+        payloads: List[Dict] = []
+        vectors: List[np.ndarray] = []
+
+        with self._lock:
+            for batch_ids, batch_payloads, batch_vectors in self.backend.iter_points(batch_size):
+                ids.extend(batch_ids)
+                payloads.extend(batch_payloads)
+                vectors.append(np.array(batch_vectors, dtype=np.float32))
+            manifest = dict(self.documents)
+
+        return write_snapshot(
+            snapshot_path,
+            dim=self.dim,
+            ids=ids,
+            payloads=payloads,
+            vectors=np.concatenate(vectors) if vectors else np.zeros((0, self.dim), dtype=np.float32),
+            manifest=manifest,
+        )
+
+    def import_snapshot(self, snapshot_path: Path, batch_size: int = 1024) -> int:
+        """Pillanatkép betöltése embedding hívások nélkül. Visszaadja a betöltött pontok számát."""
+        dim, ids, payloads, vectors, manifest = read_snapshot(snapshot_path)
+        if dim != self.dim:
+            raise ValueError(f"A snapshot dimenziója ({dim}) eltér a vektortárétól ({self.dim}).")
+        return self.import_points(ids, payloads, vectors, manifest, batch_size=batch_size)
+
+    def import_points(
+            self,
+            ids: List,
+            payloads: List[Dict],
+            vectors: np.ndarray,
+            manifest: Dict[str, Dict],
+            batch_size: int = 1024,
+    ) -> int:
+        """Kész pontok (azonosító, payload, vektor) és dokumentum-manifest betöltése embedding nélkül."""
+        with self._lock:
+            for i in range(0, len(ids), batch_size):
+                self.backend.upsert(ids[i:i + batch_size], vectors[i:i + batch_size], payloads[i:i + batch_size])
+            self.text_index.add(ids, [p["text"] for p in payloads])
+            self.documents.update(manifest)
+            self.version += 1
+        self.save_manifest()
+        return len(ids)
+
+    def replace_index(self, backend: VectorBackend, text_index: InvertedIndex, documents: Dict[str, Dict]) -> None:
+        """
+        Egy máshol felépített index (pl. egy közzétett, csak olvasható generáció)
+        átvétele. A megváltozott dokumentumokról a figyelők értesítést kapnak.
+        """
+        with self._lock:
+            previous = self.documents
+            self.backend, self.text_index, self.documents = backend, text_index, documents
+            self.version += 1
+
+        for doc_id in set(previous) | set(documents):
+            old_points = set(previous.get(doc_id, {}).get("points", {}))
+            new_points = set(documents.get(doc_id, {}).get("points", {}))
+            if old_points != new_points:
+                self.notify_changed(doc_id, sorted(old_points ^ new_points))
+
+    def add_documents(self, chunks: List[Dict]) -> Dict[str, int]:
+        """
+        A chunkokat forrásfájlonként teljes dokumentumként szinkronizálja:
+        csak az új/módosult chunkok kerülnek embeddingre, a dokumentumból
+        eltűnt chunkok törlődnek.
+        """
+        by_source: Dict[Optional[str], List[Dict]] = {}
+        for c in chunks:
+            by_source.setdefault(c.get("source_file"), []).append(c)
+
+        totals: Counter = Counter()
+        for source_file, doc_chunks in by_source.items():
+            sync = self.begin_document(source_file)
+            new_chunks = sync.diff(doc_chunks)
+            sync.upsert(new_chunks, self.embed([c["text"] for c in new_chunks]))
+            totals.update(sync.finish())
+        return dict(totals)
+
+    def begin_document(self, source_file: Optional[str], file_hash: Optional[str] = None) -> "DocumentSync":
+        return DocumentSync(self, source_file, file_hash)
+
+    def upsert_vectors(self, chunks: List[Dict], vectors: List[List[float]]):
+        if not chunks:
+            return
+
+        ids = [c.get("point_id", c["id"]) for c in chunks]
+        payloads = [
+            {
+                "text": c ["text"],
+                "source_file": c.get("source_file", None),
+                "chunk_index": c["id"],
+                "doc_id": c.get("doc_id"),
+                "page_start": c.get("page_start"),
+                "page_end": c.get("page_end"),
+            }
+            for c in chunks
+        ]
+
+        with self._lock:
+            self.backend.upsert(ids, vectors, payloads)
+            self.text_index.add(ids, [p["text"] for p in payloads])
+            self.version += 1
+
+    def update_payload(self, point_id: str, payload: Dict):
+        with self._lock:
+            self.backend.set_payload(point_id, payload)
+            self.version += 1
+
+    def delete_points(self, point_ids: List[str]):
+        if not point_ids:
+            return
+        with self._lock:
+            self.backend.delete(point_ids)
+            self.text_index.remove(point_ids)
+            self.version += 1
+
+    def search(
+            self,
+            query: str,
+            top_k: int = 5,
+            mode: Optional[str] = None,
+            query_vec: Optional[List[float]] = None,
+    ) -> List[Dict]:
+        """
+        mode: "vector", "bm25" vagy "hybrid"; alapértelmezés a SEARCH_MODE beállítás.
+        query_vec: ha a kérdés embeddingje már megvan, nem kérjük le újra.
+        """
+        query_vecs = [query_vec] if query_vec is not None else None
+        return self.search_batch([query], top_k=top_k, mode=mode, query_vecs=query_vecs)[0]
+
+    def search_batch(
+            self,
+            queries: List[str],
+            top_k: int = 5,
+            mode: Optional[str] = None,
+            query_vecs: Optional[List[List[float]]] = None,
+    ) -> List[List[Dict]]:
+        """Több kérdés egyszerre: egyetlen embedding hívás és egy kötegelt keresés."""
+        mode = mode or SEARCH_MODE
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Ismeretlen keresési mód: {mode}")
+        if not queries:
+            return []
+
+        if query_vecs is None and mode != "bm25":
+            query_vecs = self.embed(queries)
+        with span("vector_search", mode=mode, queries=len(queries)):
+            if mode == "bm25":
+                return [self._lexical_search(q, top_k) for q in queries]
+
+            n_candidates = top_k * HYBRID_CANDIDATES_FACTOR if mode == "hybrid" else top_k
+            with self._lock:
+                results = self.backend.search_batch(query_vecs, n_candidates)
+            if mode == "vector":
+                return [[self._to_hit(r) for r in res] for res in results]
+            return [self._hybrid_merge(q, res, top_k, n_candidates) for q, res in zip(queries, results)]
+
+    async def asearch(
+            self,
+            query: str,
+            top_k: int = 5,
+            mode: Optional[str] = None,
+            query_vec: Optional[List[float]] = None,
+    ) -> List[Dict]:
+        """A search aszinkron változata: az embedding AsyncOpenAI-jal, a keresés szálon fut."""
+        query_vecs = [query_vec] if query_vec is not None else None
+        return (await self.asearch_batch([query], top_k=top_k, mode=mode, query_vecs=query_vecs))[0]
+
+    async def asearch_batch(
+            self,
+            queries: List[str],
+            top_k: int = 5,
+            mode: Optional[str] = None,
+            query_vecs: Optional[List[List[float]]] = None,
+    ) -> List[List[Dict]]:
+        mode = mode or SEARCH_MODE
+        if queries and query_vecs is None and mode != "bm25":
+            query_vecs = await self.aembed(queries)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _search_executor,
+            bind(self.search_batch, queries, top_k=top_k, mode=mode, query_vecs=query_vecs),
+        )
+
+    def _lexical_search(self, query: str, top_k: int) -> List[Dict]:
+        with self._lock:
+            ranked = self.text_index.search(query, top_k)
+            points = self.backend.retrieve([pid for pid, _ in ranked])
+        scores = dict(ranked)
+        return [self._to_hit(p._replace(score=scores[p.id])) for p in points]
+
+    def _hybrid_merge(self, query: str, vector_results: List[ScoredPoint], top_k: int, n_candidates: int) -> List[Dict]:
+        """A vektoros és a BM25 rangsor fúziója RRF-fel; a hit "score" mezője a fúziós pontszám."""
+        with self._lock:
+            lexical = self.text_index.search(query, n_candidates)
+        fused = rrf_fuse([[r.id for r in vector_results], [pid for pid, _ in lexical]], k=RRF_K, top_k=top_k)
+
+        known = {r.id: r for r in vector_results}
+        missing = [pid for pid, _ in fused if pid not in known]
+        if missing:
+            with self._lock:
+                known.update((p.id, p) for p in self.backend.retrieve(missing))
+
+        vector_scores = {r.id: r.score for r in vector_results}
+        bm25_scores = dict(lexical)
+        hits = []
+        for pid, score in fused:
+            if pid not in known:
+                continue
+            hit = self._to_hit(known[pid]._replace(score=score))
+            hit["vector_score"] = vector_scores.get(pid)
+            hit["bm25_score"] = bm25_scores.get(pid)
+            hits.append(hit)
+        return hits
+
+    @staticmethod
+    def _to_hit(r: ScoredPoint) -> Dict:
+        return {
+            # az "id" a dokumentumon belüli chunk sorszám (az eval fájlok erre hivatkoznak)
+            "id": r.payload.get("chunk_index", r.id),
+            "point_id": r.id,
+            "text": r.payload["text"],
+            "score": r.score,
+            "source_file": r.payload.get("source_file"),
+            "doc_id": r.payload.get("doc_id"),
+            "page_start": r.payload.get("page_start"),
+            "page_end": r.payload.get("page_end"),
+        }
+
+
+class DocumentSync:
+    """
+    Egy dokumentum inkrementális újraindexelése. A pontazonosító a dokumentum
+    és a chunk tartalmának hash-éből képződik, így a változatlan chunkokat nem
+    kell újra embeddelni, a dokumentumból eltűnteket pedig a finish() törli.
+    A chunkok batchenként adagolhatók (diff -> embedding -> upsert).
+    """
+
+    def __init__(self, store: VectorStore, source_file: Optional[str], file_hash: Optional[str] = None):
+        self.store = store
+        self.source_file = source_file
+        self.file_hash = file_hash
+        self.doc_id = document_id(source_file)
+
+        previous = store.documents.get(self.doc_id, {})
+        self.previous_points: Dict[str, int] = dict(previous.get("points", {}))
+        # a fájl bájtra azonos a legutóbb indexelttel, nincs teendő
+        self.unchanged = file_hash is not None and previous.get("file_hash") == file_hash
+
+        self.points: Dict[str, int] = {}
+        self._added: List[str] = []
+        # az elmozdult, de változatlan chunkok eredeti payload mezői (az abort() visszaállítja őket)
+        self._moved: Dict[str, Dict] = {}
+        self._occurrences: Counter = Counter()
+        self.stats = {"added": 0, "unchanged": 0, "deleted": 0}
+
+    def diff(self, chunks: List[Dict]) -> List[Dict]:
+        """Azonosítót ad a chunkoknak, és visszaadja azokat, amelyeket embeddelni kell."""
+        new_chunks: List[Dict] = []
+        for c in chunks:
+            chash = content_hash(c["text"])
+            pid = point_id(self.doc_id, chash, self._occurrences[chash])
+            self._occurrences[chash] += 1
+
+            c["doc_id"] = self.doc_id
+            c["point_id"] = pid
+            self.points[pid] = c["id"]
+
+            if pid not in self.previous_points:
+                new_chunks.append(c)
+                continue
+
+            self.stats["unchanged"] += 1
+            # a tartalom azonos, de elmozdult a dokumentumon belül
+            if self.previous_points[pid] != c["id"]:
+                if pid not in self._moved:
+                    with self.store._lock:
+                        for old in self.store.backend.retrieve([pid]):
+                            self._moved[pid] = {k: old.payload.get(k) for k in ("chunk_index", "page_start", "page_end")}
+                self.store.update_payload(pid, {
+                    "chunk_index": c["id"],
+                    "page_start": c.get("page_start"),
+                    "page_end": c.get("page_end"),
+                })
+        return new_chunks
+
+    def upsert(self, chunks: List[Dict], vectors: List[List[float]]):
+        self.store.upsert_vectors(chunks, vectors)
+        self.stats["added"] += len(chunks)
+        self._added.extend(c["point_id"] for c in chunks)
+
+    def finish(self) -> Dict[str, int]:
+        stale = [pid for pid in self.previous_points if pid not in self.points]
+        self.store.delete_points(stale)
+        self.stats["deleted"] = len(stale)
+
+        with self.store._lock:
+            self.store.documents[self.doc_id] = {
+                "source_file": self.source_file,
+                "file_hash": self.file_hash,
+                "points": self.points,
+            }
+            self.store.version += 1
+        # innentől a pontok a manifest részei, az abort() már nem törölheti (állíthatja vissza) őket
+        added, self._added = self._added, []
+        self._moved = {}
+        self.store.save_manifest()
+
+        if added or stale:
+            self.store.notify_changed(self.doc_id, added + stale)
+        return dict(self.stats)
+
+    def abort(self) -> None:
+        """
+        Megszakított indexelés: az eddig upsertelt új pontok törlése és az
+        elmozdult chunkok payloadjának visszaállítása. A manifest nem változik,
+        így a dokumentum korábbi (teljes) változata marad érvényben; a törlés
+        nélkül az új pontok árvák lennének, de a keresésben megjelennének.
+        """
+        if not self._added and not self._moved:
+            return
+        for pid, payload in self._moved.items():
+            self.store.update_payload(pid, payload)
+        self.store.delete_points(self._added)
+        self.store.save_manifest()
+        if self._added:
+            self.store.notify_changed(self.doc_id, self._added)
+        self._added, self._moved = [], {}
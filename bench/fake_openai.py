@@ -0,0 +1,327 @@
+"""
+Helyi, az OpenAI API-t utánzó szerver terheléses méréshez (API költség és
+hálózat nélkül). Az /v1/embeddings és a /v1/chat/completions végpontot
+szolgálja ki, állítható késleltetéssel és token sebességgel:
+
+    python -m bench.fake_openai --port 8900 --latency-ms 80 --ttft-ms 300 --tokens-per-sec 60
+
+A backendet az OPENAI_BASE_URL=http://127.0.0.1:8900/v1 (és egy tetszőleges
+OPENAI_API_KEY) környezeti változóval lehet rá irányítani.
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# a válaszok szókincse (a tartalom nem számít, csak a hossz és a determinizmus)
+ANSWER_WORDS = (
+    "a dokumentum szerint az indián oktatás története több szakaszra bontható és "
+    "a szövetségi politika célja hosszú ideig az asszimiláció volt amit később "
+    "a polgárjogi mozgalmak és az önrendelkezés elve váltott fel"
+).split()
+
+_RERANK_ID = re.compile(r"^\s*ID: (\d+)\s*$", re.MULTILINE)
+_WORD = re.compile(r"\w+")
+
+
+@dataclass
+class FakeOpenAIConfig:
+    # minden kérés alapkésleltetése (a hálózat + a szerver oldali sor)
+    latency_ms: float = 50.0
+    # egyenletes véletlen szórás a késleltetésen (+/-)
+    jitter_ms: float = 0.0
+    # embedding kéréseknél bemenetenkénti többletidő
+    embed_ms_per_input: float = 0.5
+    # generálásnál az első tokenig eltelt idő (a latency_ms-en felül)
+    ttft_ms: float = 250.0
+    # a generált tokenek sebessége (0 = azonnal)
+    tokens_per_sec: float = 50.0
+    # a generált válasz hossza tokenben (szóban)
+    answer_tokens: int = 40
+    # ha a kérés nem ad meg dimensions-t
+    embed_dim: int = 1536
+    seed: int = 0
+
+
+@lru_cache(maxsize=65536)
+def _word_vector(word: str, dim: int, seed: int) -> np.ndarray:
+    digest = hashlib.sha256(f"{seed}:{word}".encode("utf-8")).digest()
+    rng = np.random.default_rng(int.from_bytes(digest[:8], "little"))
+    return rng.standard_normal(dim).astype(np.float32)
+
+
+def fake_embedding(text: str, dim: int, seed: int = 0) -> np.ndarray:
+    """
+    Determinisztikus, egységnyi hosszú vektor: a szavak hash-ből képzett
+    vektorainak összege, így a közös szavú szövegek vektorai hasonlók, és a
+    keresés értelmes találatokat ad.
+    """
+    words = _WORD.findall(text.lower()) or [""]
+    vec = np.zeros(dim, dtype=np.float32)
+    for word in words:
+        vec += _word_vector(word, dim, seed)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
+
+
+def _stable_unit(*parts: Any) -> float:
+    digest = hashlib.sha256("\0".join(map(str, parts)).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little") / 2 ** 64
+
+
+def fake_answer(prompt: str, tokens: int, seed: int = 0) -> List[str]:
+    """A válasz szövegdarabjai (tokenenként egy szó), a prompttól determinisztikusan függve."""
+    offset = int(_stable_unit(seed, prompt) * len(ANSWER_WORDS))
+    return [ANSWER_WORDS[(offset + i) % len(ANSWER_WORDS)] + " " for i in range(tokens)]
+
+
+def fake_rerank(prompt: str, seed: int = 0) -> Optional[str]:
+    """A rerank promptra (ID: n sorok + JSON kérés) determinisztikus pontszámlista."""
+    ids = _RERANK_ID.findall(prompt)
+    if not ids or "JSON" not in prompt:
+        return None
+    scores = [{"id": int(i), "score": round(_stable_unit(seed, prompt, i), 3)} for i in ids]
+    return json.dumps(scores)
+
+
+class FakeOpenAIServer:
+    """A szerver háttérszálon; a stats() a kiszolgált kérések számát adja."""
+
+    def __init__(self, config: Optional[FakeOpenAIConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeOpenAIConfig()
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {"embeddings": 0, "embedding_inputs": 0, "chat": 0, "chat_stream": 0}
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counts[key] += amount
+
+    def sleep(self, extra_ms: float = 0.0) -> None:
+        cfg = self.config
+        jitter = random.uniform(-cfg.jitter_ms, cfg.jitter_ms) if cfg.jitter_ms else 0.0
+        delay = max(0.0, cfg.latency_ms + jitter + extra_ms) / 1000.0
+        if delay:
+            time.sleep(delay)
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"config": asdict(self.config), **self.counts}
+
+
+def _make_handler(server: FakeOpenAIServer):
+    class Handler(BaseHTTPRequestHandler):
+        # keep-alive kapcsolatok, ahogy a valódi API-nál (a kliens poolja újrahasznosítja őket)
+        protocol_version = "HTTP/1.1"
+        # TCP_NODELAY: a fejléc és a törzs külön írás, Nagle + késleltetett ACK mellett
+        # minden keep-alive válasz ~40 ms-ot várna, ami elrontaná a mért késleltetéseket
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.rstrip("/") in ("/health", "/v1/health"):
+                self._send_json(200, server.stats())
+            else:
+                self._send_json(404, {"error": {"message": f"Ismeretlen végpont: {self.path}"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send_json(400, {"error": {"message": "Hibás JSON."}})
+                return
+            path = self.path.split("?", 1)[0].rstrip("/")
+            try:
+                if path.endswith("/embeddings"):
+                    self._embeddings(body)
+                elif path.endswith("/chat/completions"):
+                    self._chat(body)
+                else:
+                    self._send_json(404, {"error": {"message": f"Ismeretlen végpont: {self.path}"}})
+            except (BrokenPipeError, ConnectionResetError):
+                # a kliens bontotta a kapcsolatot (pl. megszakított stream)
+                self.close_connection = True
+
+        def _embeddings(self, body: Dict[str, Any]) -> None:
+            cfg = server.config
+            inputs = body.get("input") or []
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            dim = int(body.get("dimensions") or cfg.embed_dim)
+            server.count("embeddings")
+            server.count("embedding_inputs", len(inputs))
+            server.sleep(cfg.embed_ms_per_input * len(inputs))
+
+            as_base64 = body.get("encoding_format") == "base64"
+            data = []
+            for i, text in enumerate(inputs):
+                vec = fake_embedding(str(text), dim, cfg.seed)
+                embedding = base64.b64encode(vec.astype("<f4").tobytes()).decode("ascii") if as_base64 else vec.tolist()
+                data.append({"object": "embedding", "index": i, "embedding": embedding})
+            tokens = sum(len(str(t)) // 4 + 1 for t in inputs)
+            self._send_json(200, {
+                "object": "list",
+                "data": data,
+                "model": body.get("model", "text-embedding-3-small"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+
+        def _chat(self, body: Dict[str, Any]) -> None:
+            cfg = server.config
+            messages = body.get("messages") or []
+            prompt = "\n".join(str(m.get("content", "")) for m in messages)
+            model = body.get("model", "gpt-4.1-mini")
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+            prompt_tokens = len(prompt) // 4 + 1
+
+            rerank = fake_rerank(prompt, cfg.seed)
+            pieces = [rerank] if rerank is not None else fake_answer(prompt, cfg.answer_tokens, cfg.seed)
+
+            if not body.get("stream"):
+                server.count("chat")
+                # nem streamelt válasznál a teljes generálási idő a válasz előtt telik el
+                generation_ms = cfg.ttft_ms
+                if cfg.tokens_per_sec and rerank is None:
+                    generation_ms += 1000.0 * max(0, len(pieces) - 1) / cfg.tokens_per_sec
+                server.sleep(generation_ms)
+                self._send_json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(pieces).strip()},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": len(pieces),
+                        "total_tokens": prompt_tokens + len(pieces),
+                    },
+                })
+                return
+
+            server.count("chat_stream")
+            server.sleep(cfg.ttft_ms)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+                return {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+
+            self._send_event(chunk({"role": "assistant", "content": ""}))
+            for i, piece in enumerate(pieces):
+                if i and cfg.tokens_per_sec:
+                    time.sleep(1.0 / cfg.tokens_per_sec)
+                self._send_event(chunk({"content": piece}))
+            self._send_event(chunk({}, "stop"))
+            self._send_chunk(b"data: [DONE]\n\n")
+            self._send_chunk(b"")
+
+        def _send_event(self, payload: Dict[str, Any]) -> None:
+            self._send_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        def _send_chunk(self, data: bytes) -> None:
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = FakeOpenAIConfig()
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms, help="alapkésleltetés kérésenként")
+    parser.add_argument("--jitter-ms", type=float, default=defaults.jitter_ms, help="véletlen szórás a késleltetésen")
+    parser.add_argument("--embed-ms-per-input", type=float, default=defaults.embed_ms_per_input)
+    parser.add_argument("--ttft-ms", type=float, default=defaults.ttft_ms, help="idő az első generált tokenig")
+    parser.add_argument("--tokens-per-sec", type=float, default=defaults.tokens_per_sec)
+    parser.add_argument("--answer-tokens", type=int, default=defaults.answer_tokens)
+    parser.add_argument("--embed-dim", type=int, default=defaults.embed_dim)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeOpenAIConfig:
+    return FakeOpenAIConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        embed_ms_per_input=args.embed_ms_per_input,
+        ttft_ms=args.ttft_ms,
+        tokens_per_sec=args.tokens_per_sec,
+        answer_tokens=args.answer_tokens,
+        embed_dim=args.embed_dim,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Helyi, az OpenAI API-t utánzó szerver terheléses méréshez.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(config_from_args(args), host=args.host, port=args.port)
+    print(f"Fake OpenAI szerver: {server.base_url} (OPENAI_BASE_URL)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,489 @@
+"""
+Terheléses mérés a FastAPI backend ellen, API költség nélkül: elindít egy
+helyi fake OpenAI szervert (bench/fake_openai.py), egy uvicorn backendet,
+amelynek az OpenAI kliense erre mutat, feltölti a dokumentumokat, majd a
+/chat és /chat_stream végpontot a megadott párhuzamosságokkal terheli.
+A végén RPS, p50/p95/p99 latency és első token idő (TTFT) táblázat készül,
+az eredmény JSON-ként a bench/results könyvtárba kerül.
+
+    python -m bench.load_test --concurrency 1,8,32 --requests 200
+    python -m bench.load_test --replay logs/requests.jsonl --endpoints chat_stream
+    python -m bench.load_test --env PIPELINE_MODE=overlapped --workers 2
+    python -m bench.load_test --compare bench/results/a.json bench/results/b.json
+
+A --base-url egy már futó backendet mér (ilyenkor az a saját OpenAI
+beállításait használja, ami valódi API hívás is lehet).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import gzip
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from bench.fake_openai import FakeOpenAIServer, add_config_arguments, config_from_args
+
+ROOT = Path(__file__).resolve().parents[1]
+RESULTS_DIR = ROOT / "bench" / "results"
+DEFAULT_DOCS = [ROOT / "data" / "raw" / "test.txt"]
+DEFAULT_QUESTIONS_PATH = ROOT / "data" / "eval" / "app.json"
+ENDPOINTS = ("chat", "chat_stream")
+# a mért szakaszban ennyinél több hibás kérés (arány) esetén a futás hibával zárul
+MAX_ERROR_RATE = 0.01
+
+
+# --- kérdések ---
+
+def _read_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def load_replay(path: Path, include_rotated: bool = True) -> List[Tuple[Optional[str], str]]:
+    """(endpoint, kérdés) párok a request logból, időrendben (a rotált fájlokkal együtt)."""
+    from app.monitoring import rotated_log_files
+
+    files = (rotated_log_files(path) if include_rotated else []) + ([path] if path.exists() else [])
+    items = []
+    for file in files:
+        for record in _read_jsonl(file):
+            endpoint = str(record.get("endpoint", "")).lstrip("/")
+            question = record.get("question")
+            if question and endpoint in ENDPOINTS:
+                items.append((endpoint, question))
+    return items
+
+
+def load_eval_questions(path: Path = DEFAULT_QUESTIONS_PATH) -> List[Tuple[Optional[str], str]]:
+    scenarios = json.loads(path.read_text(encoding="utf-8"))
+    return [(None, q["q"]) for scenario in scenarios for q in scenario["questions"]]
+
+
+# --- a mért rendszer indítása ---
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(base_url: str, process: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"A backend leállt indulás közben (kód: {process.returncode}).")
+        try:
+            if httpx.get(f"{base_url}/stats", timeout=2.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"A backend nem indult el {timeout:.0f} s alatt.")
+
+
+def backend_env(args: argparse.Namespace, openai_base_url: str, workdir: Path) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT), env.get("PYTHONPATH")])),
+        "OPENAI_BASE_URL": openai_base_url,
+        "OPENAI_API_KEY": "bench",
+        # memóriabeli vektortár; a relatív utak (logs/, data/) a munkakönyvtárba kerülnek
+        "VECTOR_DB_PATH": "",
+        "EMBED_DIMENSIONS": str(args.embed_dim),
+    })
+    if not args.caches:
+        # ismételt kérdéseknél a cache-ek a pipeline helyett a cache-t mérnék
+        env.update({"ANSWER_CACHE_ENABLED": "0", "RERANK_CACHE_ENABLED": "0", "EMBED_CACHE_ENABLED": "0"})
+    if args.workers > 1:
+        env["SHARED_INDEX_DIR"] = str(workdir / "shared_index")
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+@contextlib.contextmanager
+def local_stack(args: argparse.Namespace) -> Iterator[Tuple[str, Optional[FakeOpenAIServer]]]:
+    """Fake OpenAI szerver + uvicorn backend egy ideiglenes munkakönyvtárban; a base URL-t adja."""
+    fake = FakeOpenAIServer(config_from_args(args)).start()
+    port = _free_port()
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as tmp:
+        workdir = Path(tmp)
+        log = (workdir / "uvicorn.log").open("wb")
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=workdir, env=backend_env(args, fake.base_url, workdir), stdout=log, stderr=subprocess.STDOUT,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            _wait_ready(base_url, process)
+            yield base_url, fake
+        except Exception:
+            log.flush()
+            sys.stderr.write((workdir / "uvicorn.log").read_text(encoding="utf-8", errors="replace")[-4000:])
+            raise
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            log.close()
+            fake.stop()
+
+
+# --- mérés ---
+
+def summarize(samples: List[Dict[str, Any]], duration: float) -> Dict[str, Any]:
+    ok = [s for s in samples if s["ok"]]
+    latencies = np.array([s["latency"] for s in ok], dtype=np.float64)
+    ttfts = np.array([s["ttft"] for s in ok if s["ttft"] is not None], dtype=np.float64)
+
+    def pct(values: np.ndarray) -> Dict[str, Optional[float]]:
+        if not len(values):
+            return {"p50": None, "p95": None, "p99": None, "mean": None}
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "mean": float(values.mean())}
+
+    errors: Dict[str, int] = {}
+    for s in samples:
+        if not s["ok"]:
+            errors[s["error"]] = errors.get(s["error"], 0) + 1
+    return {
+        "requests": len(samples),
+        "ok": len(ok),
+        "errors": errors,
+        "duration_sec": duration,
+        "rps": len(ok) / duration if duration > 0 else 0.0,
+        "latency_sec": pct(latencies),
+        "ttft_sec": pct(ttfts),
+    }
+
+
+async def _one_request(client: httpx.AsyncClient, endpoint: str, question: str) -> Dict[str, Any]:
+    payload = {"question": question}
+    start = time.perf_counter()
+    try:
+        if endpoint == "chat_stream":
+            ttft = None
+            async with client.stream("POST", "/chat_stream", json=payload) as resp:
+                if resp.status_code != 200:
+                    await resp.aread()
+                    return {"ok": False, "error": f"HTTP {resp.status_code}", "latency": time.perf_counter() - start}
+                async for piece in resp.aiter_text():
+                    if piece and ttft is None:
+                        ttft = time.perf_counter() - start
+            return {"ok": True, "latency": time.perf_counter() - start, "ttft": ttft}
+
+        resp = await client.post("/chat", json=payload)
+        latency = time.perf_counter() - start
+        if resp.status_code != 200:
+            return {"ok": False, "error": f"HTTP {resp.status_code}", "latency": latency}
+        # a /chat egyben válaszol: a TTFT a szerver által mért első generált token ideje
+        return {"ok": True, "latency": latency, "ttft": resp.json()["monitoring"].get("first_token_latency_sec")}
+    except httpx.HTTPError as e:
+        return {"ok": False, "error": type(e).__name__, "latency": time.perf_counter() - start}
+
+
+async def run_level(
+        base_url: str,
+        items: List[Tuple[Optional[str], str]],
+        endpoint: Optional[str],
+        concurrency: int,
+        n_requests: int,
+        warmup: int,
+        timeout: float,
+) -> Dict[str, Any]:
+    """
+    Zárt hurkú terhelés: concurrency darab kliens küldi egymás után a kérdéseket
+    (az items sorrendjében, körbe), amíg n_requests kérés el nem fogy.
+    endpoint=None esetén a replay-ből jövő endpoint érvényes.
+    """
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        for i in range(warmup):
+            item_endpoint, question = items[i % len(items)]
+            await _one_request(client, endpoint or item_endpoint or "chat", question)
+
+        samples: List[Dict[str, Any]] = []
+        next_index = 0
+
+        async def worker():
+            nonlocal next_index
+            while next_index < n_requests:
+                i = next_index
+                next_index += 1
+                item_endpoint, question = items[(warmup + i) % len(items)]
+                sample = await _one_request(client, endpoint or item_endpoint or "chat", question)
+                samples.append(sample)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        duration = time.perf_counter() - start
+    return summarize(samples, duration)
+
+
+async def upload_documents(base_url: str, docs: List[Path], copies: int, concurrency: int,
+                           timeout: float) -> Dict[str, Any]:
+    """
+    A dokumentumok feltöltése (copies példányban, eltérő tartalommal, hogy ne
+    legyenek kihagyva) és az indexelés megvárása. Az elfogadás és a kereshetővé
+    válás idejét méri.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    accept_latencies: List[float] = []
+    indexed_latencies: List[float] = []
+    chunks = 0
+    failures = 0
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+        async def upload(doc: Path, copy: int) -> None:
+            nonlocal chunks, failures
+            data = doc.read_bytes()
+            name = doc.name
+            if copies > 1 and doc.suffix.lower() == ".txt":
+                data = f"[bench példány {copy}]\n".encode("utf-8") + data
+                name = f"{doc.stem}-bench{copy}{doc.suffix}"
+            async with semaphore:
+                start = time.perf_counter()
+                resp = await client.post("/upload", files={"file": (name, data)})
+                accept_latencies.append(time.perf_counter() - start)
+                if resp.status_code != 202:
+                    failures += 1
+                    return
+                job_id = resp.json()["job_id"]
+                while True:
+                    job = (await client.get(f"/jobs/{job_id}")).json()
+                    if job.get("status") in ("done", "failed"):
+                        break
+                    await asyncio.sleep(0.05)
+                indexed_latencies.append(time.perf_counter() - start)
+                if job["status"] == "failed":
+                    failures += 1
+                else:
+                    chunks += job.get("chunks_processed", 0)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(upload(doc, c) for doc in docs for c in range(copies)))
+        duration = time.perf_counter() - start
+
+    def pct(values: List[float]) -> Dict[str, Optional[float]]:
+        if not values:
+            return {"p50": None, "p95": None, "p99": None}
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+    return {
+        "documents": len(docs) * copies,
+        "failures": failures,
+        "duration_sec": duration,
+        "chunks": chunks,
+        "chunks_per_sec": chunks / duration if duration > 0 else 0.0,
+        "accept_latency_sec": pct(accept_latencies),
+        "indexed_latency_sec": pct(indexed_latencies),
+    }
+
+
+# --- riport ---
+
+def _ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}"
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    upload = result.get("upload")
+    if upload:
+        print(
+            f"\n/upload: {upload['documents']} dokumentum, {upload['chunks']} chunk, "
+            f"{upload['duration_sec']:.2f} s ({upload['chunks_per_sec']:.0f} chunk/s), "
+            f"indexelve p50/p95: {_ms(upload['indexed_latency_sec']['p50'])}/"
+            f"{_ms(upload['indexed_latency_sec']['p95'])} ms, hibák: {upload['failures']}"
+        )
+    header = f"\n{'endpoint':<12} {'conc':>5} {'kérés':>6} {'hiba':>5} {'RPS':>8} " \
+             f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'TTFT50':>8} {'TTFT95':>8} {'TTFT99':>8}"
+    print(header)
+    print("-" * (len(header) - 1))
+    for run in result["runs"]:
+        lat, ttft = run["latency_sec"], run["ttft_sec"]
+        print(
+            f"{run['endpoint']:<12} {run['concurrency']:>5} {run['requests']:>6} "
+            f"{run['requests'] - run['ok']:>5} {run['rps']:>8.1f} "
+            f"{_ms(lat['p50']):>8} {_ms(lat['p95']):>8} {_ms(lat['p99']):>8} "
+            f"{_ms(ttft['p50']):>8} {_ms(ttft['p95']):>8} {_ms(ttft['p99']):>8}"
+        )
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def save_result(result: Dict[str, Any], output: Optional[Path]) -> Path:
+    if output is None:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        output = RESULTS_DIR / f"loadtest-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    return output
+
+
+def compare(old_path: Path, new_path: Path) -> None:
+    """Két mentett futás összevetése (endpoint, párhuzamosság) szerint, százalékos eltéréssel."""
+    old = json.loads(old_path.read_text(encoding="utf-8"))
+    new = json.loads(new_path.read_text(encoding="utf-8"))
+    old_runs = {(r["endpoint"], r["concurrency"]): r for r in old["runs"]}
+
+    def delta(a: Optional[float], b: Optional[float]) -> str:
+        if a is None or b is None or a == 0:
+            return "-"
+        return f"{(b - a) / a * 100:+.1f}%"
+
+    print(f"{old_path.name} ({old.get('git_revision')}) -> {new_path.name} ({new.get('git_revision')})")
+    print(f"{'endpoint':<12} {'conc':>5} {'RPS':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'TTFT95':>9}")
+    for run in new["runs"]:
+        prev = old_runs.get((run["endpoint"], run["concurrency"]))
+        if prev is None:
+            continue
+        print(
+            f"{run['endpoint']:<12} {run['concurrency']:>5} "
+            f"{delta(prev['rps'], run['rps']):>9} "
+            f"{delta(prev['latency_sec']['p50'], run['latency_sec']['p50']):>9} "
+            f"{delta(prev['latency_sec']['p95'], run['latency_sec']['p95']):>9} "
+            f"{delta(prev['latency_sec']['p99'], run['latency_sec']['p99']):>9} "
+            f"{delta(prev['ttft_sec']['p95'], run['ttft_sec']['p95']):>9}"
+        )
+
+
+# --- belépési pont ---
+
+async def run_benchmark(args: argparse.Namespace, base_url: str) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"upload": None, "runs": []}
+    if args.docs:
+        result["upload"] = await upload_documents(
+            base_url, args.docs, args.doc_copies, args.upload_concurrency, args.timeout,
+        )
+
+    if args.replay is not None:
+        items = load_replay(args.replay)
+        if not items:
+            raise SystemExit(f"Nincs visszajátszható /chat vagy /chat_stream kérés: {args.replay}")
+    else:
+        items = load_eval_questions()
+
+    # replay esetén --endpoints nélkül az eredeti endpoint-keverék fut
+    endpoints: List[Optional[str]] = list(args.endpoints) if args.endpoints else (
+        [None] if args.replay is not None else list(ENDPOINTS)
+    )
+    for endpoint in endpoints:
+        for concurrency in args.concurrency:
+            summary = await run_level(
+                base_url, items, endpoint, concurrency, args.requests, args.warmup, args.timeout,
+            )
+            result["runs"].append({"endpoint": endpoint or "replay", "concurrency": concurrency, **summary})
+    return result
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _endpoint_list(value: str) -> List[str]:
+    endpoints = [v.strip().lstrip("/") for v in value.split(",") if v.strip()]
+    unknown = [e for e in endpoints if e not in ENDPOINTS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Ismeretlen endpoint: {', '.join(unknown)}")
+    return endpoints
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Terheléses mérés fake OpenAI szerverrel.")
+    parser.add_argument("--base-url", help="már futó backend (ilyenkor nem indul fake szerver és uvicorn)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workerek száma")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4, 16], help="pl. 1,4,16")
+    parser.add_argument("--requests", type=int, default=100, help="kérések száma szintenként")
+    parser.add_argument("--warmup", type=int, default=5, help="nem mért bemelegítő kérések szintenként")
+    parser.add_argument("--endpoints", type=_endpoint_list, default=None, help="chat,chat_stream")
+    parser.add_argument("--replay", type=Path, nargs="?", const=ROOT / "logs" / "requests.jsonl", default=None,
+                        help="a kérdések a request logból (alapértelmezés: logs/requests.jsonl)")
+    parser.add_argument("--docs", type=Path, nargs="*", default=DEFAULT_DOCS, help="feltöltendő dokumentumok")
+    parser.add_argument("--doc-copies", type=int, default=1, help="minden dokumentum ennyi példányban")
+    parser.add_argument("--upload-concurrency", type=int, default=4)
+    parser.add_argument("--caches", action="store_true", help="a válasz-, rerank- és embedding cache bekapcsolva")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="további backend beállítás (pl. PIPELINE_MODE=overlapped)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", type=Path, default=None, help="az eredmény JSON útvonala")
+    parser.add_argument("--compare", type=Path, nargs=2, metavar=("RÉGI", "ÚJ"), help="két mentett futás összevetése")
+    add_config_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    started_at = time.time()
+    if args.base_url:
+        result = asyncio.run(run_benchmark(args, args.base_url.rstrip("/")))
+        fake_stats = None
+    else:
+        with local_stack(args) as (base_url, fake):
+            result = asyncio.run(run_benchmark(args, base_url))
+            fake_stats = fake.stats()
+
+    result = {
+        "started_at": started_at,
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "base_url": args.base_url,
+            "workers": args.workers,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "replay": str(args.replay) if args.replay else None,
+            "docs": [str(d) for d in args.docs],
+            "doc_copies": args.doc_copies,
+            "caches": args.caches,
+            "env": args.env,
+        },
+        "fake_openai": fake_stats,
+        **result,
+    }
+    print_report(result)
+    path = save_result(result, args.output)
+    print(f"\nEredmény mentve: {path}")
+
+    failed = sum(r["requests"] - r["ok"] for r in result["runs"])
+    total = sum(r["requests"] for r in result["runs"])
+    return 1 if total and failed / total > MAX_ERROR_RATE else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
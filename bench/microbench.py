@@ -0,0 +1,526 @@
+"""
+A CPU oldali forró útvonalak mikrobenchmarkjai, teljesen offline (az
+embeddingek előre generált vektorok, OpenAI hívás nincs): szöveg betöltése,
+chunkolás, VectorStore.add_documents / search, prompt összeállítás, a rerank
+prompt és a request log írása. Szintetikus korpuszon, több méretben:
+
+    small:  1 MB szöveg,   10 000 chunk
+    medium: 50 MB szöveg,  100 000 chunk
+    large:  500 MB szöveg, 1 000 000 chunk  (sok memória kell hozzá)
+
+Műveletenként idő (a --repeat futás minimuma és mediánja) és a művelet
+alatti csúcs memória (tracemalloc, külön futásban, hogy ne torzítsa az időt).
+
+    python -m bench.microbench                         # small, összevetés a baseline-nal
+    python -m bench.microbench --sizes small,medium --save-baseline
+    python -m bench.microbench --only search,prompt --threshold 0.1
+
+Ha a baseline-hoz képest egy művelet ideje vagy memóriája a küszöbnél
+(alapból 20%) jobban nőtt, a kilépési kód 1.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from functools import cached_property
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# az app moduljai importáláskor OpenAI klienst hoznak létre; hívás nem történik, de kulcs kell hozzá
+os.environ.setdefault("OPENAI_API_KEY", "offline-microbench")
+
+from app import monitoring  # noqa: E402
+from app.ingestion import load_text_from_file, simple_word_chunk  # noqa: E402
+from app.monitoring import RequestLogWriter, log_request  # noqa: E402
+from app.prompting import _encoding  # noqa: E402
+from app.rag import _rerank_prompt, build_prompt  # noqa: E402
+from app.vectordb import VectorStore  # noqa: E402
+
+ROOT = Path(__file__).resolve().parents[1]
+RESULTS_DIR = ROOT / "bench" / "results"
+DEFAULT_BASELINE = ROOT / "bench" / "baselines" / "microbench.json"
+# a generált korpuszfájlok itt maradnak a következő futásokra
+CORPUS_DIR = Path(tempfile.gettempdir()) / "rag-microbench"
+# ennél rövidebb műveletek idejét nem vetjük össze (a zaj nagyobb lenne a különbségnél)
+MIN_COMPARABLE_SEC = 0.005
+# a csúcs memóriánál ennyi abszolút eltérés alatt nincs regresszió
+MIN_COMPARABLE_MEM_MIB = 1.0
+
+CHUNK_WORDS = 40
+CHUNKS_PER_DOCUMENT = 1000
+QUESTION_WORDS = 8
+
+SYLLABLES = (
+    "a ab ad al an ár as at ba be bi bo de dé do e egy el em en ér es ez fa fe fo gy ha he hi "
+    "ho i ik il in ír is ja je ka ke ki ko kö la le li lo ma me mi mo na ne ni no ny o ok ol "
+    "on or os ö ő pa pe po ra re ri ro sa se si so sz ta te ti to tt u ul un ur va ve vi zs"
+).split()
+
+
+@dataclass(frozen=True)
+class SizeSpec:
+    text_mb: int
+    chunks: int
+    queries: int
+    prompts: int
+    log_records: int
+
+
+SIZES: Dict[str, SizeSpec] = {
+    "small": SizeSpec(text_mb=1, chunks=10_000, queries=200, prompts=200, log_records=10_000),
+    "medium": SizeSpec(text_mb=50, chunks=100_000, queries=200, prompts=500, log_records=50_000),
+    "large": SizeSpec(text_mb=500, chunks=1_000_000, queries=200, prompts=1000, log_records=200_000),
+}
+
+
+# --- szintetikus adatok ---
+
+def _vocabulary(rng: np.random.Generator, size: int = 20_000) -> np.ndarray:
+    lengths = rng.integers(1, 5, size=size)
+    words = {"".join(rng.choice(SYLLABLES, n)) for n in lengths}
+    return np.array(sorted(words))
+
+
+def _zipf_words(rng: np.random.Generator, vocab: np.ndarray, n: int) -> List[str]:
+    # a természetes szövegekhez hasonló, Zipf-eloszlású szógyakoriság
+    idx = np.minimum(rng.zipf(1.2, size=n) - 1, len(vocab) - 1)
+    return vocab[idx].tolist()
+
+
+def write_corpus(path: Path, text_mb: int, seed: int = 0, block_words: int = 100_000) -> Path:
+    """Mondatokra és bekezdésekre tagolt szintetikus szöveg, legalább text_mb MB."""
+    rng = np.random.default_rng(seed)
+    vocab = _vocabulary(rng)
+    target = text_mb * 1024 * 1024
+    tmp_path = path.with_name(path.name + ".tmp")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    with tmp_path.open("w", encoding="utf-8") as f:
+        while written < target:
+            words = _zipf_words(rng, vocab, block_words)
+            for i in range(14, len(words), 15):
+                words[i] += "."
+            lines = [" ".join(words[i:i + 120]) for i in range(0, len(words), 120)]
+            block = "\n".join(lines) + "\n"
+            f.write(block)
+            written += len(block.encode("utf-8"))
+    os.replace(tmp_path, path)
+    return path
+
+
+class Corpus:
+    """Egy mérethez tartozó bemenetek, lustán és csak egyszer előállítva (a mérésen kívül)."""
+
+    def __init__(self, size: str, spec: SizeSpec, dim: int, backend: str, seed: int = 0):
+        self.size = size
+        self.spec = spec
+        self.dim = dim
+        self.backend = backend
+        self.seed = seed
+
+    def rng(self, stream: int) -> np.random.Generator:
+        # bemenetenként külön generátor: a tartalom nem függ attól, melyik benchmark fut előbb
+        return np.random.default_rng([self.seed, stream])
+
+    @cached_property
+    def vocab(self) -> np.ndarray:
+        return _vocabulary(np.random.default_rng(self.seed))
+
+    @cached_property
+    def text_path(self) -> Path:
+        path = CORPUS_DIR / f"corpus-{self.spec.text_mb}mb-{self.seed}.txt"
+        if not path.exists():
+            print(f"  korpusz generálása: {path} ...", flush=True)
+            write_corpus(path, self.spec.text_mb, self.seed)
+        return path
+
+    @cached_property
+    def text(self) -> str:
+        return load_text_from_file(self.text_path)
+
+    @cached_property
+    def long_chunks(self) -> List[Dict]:
+        # a prompt és a rerank bemenete: valódi méretű (500 szavas) chunkok a korpusz elejéből
+        with self.text_path.open("r", encoding="utf-8") as f:
+            head = f.read(2 * 1024 * 1024)
+        return [
+            {**c, "source_file": "korpusz.txt", "point_id": f"p{c['id']}", "score": 1.0 / (1 + c["id"])}
+            for c in simple_word_chunk(head)
+        ]
+
+    @cached_property
+    def chunks(self) -> List[Dict]:
+        words = _zipf_words(self.rng(1), self.vocab, self.spec.chunks * CHUNK_WORDS)
+        return [
+            {
+                "id": i % CHUNKS_PER_DOCUMENT,
+                "text": " ".join(words[i * CHUNK_WORDS:(i + 1) * CHUNK_WORDS]),
+                "source_file": f"doc-{i // CHUNKS_PER_DOCUMENT:05d}.txt",
+            }
+            for i in range(self.spec.chunks)
+        ]
+
+    @cached_property
+    def vectors(self) -> np.ndarray:
+        return self.rng(2).standard_normal((self.spec.chunks, self.dim), dtype=np.float32)
+
+    @cached_property
+    def queries(self) -> List[Tuple[str, np.ndarray]]:
+        rng = self.rng(3)
+        words = _zipf_words(rng, self.vocab, self.spec.queries * QUESTION_WORDS)
+        vectors = rng.standard_normal((self.spec.queries, self.dim), dtype=np.float32)
+        return [
+            (" ".join(words[i * QUESTION_WORDS:(i + 1) * QUESTION_WORDS]) + "?", vectors[i])
+            for i in range(self.spec.queries)
+        ]
+
+    def new_store(self) -> "OfflineVectorStore":
+        return OfflineVectorStore(self.vectors, dim=self.dim, backend=self.backend, quantization="none")
+
+    @cached_property
+    def search_store(self) -> "OfflineVectorStore":
+        print(f"  vektortár feltöltése ({self.spec.chunks} chunk) ...", flush=True)
+        store = self.new_store()
+        store.add_documents(self.chunks)
+        return store
+
+
+class OfflineVectorStore(VectorStore):
+    """VectorStore, amelynek embed() hívása az előre generált vektorokat adja vissza (API hívás nélkül)."""
+
+    def __init__(self, vectors: np.ndarray, **kwargs):
+        super().__init__(**kwargs)
+        self._vectors = vectors
+        self._next = 0
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        rows = np.arange(self._next, self._next + len(texts)) % len(self._vectors)
+        self._next += len(texts)
+        return self._vectors[rows]
+
+
+# --- benchmarkok ---
+
+# név -> előkészítés: Corpus -> (mérendő hívás, elemszám, egység); az előkészítés nem számít bele
+Benchmark = Callable[[Corpus], Tuple[Callable[[], Any], int, str]]
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(name: str) -> Callable[[Benchmark], Benchmark]:
+    def register(fn: Benchmark) -> Benchmark:
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+@benchmark("ingestion.load_text_from_file")
+def _load_text(corpus: Corpus):
+    path = corpus.text_path
+    return (lambda: load_text_from_file(path)), corpus.spec.text_mb, "MB"
+
+
+@benchmark("ingestion.simple_word_chunk")
+def _chunk(corpus: Corpus):
+    text = corpus.text
+    return (lambda: simple_word_chunk(text)), corpus.spec.text_mb, "MB"
+
+
+@benchmark("vectordb.add_documents")
+def _add_documents(corpus: Corpus):
+    chunks = corpus.chunks
+    _ = corpus.vectors
+
+    def run():
+        corpus.new_store().add_documents(chunks)
+
+    return run, len(chunks), "chunk"
+
+
+def _search(mode: str) -> Benchmark:
+    def setup(corpus: Corpus):
+        store = corpus.search_store
+        queries = corpus.queries
+
+        def run():
+            for question, vec in queries:
+                store.search(question, top_k=5, mode=mode, query_vec=vec)
+
+        return run, len(queries), "kérdés"
+    return setup
+
+
+for _mode in ("vector", "hybrid", "bm25"):
+    benchmark(f"vectordb.search[{_mode}]")(_search(_mode))
+
+
+def _history(words: List[str]) -> List[Dict]:
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": " ".join(words[i * 50:(i + 1) * 50])}
+        for i in range(6)
+    ]
+
+
+@benchmark("rag.build_prompt")
+def _build_prompt(corpus: Corpus):
+    chunks = corpus.long_chunks
+    rng = corpus.rng(4)
+    inputs = []
+    for i in range(corpus.spec.prompts):
+        picked = rng.choice(len(chunks), size=min(5, len(chunks)), replace=False)
+        words = _zipf_words(rng, corpus.vocab, 300 + QUESTION_WORDS)
+        question = " ".join(words[:QUESTION_WORDS]) + f" ({i})?"
+        inputs.append((question, [chunks[j] for j in picked], _history(words[QUESTION_WORDS:])))
+
+    def run():
+        for question, contexts, history in inputs:
+            build_prompt(question, contexts, history)
+
+    return run, len(inputs), "prompt"
+
+
+@benchmark("rag.rerank_prompt")
+def _rerank_prompt_bench(corpus: Corpus):
+    chunks = corpus.long_chunks
+    rng = corpus.rng(5)
+    inputs = []
+    for i in range(corpus.spec.prompts):
+        picked = rng.choice(len(chunks), size=min(20, len(chunks)), replace=False)
+        question = " ".join(_zipf_words(rng, corpus.vocab, QUESTION_WORDS)) + "?"
+        inputs.append((question, [chunks[j] for j in picked]))
+
+    def run():
+        for question, candidates in inputs:
+            _rerank_prompt(question, candidates)
+
+    return run, len(inputs), "prompt"
+
+
+def _log_request(use_thread: bool) -> Benchmark:
+    def setup(corpus: Corpus):
+        contexts = corpus.long_chunks[:3]
+        spans = [{"name": n, "start_sec": 0.0, "duration_sec": 0.01} for n in ("query_embed", "search", "rerank")]
+        questions = [q for q, _ in corpus.queries]
+        n_records = corpus.spec.log_records
+
+        def run():
+            with tempfile.TemporaryDirectory(prefix="rag-microbench-log-") as tmp:
+                writer = RequestLogWriter(path=Path(tmp) / "requests.jsonl", use_thread=use_thread)
+                # a log_request a modul szintű írót használja, a mérés idejére ezt cseréljük
+                with monitoring._writer_lock:
+                    previous, monitoring._writer = monitoring._writer, writer
+                try:
+                    for i in range(n_records):
+                        log_request(
+                            endpoint="/chat", session_id=f"s{i % 100}", question=questions[i % len(questions)],
+                            answer="válasz " * 40, context=contexts, input_tokens_est=1200,
+                            output_tokens_est=80, total_latency_sec=0.8, first_token_latency_sec=0.3,
+                            extra={"reranker": "llm", "spans": spans},
+                        )
+                    # a háttérszál kiírása is a méréshez tartozik
+                    writer.close()
+                finally:
+                    with monitoring._writer_lock:
+                        monitoring._writer = previous
+
+        return run, n_records, "rekord"
+    return setup
+
+
+benchmark("monitoring.log_request[sync]")(_log_request(use_thread=False))
+benchmark("monitoring.log_request[async]")(_log_request(use_thread=True))
+
+
+# --- futtatás ---
+
+def measure(run: Callable[[], Any], repeat: int, memory: bool) -> Dict[str, Any]:
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    peak_mib = None
+    if memory:
+        # külön futás: a tracemalloc a Python allokációkat jelentősen lassítja
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        peak_mib = peak / (1024 * 1024)
+
+    return {
+        "repeat": repeat,
+        "time_sec": {"min": min(times), "median": statistics.median(times), "max": max(times)},
+        "peak_mem_mib": peak_mib,
+    }
+
+
+def run_suite(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    results: Dict[str, Dict[str, Any]] = {}
+    names = [n for n in BENCHMARKS if not args.only or any(part in n for part in args.only)]
+    for size in args.sizes:
+        corpus = Corpus(size, SIZES[size], args.dim, args.backend, seed=args.seed)
+        print(f"\n[{size}] {corpus.spec}", flush=True)
+        for name in names:
+            run, items, unit = BENCHMARKS[name](corpus)
+            result = measure(run, args.repeat, memory=not args.no_memory)
+            result["items"] = items
+            result["unit"] = unit
+            result["per_item_us"] = result["time_sec"]["median"] / items * 1e6 if items else None
+            results[f"{size}/{name}"] = result
+            peak = result["peak_mem_mib"]
+            print(
+                f"  {name:<34} {result['time_sec']['median'] * 1000:>10.1f} ms "
+                f"{'' if peak is None else f'{peak:>9.1f} MiB'}",
+                flush=True,
+            )
+        del corpus
+        gc.collect()
+    return results
+
+
+def compare_to_baseline(
+        results: Dict[str, Dict[str, Any]],
+        baseline: Dict[str, Dict[str, Any]],
+        threshold: float,
+) -> List[Dict[str, Any]]:
+    """Soronként a baseline-hoz mért arány; status: ok, regression, improved vagy new."""
+    rows = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        row = {"key": key, "result": result, "time_ratio": None, "mem_ratio": None, "status": "new"}
+        if base is not None:
+            row["status"] = "ok"
+            t_new, t_old = result["time_sec"]["median"], base["time_sec"]["median"]
+            if t_old > 0 and max(t_new, t_old) >= MIN_COMPARABLE_SEC:
+                row["time_ratio"] = t_new / t_old
+            m_new, m_old = result.get("peak_mem_mib"), base.get("peak_mem_mib")
+            if m_new is not None and m_old and abs(m_new - m_old) >= MIN_COMPARABLE_MEM_MIB:
+                row["mem_ratio"] = m_new / m_old
+            ratios = [r for r in (row["time_ratio"], row["mem_ratio"]) if r is not None]
+            if any(r > 1 + threshold for r in ratios):
+                row["status"] = "regression"
+            elif ratios and all(r < 1 - threshold for r in ratios):
+                row["status"] = "improved"
+        rows.append(row)
+    return rows
+
+
+def print_report(rows: List[Dict[str, Any]], threshold: float) -> None:
+    def ratio(value: Optional[float]) -> str:
+        return "-" if value is None else f"{(value - 1) * 100:+.1f}%"
+
+    print(f"\n{'művelet':<48} {'elem':>14} {'medián ms':>11} {'µs/elem':>10} {'csúcs MiB':>10} "
+          f"{'Δ idő':>8} {'Δ mem':>8}  állapot")
+    for row in rows:
+        r = row["result"]
+        peak = "-" if r["peak_mem_mib"] is None else f"{r['peak_mem_mib']:.1f}"
+        per_item = "-" if r["per_item_us"] is None else f"{r['per_item_us']:.1f}"
+        print(
+            f"{row['key']:<48} {str(r['items']) + ' ' + r['unit']:>14} {r['time_sec']['median'] * 1000:>11.1f} {per_item:>10} "
+            f"{peak:>10} {ratio(row['time_ratio']):>8} {ratio(row['mem_ratio']):>8}  {row['status']}"
+        )
+    regressions = [row["key"] for row in rows if row["status"] == "regression"]
+    if regressions:
+        print(f"\nREGRESSZIÓ (> {threshold * 100:.0f}%): {', '.join(regressions)}")
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _metadata(args: argparse.Namespace) -> Dict[str, Any]:
+    return {
+        "created_at": time.time(),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "tokenizer": "tiktoken" if _encoding() is not None else "becslés",
+        "dim": args.dim,
+        "backend": args.backend,
+        "repeat": args.repeat,
+    }
+
+
+def _size_list(value: str) -> List[str]:
+    sizes = [v.strip() for v in value.split(",") if v.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Ismeretlen méret: {', '.join(unknown)} (lehetséges: {', '.join(SIZES)})")
+    return sizes
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline mikrobenchmarkok a CPU oldali forró útvonalakra.")
+    parser.add_argument("--sizes", type=_size_list, default=["small"], help=f"{','.join(SIZES)}")
+    parser.add_argument("--only", type=lambda v: [p for p in v.split(",") if p], default=None,
+                        help="csak a névben ezeket tartalmazó műveletek (pl. search,prompt)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="csúcs memória mérése nélkül (gyorsabb)")
+    # 1M chunknál 1536 dimenzióval a vektorok önmagukban 6 GB-ot foglalnának
+    parser.add_argument("--dim", type=int, default=256, help="a generált vektorok hossza")
+    parser.add_argument("--backend", default="numpy", choices=["numpy", "qdrant"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="az eredmény legyen az új baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="regresszió küszöb (0.2 = 20%%)")
+    parser.add_argument("--output", type=Path, default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    metadata = _metadata(args)
+    results = run_suite(args)
+
+    baseline: Dict[str, Any] = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        base_meta = baseline.get("metadata", {})
+        for key in ("platform", "processor", "python", "dim", "backend"):
+            if base_meta.get(key) != metadata[key]:
+                print(f"\nFigyelem: a baseline más környezetben készült ({key}: {base_meta.get(key)} != {metadata[key]})")
+    rows = compare_to_baseline(results, baseline.get("results", {}), args.threshold)
+    print_report(rows, args.threshold)
+
+    output = args.output or RESULTS_DIR / f"microbench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({"metadata": metadata, "results": results}, indent=2), encoding="utf-8")
+    print(f"\nEredmény mentve: {output}")
+
+    if args.save_baseline:
+        # a többi méret / művelet korábbi baseline értékei megmaradnak
+        merged = {**baseline.get("results", {}), **results}
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps({"metadata": metadata, "results": merged}, indent=2), encoding="utf-8")
+        print(f"Baseline frissítve: {args.baseline}")
+        return 0
+
+    return 1 if any(row["status"] == "regression" for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
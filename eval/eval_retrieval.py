@@ -1,89 +1,197 @@
-import json
-from pathlib import Path
-from typing import List, Dict
-
-from app.ingestion import process_document
-from app.vectordb import VectorStore
-
-
-def precision_at_k(retrieved: List[str], relevant: List[str], k: int) -> float:
-    if k == 0:
-        return 0.0
-    r = retrieved[:k]
-    if not r:
-        return 0.0
-    tp = sum(1 for x in r if x in relevant)
-    return tp / len(r)
-
-def recall_at_k(retrieved: List[str], relevant: List[str], k: int) -> float:
-    if not relevant:
-        return 0.0
-    r = retrieved[:k]
-    tp = sum(1 for x in r if x in relevant)
-    return tp / len(relevant)
-
-def mrr(retrieved: List[str], relevant: List[str]) -> float:
-    for i, rid in enumerate(retrieved):
-        if rid in relevant:
-            return 1.0 / (i + 1)
-    return 0.0
-
-def load_eval_cases(path: Path) -> List[Dict]:
-    data = json.loads(path.read_text(encoding="utf-8"))
-    return data
-
-def main():
-    doc_path = Path("data/raw/belivek_39-45.pdf") #frissíteni ha más a forrás
-    if not doc_path.exists():
-        print(f"Hiányzik a dokumentum a korpuszhoz: {doc_path}")
-        return
-    
-    print(f"Korpuszdokumentum feldolgozása: {doc_path}")
-    chunks = process_document(doc_path)
-    print(f"{len(chunks)} chunk elkészült.")
-
-    store = VectorStore()
-    store.add_documents(chunks)
-    print("Vectortár feltöltve.")
-
-    # Tesztesetek betöltése
-    eval_path = Path("data/eval/retrieval.json") 
-    if not eval_path.exists():
-        print(f"Hiányzik a tesztfájl: {eval_path}")
-        return
-    
-    cases = load_eval_cases(eval_path)
-    print(f"{len(cases)} tesztesetet találtunk.")
-
-    precisions = []
-    recalls = []
-    mrrs = []
-
-    for case in cases:
-        query = case["query"]
-        relevant_ids = case["relevant_ids"]
-
-        results = store.search(query, top_k=10)
-        retrieved_ids = [r["id"] for r in results]
-
-        p5 = precision_at_k(retrieved_ids, relevant_ids, k=5)
-        r5 = recall_at_k(retrieved_ids, relevant_ids, k=5)
-        rr = mrr(retrieved_ids, relevant_ids)
-
-        precisions.append(p5)
-        recalls.append(r5)
-        mrrs.append(rr)
-
-        print(f"Case {case['id']}: P@5={p5:.3f}, R@5={r5:.3f}, MRR={rr:.3f}")
-
-    avg_p = sum(precisions) / len(precisions) if precisions else 0.0
-    avg_r = sum(recalls) / len(recalls) if recalls else 0.0
-    avg_mrr = sum(mrrs) / len(mrrs) if mrrs else 0.0
-
-    print("\n=== Összefoglaló ===")
-    print(f"Átlag precision@5: {avg_p:.3f}")
-    print(f"Átlag recalls@5: {avg_r:.3f}")
-    print(f"Átlag MRR: {avg_mrr:.3f}")
-
-if __name__ == "__main__":
+import json
+import time
+from pathlib import Path
+from typing import List, Dict
+
+from app.ingestion import process_document
+from app.rag import RERANKERS, get_reranker
+from app.vectordb import SEARCH_MODES, VectorStore
+
+
+def precision_at_k(retrieved: List[str], relevant: List[str], k: int) -> float:
+    if k == 0:
+        return 0.0
+    r = retrieved[:k]
+    if not r:
+        return 0.0
+    tp = sum(1 for x in r if x in relevant)
+    return tp / len(r)
+
+def recall_at_k(retrieved: List[str], relevant: List[str], k: int) -> float:
+    if not relevant:
+        return 0.0
+    r = retrieved[:k]
+    tp = sum(1 for x in r if x in relevant)
+    return tp / len(relevant)
+
+def mrr(retrieved: List[str], relevant: List[str]) -> float:
+    for i, rid in enumerate(retrieved):
+        if rid in relevant:
+            return 1.0 / (i + 1)
+    return 0.0
+
+def load_eval_cases(path: Path) -> List[Dict]:
+    data = json.loads(path.read_text(encoding="utf-8"))
+    return data
+
+# tárolási módok: kvantálás és csökkentett embedding dimenzió; az első a referencia
+STORAGE_MODES = [
+    {"name": "float32-1536", "dim": 1536, "quantization": "none"},
+    {"name": "int8-1536", "dim": 1536, "quantization": "int8"},
+    {"name": "binary-1536", "dim": 1536, "quantization": "binary"},
+    {"name": "float32-512", "dim": 512, "quantization": "none"},
+    {"name": "int8-512", "dim": 512, "quantization": "int8"},
+]
+
+def compare_storage_modes(chunks: List[Dict], cases: List[Dict], k: int = 10):
+    """
+    Minden tárolási módnál méri a memóriaigényt és a top-k átfedést
+    a teljes pontosságú (float32-1536) kereséshez képest.
+    """
+    queries = [case["query"] for case in cases]
+    baseline_ids = None
+    baseline_mem = None
+
+    print("\n=== Tárolási módok (kvantálás / dimenzió) ===")
+    for mode in STORAGE_MODES:
+        store = VectorStore(dim=mode["dim"], backend="numpy", quantization=mode["quantization"])
+        store.add_documents([dict(c) for c in chunks])
+        all_results = store.search_batch(queries, top_k=k)
+
+        point_ids = [[r["point_id"] for r in results] for results in all_results]
+        mem = store.memory_usage()["in_memory_bytes"]
+        if baseline_ids is None:
+            baseline_ids, baseline_mem = point_ids, mem
+
+        overlap = [
+            len(set(ids) & set(base)) / len(base) if base else 1.0
+            for ids, base in zip(point_ids, baseline_ids)
+        ]
+        mrrs = [
+            mrr([r["id"] for r in results], case["relevant_ids"])
+            for results, case in zip(all_results, cases)
+        ]
+        recall_loss = 1.0 - sum(overlap) / len(overlap) if overlap else 0.0
+        mem_saved = 1.0 - mem / baseline_mem if baseline_mem else 0.0
+
+        print(
+            f"{mode['name']}: memória={mem / 1024:.1f} KiB (megtakarítás {mem_saved:.1%}), "
+            f"recall veszteség@{k}={recall_loss:.3f}, MRR={sum(mrrs) / len(mrrs):.3f}"
+        )
+
+def compare_search_modes(store: VectorStore, cases: List[Dict], k: int = 5):
+    """Tisztán vektoros, tisztán BM25 és hibrid (RRF) keresés összevetése."""
+    queries = [case["query"] for case in cases]
+
+    print(f"\n=== Keresési módok (top-{k}) ===")
+    for mode in SEARCH_MODES:
+        start = time.perf_counter()
+        all_results = store.search_batch(queries, top_k=k, mode=mode)
+        elapsed = time.perf_counter() - start
+
+        recalls = [
+            recall_at_k([r["id"] for r in results], case["relevant_ids"], k=k)
+            for results, case in zip(all_results, cases)
+        ]
+        mrrs = [
+            mrr([r["id"] for r in results], case["relevant_ids"])
+            for results, case in zip(all_results, cases)
+        ]
+        n = len(cases) or 1
+        print(
+            f"{mode}: R@{k}={sum(recalls) / n:.3f}, MRR={sum(mrrs) / n:.3f}, "
+            f"idő={1000 * elapsed / n:.1f} ms/kérdés"
+        )
+
+def compare_rerankers(store: VectorStore, cases: List[Dict], k: int = 10, top_m: int = 3):
+    """
+    Ugyanazokon a vektoros jelölteken (top-k) futtatja az összes rerankert,
+    és összeveti a minőséget (P@top_m, MRR) és a késleltetést.
+    """
+    all_candidates = store.search_batch([case["query"] for case in cases], top_k=k)
+
+    print(f"\n=== Rerankerek (top-{k} jelöltből {top_m}) ===")
+    for name in RERANKERS:
+        reranker = get_reranker(name)
+        if name == "llm":
+            # a késleltetést valódi API hívással mérjük, nem a rerank cache-ből
+            reranker.use_cache = False
+
+        precisions, mrrs, latencies = [], [], []
+        for case, candidates in zip(cases, all_candidates):
+            start = time.perf_counter()
+            ranked = reranker.rerank(case["query"], candidates, top_m=top_m)
+            latencies.append(time.perf_counter() - start)
+
+            ranked_ids = [r["id"] for r in ranked]
+            precisions.append(precision_at_k(ranked_ids, case["relevant_ids"], k=top_m))
+            mrrs.append(mrr(ranked_ids, case["relevant_ids"]))
+
+        n = len(latencies) or 1
+        latencies.sort()
+        print(
+            f"{name}: P@{top_m}={sum(precisions) / n:.3f}, MRR={sum(mrrs) / n:.3f}, "
+            f"átlag latency={1000 * sum(latencies) / n:.1f} ms, "
+            f"max={1000 * (latencies[-1] if latencies else 0.0):.1f} ms"
+        )
+
+def main():
+    doc_path = Path("data/raw/belivek_39-45.pdf") #frissíteni ha más a forrás
+    if not doc_path.exists():
+        print(f"Hiányzik a dokumentum a korpuszhoz: {doc_path}")
+        return
+    
+    print(f"Korpuszdokumentum feldolgozása: {doc_path}")
+    chunks = process_document(doc_path)
+    print(f"{len(chunks)} chunk elkészült.")
+
+    store = VectorStore()
+    store.add_documents(chunks)
+    print("Vectortár feltöltve.")
+
+    # Tesztesetek betöltése
+    eval_path = Path("data/eval/retrieval.json") 
+    if not eval_path.exists():
+        print(f"Hiányzik a tesztfájl: {eval_path}")
+        return
+    
+    cases = load_eval_cases(eval_path)
+    print(f"{len(cases)} tesztesetet találtunk.")
+
+    precisions = []
+    recalls = []
+    mrrs = []
+
+    # minden kérdés egyetlen embedding hívással és kötegelt kereséssel
+    all_results = store.search_batch([case["query"] for case in cases], top_k=10)
+
+    for case, results in zip(cases, all_results):
+        relevant_ids = case["relevant_ids"]
+
+        retrieved_ids = [r["id"] for r in results]
+
+        p5 = precision_at_k(retrieved_ids, relevant_ids, k=5)
+        r5 = recall_at_k(retrieved_ids, relevant_ids, k=5)
+        rr = mrr(retrieved_ids, relevant_ids)
+
+        precisions.append(p5)
+        recalls.append(r5)
+        mrrs.append(rr)
+
+        print(f"Case {case['id']}: P@5={p5:.3f}, R@5={r5:.3f}, MRR={rr:.3f}")
+
+    avg_p = sum(precisions) / len(precisions) if precisions else 0.0
+    avg_r = sum(recalls) / len(recalls) if recalls else 0.0
+    avg_mrr = sum(mrrs) / len(mrrs) if mrrs else 0.0
+
+    print("\n=== Összefoglaló ===")
+    print(f"Átlag precision@5: {avg_p:.3f}")
+    print(f"Átlag recalls@5: {avg_r:.3f}")
+    print(f"Átlag MRR: {avg_mrr:.3f}")
+
+    compare_search_modes(store, cases)
+    compare_rerankers(store, cases)
+    compare_storage_modes(chunks, cases)
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,78 +1,128 @@
-from pathlib import Path
-import json
-from typing import List, Dict, Any
-
-import streamlit as st
-
-LOG_PATH = Path("logs/requests.jsonl")
-
-st.set_page_config(page_title="RAG Monitoring", layout="wide")
-st.title("RAG Monitoring Dashboard")
-
-st.write("Ez az oldal a FastAPI backend által generált 'logs/requests.json1' fájlt olvassa.")
-
-if not LOG_PATH.exists():
-    st.warning(f"Még nem létezik a log file: {LOG_PATH}")
-    st.stop()
-
-records: List[Dict[str, Any]] = []
-with LOG_PATH.open("r", encoding="utf-8") as f:
-    for line in f:
-        line = line.strip()
-        if not line:
-            continue
-        try:
-            rec = json.loads(line)
-            records.append(rec)
-        except json.JSONDecodeError:
-            continue
-
-if not records:
-    st.warning("Nincsenek logolt kérések.")
-    st.stop()
-
-total_requests = len(records)
-avg_latency = sum(r.get("total_latency_sec", 0.0) for r in records) / total_requests
-
-latencies = [r.get("first_token_latency_sec") for r in records if r.get("first_token_latency_sec") is not None]
-if latencies:
-    avg_first_token = sum(latencies) / len(latencies)
-else:
-    avg_first_token = 0.0
-
-total_cost = sum(r.get("cost_estimate", 0.0) for r in records)
-
-col1, col2, col3, col4 = st.columns(4)
-with col1:
-    st.metric("Összes kérés", total_requests)
-with col2:
-    st.metric("Átlag latency (s)", f"{avg_latency:.3f}")
-with col3:
-    st.metric(
-        "Átlag first-token latency (s)", 
-        '-' if not latencies else f"{avg_first_token:.3f}",
-    )
-with col4:
-    st.metric("Becsült összköltség ($)", f"{total_cost:.4f}")
-
-st.markdown("---")
-
-st.subheader("Utolsó 50 kérés")
-records_sorted = sorted(records, key=lambda r: r.get("ts", 0), reverse=True)[:50]
-
-table_rows = []
-for r in records_sorted:
-    table_rows.append(
-        {
-            "időbélyeg": r.get("ts"),
-            "endpoint": r.get("endpoint"),
-            "session": r.get("session_id"),
-            "latency (s)": round(r.get("total_latency_sec", 0.0), 3),
-            "input_tokens": r.get("input_tokens_est"),
-            "output_tokens": r.get("output_tokens_est"),
-            "cost ($)": round(r.get("cost_estimate", 0.0), 6),
-            "kérés": r.get("question")[:60] + "..." if r.get("question") else "",
-        }
-    )
-
-st.dataframe(table_rows)
\ No newline at end of file
+from pathlib import Path
+from datetime import datetime
+import sys
+import time
+
+import streamlit as st
+
+# a streamlit a ui/ könyvtárat teszi az útvonalra, az app csomag a projekt gyökerében van
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.log_store import LogStore, LOG_STORE_PATH
+from app.monitoring import LOG_PATH
+
+TIME_RANGES = {
+    "Utolsó 15 perc": 15 * 60,
+    "Utolsó 1 óra": 3600,
+    "Utolsó 24 óra": 24 * 3600,
+    "Utolsó 7 nap": 7 * 24 * 3600,
+    "Teljes időszak": None,
+}
+
+st.set_page_config(page_title="RAG Monitoring", layout="wide")
+st.title("RAG Monitoring Dashboard")
+
+st.write(
+    f"Ez az oldal a FastAPI backend által generált '{LOG_PATH}' fájlt olvassa: az új sorok "
+    f"minden frissítéskor a '{LOG_STORE_PATH}' adatbázisba töltődnek, a percenkénti összesítésekkel együtt."
+)
+
+
+@st.cache_resource
+def get_log_store() -> LogStore:
+    return LogStore()
+
+
+log_store = get_log_store()
+new_records = log_store.ingest()
+
+with st.sidebar:
+    st.header("Szűrők")
+    range_label = st.selectbox("Időszak", list(TIME_RANGES), index=2)
+    endpoints = st.multiselect("Endpoint", log_store.endpoints())
+    session_id = st.text_input("Session azonosító").strip() or None
+    st.caption(f"Most betöltött új rekordok: {new_records}")
+
+window = TIME_RANGES[range_label]
+since = time.time() - window if window is not None else None
+filters = {"since": since, "endpoints": endpoints or None, "session_id": session_id}
+
+summary = log_store.summary(**filters)
+if not summary["count"]:
+    st.warning("Nincsenek logolt kérések a kiválasztott szűrőkkel.")
+    st.stop()
+
+
+def _fmt(value, digits: int = 3) -> str:
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+col1, col2, col3, col4 = st.columns(4)
+with col1:
+    st.metric("Összes kérés", summary["count"])
+with col2:
+    st.metric("Átlag latency (s)", _fmt(summary["latency_avg"]))
+with col3:
+    st.metric("p95 latency (s)", _fmt(summary["latency_p95"]))
+with col4:
+    st.metric("Becsült összköltség ($)", _fmt(summary["cost"], 4))
+
+col1, col2, col3, col4 = st.columns(4)
+with col1:
+    st.metric("p50 latency (s)", _fmt(summary["latency_p50"]))
+with col2:
+    st.metric("p99 latency (s)", _fmt(summary["latency_p99"]))
+with col3:
+    st.metric("p50 first-token latency (s)", _fmt(summary["ttft_p50"]))
+with col4:
+    st.metric("p95 first-token latency (s)", _fmt(summary["ttft_p95"]))
+
+st.markdown("---")
+
+st.subheader("Percenkénti összesítés")
+series = log_store.timeseries(**filters)
+by_minute: dict = {}
+for row in series:
+    point = by_minute.setdefault(datetime.fromtimestamp(row["ts"]), {})
+    point[f"{row['endpoint']} kérés"] = row["count"]
+    point[f"{row['endpoint']} p95 (s)"] = row["latency_p95"]
+    point[f"{row['endpoint']} TTFT p95 (s)"] = row["ttft_p95"]
+    point[f"{row['endpoint']} költség ($)"] = row["cost"]
+
+minutes = sorted(by_minute)
+columns = sorted({key for point in by_minute.values() for key in point})
+
+
+def _chart(suffix: str):
+    selected = [c for c in columns if c.endswith(suffix)]
+    return {c: [by_minute[m].get(c) for m in minutes] for c in selected}
+
+
+tab_count, tab_latency, tab_ttft, tab_cost = st.tabs(["Kérések", "p95 latency", "p95 TTFT", "Költség"])
+with tab_count:
+    st.line_chart(_chart(" kérés"))
+with tab_latency:
+    st.line_chart(_chart(" p95 (s)"))
+with tab_ttft:
+    st.line_chart(_chart(" TTFT p95 (s)"))
+with tab_cost:
+    st.line_chart(_chart(" költség ($)"))
+
+st.subheader("Utolsó 50 kérés")
+table_rows = []
+for r in log_store.recent(limit=50, **filters):
+    table_rows.append(
+        {
+            "időbélyeg": datetime.fromtimestamp(r["ts"]).strftime("%Y-%m-%d %H:%M:%S"),
+            "endpoint": r["endpoint"],
+            "session": r["session_id"],
+            "latency (s)": round(r["total_latency"] or 0.0, 3),
+            "first token (s)": round(r["first_token_latency"], 3) if r["first_token_latency"] is not None else None,
+            "input_tokens": r["input_tokens"],
+            "output_tokens": r["output_tokens"],
+            "cost ($)": round(r["cost"] or 0.0, 6),
+            "kérés": r["question"][:60] + "..." if r["question"] else "",
+        }
+    )
+
+st.dataframe(table_rows)